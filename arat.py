@@ -14,6 +14,12 @@ import difflib
 import requests
 import datetime
 import functools
+from request_template import compile_templates
+from partial_json import response_json
+from media_types import load_media_types
+from latency import load_latency
+from request_filter import load_duplicate_filter
+from producer_cache import load_producer_cache
 from collections import defaultdict
 
 
@@ -181,93 +187,45 @@ def generate_parameter_values(operations):
     return generated_values
 
 def execute_operations(base_url, selected_operation, selected_parameters):
-    method, path = selected_operation['method'], selected_operation['path']
-    query_params, body_params = {}, {}
+    method = selected_operation['method']
     media_types = selected_operation.get('consumes', [
         'application/json', 'application/x-www-form-urlencoded'
     ])
 
-    def send_request(content_type):
-        headers = {"Content-Type": content_type}
+    template = templates[selected_operation['operation_id']]
 
+    def send_request(content_type):
         try:
-            if content_type == 'application/x-www-form-urlencoded':
-                try:
-                    if method == 'get':
-                        return requests.get(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'post':
-                        return requests.post(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'put':
-                        return requests.put(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'delete':
-                        return requests.delete(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'patch':
-                        return requests.patch(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'head':
-                        return requests.head(url, headers=headers, params=query_params)
-                except Exception:
-                    if method == 'get':
-                        return requests.get(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'post':
-                        return requests.post(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'put':
-                        return requests.put(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'delete':
-                        return requests.delete(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'patch':
-                        return requests.patch(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'head':
-                        return requests.head(url, headers=headers, params=query_params)
-            else:
-                if method == 'get':
-                    return requests.get(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'post':
-                    return requests.post(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'put':
-                    return requests.put(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'delete':
-                    return requests.delete(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'patch':
-                    return requests.patch(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'head':
-                    return requests.head(url, headers=headers, params=query_params)
+            return latency.call(selected_operation['operation_id'], template.send, method, url, query_params,
+                                content_type, body_params)
         except requests.exceptions.RequestException as e:
             print(f"Request error: {e}")
             return None
 
-    for param_value_dict in selected_parameters:
-        for param_name, param_value in param_value_dict.items():
-            param = next((p for p in selected_operation['parameters'] if p['name'] == param_name), None)
-            if param is None: continue
-            if "schema" in param:
-                param_location, param_type = param['in'], param["schema"].get('type')
-            else:
-                param_location, param_type = param['in'], param.get('type')
-            if param_location == 'path':
-                path = path.replace(f'{{{param_name}}}', str(param_value))
-            elif param_location == 'query':
-                query_params[param_name] = param_value
-            elif isinstance(param_value, list):
-                body_params = param_value
-            elif isinstance(param_value, dict):
-                for tt in param_value:
-                    body_params[tt] = param_value[tt]
-            else:
-                if isinstance(body_params, dict):
-                    body_params[param_name] = param_value if param_type != 'array' else (param_value if isinstance(param_value, list) else [param_value])
-    url = base_url + path
-    if selected_operation['operation_id'] in cached_media_type:
-        response = send_request(cached_media_type[selected_operation['operation_id']])
-    else:
-        for media_type in media_types:
-            response = send_request(media_type)
-            if response and 200 <= response.status_code < 300:
-                cached_media_type[selected_operation['operation_id']] = media_type
-                break
+    path_values, query_params, body_params = template.fill(selected_parameters)
+    url = template.url(base_url, path_values)
+    response = None
+    # Content types are tried in the order the model ranks them; known failures are skipped
+    for media_type in cached_media_type.candidates(selected_operation['operation_id'], media_types):
+        response = send_request(media_type)
+        cached_media_type.observe(selected_operation['operation_id'], media_type, response)
+        if response is not None and 200 <= response.status_code < 300:
+            break
 
     return response
 
 
+def request_fingerprint(request):
+    selected_operation, selected_parameters = request
+    return templates[selected_operation['operation_id']].fingerprint(selected_operation['method'],
+                                                                     selected_parameters)
+
+
+def request_varies(request):
+    # An operation without parameters always makes the same request, so resampling it is pointless
+    return bool(templates[request[0]['operation_id']].params)
+
+
 def get_mutated_value(param_type):
     # Get a list of all possible types
     all_types = ['string', 'integer', 'number', 'boolean', 'object', 'array']
@@ -385,6 +343,9 @@ def initialize_q_learning(operations, parameters_frequency):
 
 def update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response):
     operation_id = selected_operation['operation_id']
+    if response is not None and response.status_code == 429:
+        # Throttling says nothing about the request; http_pool has already waited and retried
+        return
     if response is None:
         reward = -10
         q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
@@ -445,7 +406,8 @@ def adapt_testing_strategy(iteration, max_iterations_without_improvement):
 def select_operations_and_parameters(operations, parameter_values, q_table):
     method_priority = {'post': 5}
 
-    sorted_operations = sorted(operations, key=lambda op: (
+    # Operations whose requests keep timing out sit out until their circuit closes
+    sorted_operations = sorted(latency.available(operations), key=lambda op: (
         (sum(q_table[op['operation_id']].values()) / len(q_table[op['operation_id']])) if len(
             q_table[op['operation_id']]) > 0 else 0,
         method_priority.get(op['method'], 0)), reverse=True)
@@ -640,6 +602,8 @@ def main():
     openapi_spec_file = sys.argv[1]
     openapi_spec = prance.ResolvingParser(openapi_spec_file).specification
     operations, parameters_frequency = analyze_information(openapi_spec)
+    templates.update(compile_templates(operations))
+    operations_by_id = {op['operation_id']: op for op in operations}
     alpha, gamma, q_table = initialize_q_learning(operations, parameters_frequency)
 
     start_time = time.time()
@@ -651,30 +615,40 @@ def main():
         elapsed_time = time.time() - start_time
         if elapsed_time >= time_limit:
             break
+        latency.flush()
         parameter_values = generate_parameter_values(operations)
         selected_operation, selected_parameters = select_operations_and_parameters(operations, parameter_values,
                                                                                    q_table)
-
-        # Run all producer operations if the selected_operation is a consumer operation
-        if selected_operation['operation_id'] in consumer:
-            for pname in consumer[selected_operation['operation_id']]:
-                if pname in producer:
-                    for producer_operation_id in producer[pname]:
-                        producer_operation = next(op for op in operations if op['operation_id'] == producer_operation_id)
-                        producer_parameters = generate_parameter_values([producer_operation])[
-                            producer_operation_id]
-
-                        response = execute_operations(base_url, producer_operation, producer_parameters)
-                        if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
-                            try:
-                                extract_response_values(response.json(), producer_operation)
-                            except Exception:
-                                pass
+        # A byte-identical request teaches nothing new; draw fresh parameters for one that was already sent
+        selected_operation, selected_parameters = duplicates.fresh(
+            (selected_operation, selected_parameters), request_fingerprint,
+            lambda request: select_operations_and_parameters([request[0]], generate_parameter_values([request[0]]),
+                                                             q_table), request_varies)
+
+        # Run the producer operations of the selected_operation's inputs whose earlier output is stale or used up
+        wanted = {}
+        for pname in consumer.get(selected_operation['operation_id'], []):
+            for producer_operation_id in producer.get(pname, []):
+                wanted.setdefault(producer_operation_id, []).append(pname)
+        for producer_operation_id, names in wanted.items():
+            if producers.take(producer_operation_id, names):
+                continue
+            producer_operation = operations_by_id[producer_operation_id]
+            producer_parameters = generate_parameter_values([producer_operation])[producer_operation_id]
+
+            response = execute_operations(base_url, producer_operation, producer_parameters)
+            if response is not None and 200 <= response.status_code < 300:
+                producers.store(producer_operation_id, names)
+            if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
+                try:
+                    extract_response_values(response_json(response), producer_operation)
+                except Exception:
+                    pass
 
         response = execute_operations(base_url, selected_operation, selected_parameters)
         if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
             try:
-                extract_response_values(response.json(), selected_operation)
+                extract_response_values(response_json(response), selected_operation)
             except Exception:
                 pass
         update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response)
@@ -682,11 +656,21 @@ def main():
         copied_operation = copy.deepcopy(selected_operation)
         copied_parameters = copy.deepcopy(selected_parameters)
         mutated_params, mutated_ops= perform_parameter_mutation(copied_parameters, copied_operation)
-        execute_operations(base_url, mutated_ops, mutated_params)
+        mutated_response = execute_operations(base_url, mutated_ops, mutated_params)
+        # Resources the producers made for these inputs may be gone or changed after a DELETE or PUT
+        producers.observe(selected_operation['method'], consumer.get(selected_operation['operation_id'], []),
+                          response)
+        producers.observe(mutated_ops['method'], consumer.get(selected_operation['operation_id'], []),
+                          mutated_response)
 
 
         adapt_testing_strategy(iteration, max_iterations_without_improvement)
         iteration += 1
+    print(f"[media_types] {cached_media_type.summary()}")
+    print(f"[latency] {latency.summary()}")
+    print(f"[request_filter] {duplicates.summary()}")
+    print(f"[producer_cache] {producers.summary()}")
+    latency.flush(force=True)
 
 if __name__ == "__main__":
     base_url = sys.argv[2]
@@ -696,7 +680,11 @@ if __name__ == "__main__":
     post_produced = {}
     previous_request = {}
     response_values = {}
-    cached_media_type = {}
+    cached_media_type = load_media_types()
+    latency = load_latency()
+    duplicates = load_duplicate_filter()
+    producers = load_producer_cache()
+    templates = {}
     q_table_param_values = {}
     producer = {}
     consumer = {}
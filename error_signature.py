@@ -0,0 +1,49 @@
+import re
+import json
+import hashlib
+
+
+# Volatile parts of server error messages, most specific first
+_VOLATILE = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?'), '<time>'),
+    (re.compile(r'\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b'), '<time>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<uuid>'),
+    (re.compile(r'\b(?:0x)?[0-9a-fA-F]{16,}\b'), '<hex>'),
+    (re.compile(r"'[^'\n]*'|\"[^\"\n]*\"|`[^`\n]*`"), '<str>'),
+    (re.compile(r'[-+]?\b\d+(?:\.\d+)?\b'), '<num>'),
+]
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    for pattern, placeholder in _VOLATILE:
+        text = pattern.sub(placeholder, text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def _normalize_json(value):
+    # Keys are part of the template; only the values vary between messages
+    if isinstance(value, dict):
+        return {key: _normalize_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize_json(item) for item in value]
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return '<num>'
+    return value
+
+
+def normalize_error(text):
+    """Reduce an error response body to its template."""
+    try:
+        body = json.loads(text)
+    except ValueError:
+        return normalize_text(text)
+    if isinstance(body, (dict, list)):
+        return json.dumps(_normalize_json(body), sort_keys=True)
+    return normalize_text(text)
+
+
+def error_signature(text):
+    return hashlib.sha1(normalize_error(text or '').encode('utf-8')).hexdigest()
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ReadTimeoutError
+
+import json_codec
+from rate_governor import RateGovernor
+
+
+# Drop-in for the requests.get/post/... functions that keeps one connection-pooled
+# Session per target (scheme://host:port), so requests reuse kept-alive connections
+# (through mitmproxy, too) instead of opening a new one each time.
+# HTTP_POOL_SIZE: connections kept alive per target (default 10)
+# HTTP_POOL_RETRIES: connection retries per request (default 0, as with plain requests)
+# HTTP_POOL_TARGETS: JSON object of per-target settings overriding the above, e.g.
+#   {"http://localhost:9090": {"pool_size": 20, "retries": 1, "verify": false, "headers": {...}}}
+# Requests to each target also go through a RateGovernor:
+# HTTP_RATE / HTTP_BURST: requests per second (default: none until the target answers 429) and burst (default 10)
+# HTTP_RATE_LIMITS: JSON object of {"rate": ..., "burst": ...} per API name (the API variable of a run), e.g.
+#   {"spotify": {"rate": 5, "burst": 5}}; "rate" and "burst" in HTTP_POOL_TARGETS take precedence
+# HTTP_RATE_RETRIES: times a 429 is retried, after its Retry-After or a backoff, before it is returned (default 2)
+# HTTP_RATE_MAX_WAIT: seconds one request may wait on those retries in all; a 429 asking for more is returned (10)
+# HTTP_BODY_LIMIT: bytes of a response body that are read (default 1 MiB; 0 reads everything); the rest is
+#   dropped with the connection and the response is marked truncated
+# Every response gets timings: seconds spent opening a connection (DNS, TCP and TLS; 0 when a kept-alive one
+# was reused), waiting for the headers after that (ttfb) and reading the body (download)
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+RETRIES = int(os.environ.get('HTTP_POOL_RETRIES', 0))
+RATE_RETRIES = int(os.environ.get('HTTP_RATE_RETRIES', 2))
+RATE_MAX_WAIT = float(os.environ.get('HTTP_RATE_MAX_WAIT', 10))
+BODY_LIMIT = int(os.environ.get('HTTP_BODY_LIMIT', 1 << 20))
+CHUNK_SIZE = 64 * 1024
+
+_sessions = {}
+_governors = {}
+_lock = threading.Lock()
+_timing = threading.local()
+
+
+class TimedConnect:
+    # Adds the time this thread spent opening connections to _timing.connect
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _timing.connect = getattr(_timing, 'connect', 0.0) + time.perf_counter() - started
+
+
+class TimedHTTPConnection(TimedConnect, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnect, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """An HTTPAdapter whose connections note how long connecting took."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+
+def target(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def json_setting(name):
+    try:
+        return json.loads(os.environ.get(name) or '{}')
+    except ValueError:
+        print(f"[http_pool] {name} is not valid JSON, ignoring it")
+        return {}
+
+
+def target_settings(base):
+    targets = json_setting('HTTP_POOL_TARGETS')
+    # Keys may be full base URLs (with a path) as the tools get them on the command line
+    for key, settings in targets.items():
+        if target(key) == base:
+            return settings
+    return {}
+
+
+def new_session(base):
+    settings = target_settings(base)
+    session = requests.Session()
+    adapter = TimedAdapter(pool_connections=1, pool_maxsize=settings.get('pool_size', POOL_SIZE),
+                           max_retries=settings.get('retries', RETRIES))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Module-level requests calls never carried cookies from one request to the next; keep it that way
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    if 'verify' in settings:
+        session.verify = settings['verify']
+    session.headers.update(settings.get('headers', {}))
+    return session
+
+
+def session_for(url):
+    base = target(url)
+    session = _sessions.get(base)
+    if session is None:
+        with _lock:
+            session = _sessions.get(base)
+            if session is None:
+                session = _sessions[base] = new_session(base)
+    return session
+
+
+def new_governor(base):
+    settings = dict(json_setting('HTTP_RATE_LIMITS').get(os.environ.get('API'), {}))
+    settings.update({key: value for key, value in target_settings(base).items() if key in ('rate', 'burst')})
+    rate = settings.get('rate', os.environ.get('HTTP_RATE'))
+    return RateGovernor(rate=float(rate) if rate else None,
+                        burst=int(settings.get('burst', os.environ.get('HTTP_BURST', 10))))
+
+
+def governor_for(url):
+    base = target(url)
+    governor = _governors.get(base)
+    if governor is None:
+        with _lock:
+            governor = _governors.get(base)
+            if governor is None:
+                governor = _governors[base] = new_governor(base)
+    return governor
+
+
+def read_body(response, limit):
+    try:
+        return _read_body(response, limit)
+    except requests.exceptions.ConnectionError as e:
+        # requests reports a read timeout while streaming the body as a ConnectionError; it is a timeout
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(e.args[0], request=e.request, response=response) from e
+        raise
+
+
+def _read_body(response, limit):
+    # Reads the body in chunks up to limit, so a multi-megabyte payload never sits in memory whole
+    if not limit:
+        response.content
+        response.truncated = False
+        return response
+    chunks, size = [], 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            response.close()
+            break
+    body = b''.join(chunks)
+    response.truncated = size > limit
+    response._content = body[:limit]
+    response._content_consumed = True
+    return response
+
+
+def encode_json(kwargs):
+    # What requests does for json=, with json_codec doing the encoding
+    body = kwargs.pop('json')
+    try:
+        kwargs['data'] = json_codec.dumps(body)
+    except ValueError as e:
+        raise requests.exceptions.InvalidJSONError(e)
+    headers = dict(kwargs.get('headers') or {})
+    if not any(name.lower() == 'content-type' for name in headers):
+        headers['Content-Type'] = 'application/json'
+    kwargs['headers'] = headers
+
+
+def request(method, url, **kwargs):
+    session, governor = session_for(url), governor_for(url)
+    limit = kwargs.pop('body_limit', BODY_LIMIT)
+    if kwargs.get('json') is not None and not kwargs.get('data'):
+        encode_json(kwargs)
+    first = time.monotonic()
+    for attempt in range(RATE_RETRIES + 1):
+        governor.acquire()
+        _timing.connect = 0.0
+        started = time.perf_counter()
+        response = session.request(method, url, stream=True, **kwargs)
+        headers_at = time.perf_counter()
+        read_body(response, limit)
+        connect = _timing.connect
+        response.timings = {'connect': connect, 'ttfb': max(0.0, headers_at - started - connect),
+                            'download': time.perf_counter() - headers_at}
+        # A 429 is retried once the governor lets requests through again, unless that would hold the
+        # caller past RATE_MAX_WAIT
+        wait = governor.observe(response)
+        if wait is None or attempt == RATE_RETRIES or time.monotonic() - first + wait > RATE_MAX_WAIT:
+            return response
+
+
+def report():
+    return {base: governor.summary() for base, governor in _governors.items() if governor.throttled}
+
+
+def get(url, params=None, **kwargs):
+    return request('get', url, params=params, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', False)
+    return request('head', url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('post', url, data=data, json=json, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    return request('put', url, data=data, **kwargs)
+
+
+def patch(url, data=None, **kwargs):
+    return request('patch', url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('delete', url, **kwargs)
@@ -0,0 +1,68 @@
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON on the request path goes through orjson when it is installed. Whatever orjson rejects (integers
+# past 64 bits, NaN, bodies that are not UTF-8, ...) is handed to the stdlib, and so are documents with
+# integers orjson would read as floats, so decoded values do not change.
+# Encoded bodies do: orjson writes compact JSON (no space after ',' and ':') with non-ASCII characters as
+# UTF-8 rather than \u escapes, e.g. {"name":"café"} where the stdlib and requests send {"name": "caf\u00e9"}.
+# Values holding NaN or Infinity are encoded by the stdlib, which refuses them as requests did.
+UTF8 = ('utf-8', 'utf8')
+# Maps every digit to b'0' and everything else to a space, so a run of 19 digits is a plain substring search
+_DIGITS = bytes(0x30 if 0x30 <= i <= 0x39 else 0x20 for i in range(256))
+_LONG_NUMBER = b'0' * 19
+
+
+def _fast(data):
+    return orjson is not None and _LONG_NUMBER not in (data.encode() if isinstance(data, str) else data).translate(
+        _DIGITS)
+
+
+def loads(data):
+    if _fast(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def _finite(value):
+    # orjson writes NaN and Infinity as null instead of failing
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return False
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return True
+
+
+def dumps(value):
+    """Encode value as UTF-8 JSON bytes."""
+    if orjson is not None and _finite(value):
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(value, allow_nan=False).encode('utf-8')
+
+
+def response_loads(response):
+    """response.json(), decoded straight from the body bytes when they are UTF-8."""
+    if (response.encoding or 'utf-8').lower() in UTF8 and _fast(response.content):
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            pass
+    return response.json()
@@ -0,0 +1,157 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import Counter, defaultdict, deque
+
+import requests
+
+from llm_telemetry import results_dir
+
+
+# HTTP_TIMEOUT: seconds a request may take before its operation has enough samples, and the cap after (default 30)
+# HTTP_TIMEOUT_PERCENTILE / HTTP_TIMEOUT_FACTOR: later timeouts are that latency percentile times the factor (99, 3)
+# HTTP_BREAKER_TIMEOUTS: consecutive timeouts that open an operation's circuit (default 3)
+# HTTP_BREAKER_COOLDOWN: seconds an open circuit keeps the operation out of selection; doubles each time it reopens (60)
+# The transport timings http_pool attaches to each response (connect, ttfb, download) are summarised per
+# operation in http_timings.json in the run's results directory, at most every FLUSH_INTERVAL seconds
+WINDOW = 200
+MIN_SAMPLES = 10
+MIN_TIMEOUT = 1.0
+PARTS = ('connect', 'ttfb', 'download')
+TIMING_WINDOW = 1000
+PERCENTILES = (50, 90, 99)
+TIMINGS_FILE = 'http_timings.json'
+FLUSH_INTERVAL = 30
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+class LatencyTracker:
+    """Per-operation latencies, the timeouts derived from them and a circuit breaker.
+
+    An operation's timeout is the default until it has MIN_SAMPLES
+    latencies, then the chosen percentile of its last WINDOW times a
+    factor, between MIN_TIMEOUT and the default. An operation whose requests
+    time out `trip` times in a row is left out of selection for `cooldown`
+    seconds; after that it gets one request, and the cooldown doubles each
+    time that one times out too.
+    """
+
+    def __init__(self, default=30.0, p=99.0, factor=3.0, trip=3, cooldown=60.0):
+        self.default = default
+        self.p = p
+        self.factor = factor
+        self.trip = trip
+        self.cooldown = cooldown
+        self.samples = defaultdict(lambda: deque(maxlen=WINDOW))
+        self.consecutive = Counter()
+        self.opened = Counter()
+        self.open_until = {}
+        self.timeouts = Counter()
+        self.timings = defaultdict(lambda: {part: deque(maxlen=TIMING_WINDOW) for part in PARTS})
+        self.requests = Counter()
+        self.path = os.path.join(results_dir(), TIMINGS_FILE)
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+
+    def timeout(self, operation_id):
+        with self._lock:
+            samples = list(self.samples[operation_id])
+        if len(samples) < MIN_SAMPLES:
+            return self.default
+        return min(self.default, max(MIN_TIMEOUT, percentile(samples, self.p) * self.factor))
+
+    def record(self, operation_id, seconds):
+        with self._lock:
+            self.samples[operation_id].append(seconds)
+            self.consecutive[operation_id] = 0
+            self.opened[operation_id] = 0
+            self.open_until.pop(operation_id, None)
+
+    def timed_out(self, operation_id):
+        with self._lock:
+            self.timeouts[operation_id] += 1
+            self.consecutive[operation_id] += 1
+            if self.consecutive[operation_id] < self.trip:
+                return
+            cooldown = self.cooldown * 2 ** self.opened[operation_id]
+            self.opened[operation_id] += 1
+            self.open_until[operation_id] = time.time() + cooldown
+        print(f"[latency] {operation_id} timed out {self.consecutive[operation_id]} times in a row, "
+              f"leaving it out for {cooldown:.0f}s")
+
+    def available(self, operations):
+        """Operations whose circuit is closed; all of them when every circuit is open."""
+        now = time.time()
+        closed = [op for op in operations if self.open_until.get(op['operation_id'], 0) <= now]
+        return closed or operations
+
+    def call(self, operation_id, send, *args, **kwargs):
+        """Call send(*args, timeout=..., **kwargs), recording its latency; a timeout returns None.
+
+        http_pool raises a timeout while reading the body as ReadTimeout too, so slow bodies count.
+        """
+        started = time.time()
+        try:
+            response = send(*args, timeout=self.timeout(operation_id), **kwargs)
+        except requests.exceptions.Timeout:
+            self.timed_out(operation_id)
+            return None
+        # Time spent waiting on http_pool's rate governor is not the endpoint's latency; with the body streamed,
+        # response.elapsed stops at the headers, so the whole transfer is taken from the transport timings
+        timings = getattr(response, 'timings', None)
+        elapsed = getattr(response, 'elapsed', None)
+        if timings:
+            self.record(operation_id, sum(timings[part] for part in PARTS))
+        else:
+            self.record(operation_id, elapsed.total_seconds() if elapsed is not None else time.time() - started)
+        if timings:
+            with self._lock:
+                self.requests[operation_id] += 1
+                for part in PARTS:
+                    self.timings[operation_id][part].append(timings[part])
+        return response
+
+    def report(self):
+        """Per operation: requests, timeouts and the percentiles and mean of each transport timing in ms."""
+        with self._lock:
+            timings = {op: {part: list(samples) for part, samples in parts.items()} for op, parts in self.timings.items()}
+            report = {}
+            for op in set(timings) | set(self.timeouts):
+                row = report[op] = {'requests': self.requests[op], 'timeouts': self.timeouts[op]}
+                for part, samples in timings.get(op, {}).items():
+                    if samples:
+                        row[part] = {f'p{p}': round(percentile(samples, p) * 1000, 1) for p in PERCENTILES}
+                        row[part]['mean'] = round(sum(samples) / len(samples) * 1000, 1)
+        return report
+
+    def flush(self, force=False):
+        # Called from the fuzzing loop; the file is rewritten whole, so a killed run still leaves a summary
+        if not force and time.time() - self._flushed < FLUSH_INTERVAL:
+            return
+        self._flushed = time.time()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.report(), f, indent=1, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            print(f"[latency] cannot write {self.path}: {e}")
+
+    def summary(self):
+        now = time.time()
+        return {'timeouts': sum(self.timeouts.values()),
+                'open': sorted(op for op, until in self.open_until.items() if until > now)}
+
+
+def load_latency():
+    return LatencyTracker(default=float(os.environ.get('HTTP_TIMEOUT', 30)),
+                          p=float(os.environ.get('HTTP_TIMEOUT_PERCENTILE', 99)),
+                          factor=float(os.environ.get('HTTP_TIMEOUT_FACTOR', 3)),
+                          trip=int(os.environ.get('HTTP_BREAKER_TIMEOUTS', 3)),
+                          cooldown=float(os.environ.get('HTTP_BREAKER_COOLDOWN', 60)))
@@ -2,7 +2,6 @@ import re
 import os
 import sys
 import copy
-import json
 import time
 import rstr
 import base64
@@ -11,9 +10,25 @@ import string
 import prance
 import difflib
 import requests
+import http_pool
 import datetime
 import functools
-from llama_cpp import Llama
+from llm_router import load_router
+from llm_models import models
+from llm_pack import attach_pack
+from llm_grammar import EX_PARAMS, IPD_PARAMS, parse_ex, parse_ipd, ex_accepted, ipd_accepted
+from llm_worker import FeedbackWorker
+from llm_scheduler import load_scheduler, EX, IPD
+from llm_telemetry import load_telemetry
+from request_executor import RequestExecutor
+from request_template import compile_templates, add_query
+from partial_json import response_json
+from media_types import load_media_types
+from latency import load_latency
+from request_filter import load_duplicate_filter
+from producer_cache import load_producer_cache
+from error_signature import error_signature
+from llm_prompt import response_excerpt, ex_prompt, ipd_prompt
 from collections import defaultdict
 
 
@@ -188,94 +203,45 @@ def generate_parameter_values(operations):
 
 
 def execute_operations(base_url, selected_operation, selected_parameters):
-    method, path = selected_operation['method'], selected_operation['path']
-    query_params, body_params = {}, {}
+    method = selected_operation['method']
     media_types = selected_operation.get('consumes', [
         'application/json', 'application/x-www-form-urlencoded'
     ])
 
-    def send_request(content_type):
-        headers = {"Content-Type": content_type}
+    template = templates[selected_operation['operation_id']]
 
+    def send_request(content_type):
         try:
-            if content_type == 'application/x-www-form-urlencoded':
-                try:
-                    if method == 'get':
-                        return requests.get(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'post':
-                        return requests.post(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'put':
-                        return requests.put(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'delete':
-                        return requests.delete(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'patch':
-                        return requests.patch(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'head':
-                        return requests.head(url, headers=headers, params=query_params)
-                except Exception:
-                    if method == 'get':
-                        return requests.get(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'post':
-                        return requests.post(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'put':
-                        return requests.put(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'delete':
-                        return requests.delete(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'patch':
-                        return requests.patch(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'head':
-                        return requests.head(url, headers=headers, params=query_params)
-            else:
-                if method == 'get':
-                    return requests.get(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'post':
-                    return requests.post(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'put':
-                    return requests.put(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'delete':
-                    return requests.delete(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'patch':
-                    return requests.patch(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'head':
-                    return requests.head(url, headers=headers, params=query_params)
+            return latency.call(selected_operation['operation_id'], template.send, method, url, query_params,
+                                content_type, body_params)
         except requests.exceptions.RequestException as e:
             print(f"Request error: {e}")
             return None
 
-    for param_value_dict in selected_parameters:
-        for param_name, param_value in param_value_dict.items():
-            param = next((p for p in selected_operation['parameters'] if p['name'] == param_name), None)
-            if param is None: continue
-            if "schema" in param:
-                param_location, param_type = param['in'], param["schema"].get('type')
-            else:
-                param_location, param_type = param['in'], param.get('type')
-            if param_location == 'path':
-                path = path.replace(f'{{{param_name}}}', str(param_value))
-            elif param_location == 'query':
-                query_params[param_name] = param_value
-            elif isinstance(param_value, list):
-                body_params = param_value
-            elif isinstance(param_value, dict):
-                for tt in param_value:
-                    body_params[tt] = param_value[tt]
-            else:
-                if isinstance(body_params, dict):
-                    body_params[param_name] = param_value if param_type != 'array' else (
-                        param_value if isinstance(param_value, list) else [param_value])
-    url = base_url + path
-    if selected_operation['operation_id'] in cached_media_type:
-        response = send_request(cached_media_type[selected_operation['operation_id']])
-    else:
-        for media_type in media_types:
-            response = send_request(media_type)
-            if response and 200 <= response.status_code < 300:
-                cached_media_type[selected_operation['operation_id']] = media_type
-                break
+    path_values, query_params, body_params = template.fill(selected_parameters)
+    url = template.url(base_url, path_values)
+    response = None
+    # Content types are tried in the order the model ranks them; known failures are skipped
+    for media_type in cached_media_type.candidates(selected_operation['operation_id'], media_types):
+        response = send_request(media_type)
+        cached_media_type.observe(selected_operation['operation_id'], media_type, response)
+        if response is not None and 200 <= response.status_code < 300:
+            break
 
     return response
 
 
+def request_fingerprint(request):
+    selected_operation, selected_parameters = request
+    return templates[selected_operation['operation_id']].fingerprint(selected_operation['method'],
+                                                                     selected_parameters)
+
+
+def request_varies(request):
+    # An operation without parameters always makes the same request, so resampling it is pointless
+    return bool(templates[request[0]['operation_id']].params)
+
+
 def get_mutated_value(param_type):
     # Get a list of all possible types
     all_types = ['string', 'integer', 'number', 'boolean', 'object', 'array']
@@ -396,558 +362,395 @@ def initialize_q_learning(operations, parameters_frequency):
     return alpha, gamma, q_table
 
 
-def update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response):
-    operation_id = selected_operation['operation_id']
-    method, path = selected_operation['method'], selected_operation['path']
-    if response is None:
-        reward = -10
-        q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
-    elif response.status_code == 401:
-        reward = -1
-    elif 200 <= response.status_code < 300:
-        q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] + 1
-        reward = -1
-    elif 400 <= response.status_code < 500:
-        q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
-        reward = 1
-
-        count = 0
-        params = []
-        for parameter in selected_operation['parameters']:
-            if parameter['name'] in response.text:
-                count = count + 1
-                params.append(parameter['name'])
-        if count == 1 and params not in checked_msg:
-            checked_msg.append(params)
-            for i in range(3):
-                try:
-                    ex_prompt = f"Find example values for the parameter below in a list format\nname: {params[0]}\ndescription: {response.text}"
-                    output = llama_ex(f"<s>[INST] {ex_prompt} [/INST]", max_tokens=512)
-                    out = output['choices'][0]['text']
-                    out = out[out.find('[/INST]') + 7:out.find('</s>')]
-                    out = json.loads(out.replace("'", '"'))
-                    if type(out) == list:
-                        llm_val[params[0]].extend(out)
-                        break
-                except Exception as e:
-                    pass
-        elif count == 2 and params not in checked_msg:
-            ipd_prompt = f"Find Inter-parameter Dependency for the parameter below\nname:{params[0]}\ndescription:{response.text}"
-            output = llama_ipd(f"<s>[INST] {ipd_prompt} [/INST]", max_tokens=512, echo=True)
-            out = output['choices'][0]['text']
-            ipd = out[out.find('[/INST]') + 7:out.find('</s>')]
-
-            temp = []
-            vals = []
-            for parameter in selected_operation['parameters']:
-                if parameter['name'] in ipd:
-                    temp.append(parameter['name'])
-
-                    if parameter['name'] + " ==" in ipd:
-                        val = ipd[ipd.find(parameter['name'] + " =="):]
-                        val = val[val.find('\'') + 1:]
-                        val = val[:val.find('\'')]
-                        vals.append(val)
-                    else:
-                        vals.append(None)
-
-
-            checked_msg.append(params)
-            if len(temp) == 2:
-                param1 = temp[0]
-                value1 = vals[0]
-                param2 = temp[1]
-                value2 = vals[1]
-            param1 = params[0]
-            value1 = None
-            place1 = None
-            param2 = params[1]
-            value2 = None
-            place2 = None
-            req_name = None
-            req_val = None
-            req_place = None
-            query_params, body_params = {}, {}
-            for parameter in selected_operation['parameters']:
-                if 'required' in parameter and parameter['required']:
-                    req_name = parameter['name']
-                    req_place = parameter['in']
-                    if req_name in param2value:
-                        req_val = param2value[req_name]
-                    elif 'default' in parameter:
-                        req_val = parameter['default']
-                    elif 'enum' in parameter:
-                        req_val = parameter['enum'][0]
-                    else:
-                        req_val = llm_val[req_name][0]
-
-                if param1 == parameter['name']:
-                    place1 = parameter['in']
-                    if value1 is None:
-                        if param1 in param2value:
-                            value1 = param2value[param1]
-                        elif 'default' in parameter:
-                            value1 = parameter['default']
-                        elif 'enum' in parameter:
-                            value1 = parameter['enum'][0]
-                        else:
-                            value1 = llm_val[param1][0]
+def find_example_values(params, text):
+    output = llama_ex(ex_prompt(params[0], response_excerpt(text, params)), key=params[0],
+                      accept=ex_accepted, **EX_PARAMS)
+    out = parse_ex(output)
+    if out is None:
+        return None
+    telemetry.track(output.get('call_id'), params[0], out)
 
-                elif param2 == parameter['name']:
-                    place2 = parameter['in']
-                    if value2 is None:
-                        if param2 in param2value:
-                            value2 = param2value[param2]
-                        elif 'default' in parameter:
-                            value2 = parameter['default']
-                        elif 'enum' in parameter:
-                            value2 = parameter['enum'][0]
-                        else:
-                            value2 = llm_val[param2][0]
+    def merge():
+        if llm_val.get(params[0]) is not None:
+            llm_val[params[0]].extend(out)
+    return merge
 
-            media_types = selected_operation.get('consumes', [
-                'application/json', 'application/x-www-form-urlencoded', 'multipart/form-data'
-            ])
 
-            def send_request(content_type, __url):
-                headers = {"Content-Type": content_type}
+def probe(send_request, selected_operation, media_types, url):
+    # A validation probe succeeds when one of the content types the model picks gets a 2xx;
+    # they are tried concurrently for safe methods and their outcomes feed the model
+    media_types = cached_media_type.candidates(selected_operation['operation_id'], media_types)
+    responses = executor.gather([(send_request, (media_type, url)) for media_type in media_types],
+                                methods=(selected_operation['method'],))
+    for media_type, response in zip(media_types, responses):
+        cached_media_type.observe(selected_operation['operation_id'], media_type, response)
+    return any(response is not None and 200 <= response.status_code < 300 for response in responses)
 
-                try:
-                    if content_type == 'application/x-www-form-urlencoded':
-                        try:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     data=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       data=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      data=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                        except Exception:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     json=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       json=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      json=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                    else:
-                        if method == 'get':
-                            return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'post':
-                            return requests.post(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'put':
-                            return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'delete':
-                            return requests.delete(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'patch':
-                            return requests.patch(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'head':
-                            return requests.head(__url, headers=headers, params=query_params)
-                except requests.exceptions.RequestException as e:
-                    print(f"Request error: {e}")
-                    return None
 
-            if param1 and param2:
-                url = base_url + path
-                _url = url
-                result = [0, 0, 0, 0]
-                query_params, body_params = {}, {}
-                if req_name:
-                    if req_place == 'formData':
-                        body_params[req_name] = req_val
-                        if selected_operation['operation_id'] in cached_media_type:
-                            response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                            if response and 200 <= response.status_code < 300:
-                                result[0] = 1
-                        else:
-                            for media_type in media_types:
-                                response = send_request(media_type, _url)
-                                if response and 200 <= response.status_code < 300:
-                                    result[0] = 1
-                    elif req_place == 'query':
-                        _url += '?' + req_name + '=' + str(req_val)
-                    else:
-                        print("Hey1")
-                        print(req_place)
-                        # exit(1)
-                if place1 == 'formData':
-                    body_params[param1] = value1
-                    if selected_operation['operation_id'] in cached_media_type:
-                        response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[1] = 1
-                    else:
-                        for media_type in media_types:
-                            response = send_request(media_type, _url)
-                            if response and 200 <= response.status_code < 300:
-                                result[1] = 1
-                elif place1 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param1 + '=' + str(value1)
-                    else:
-                        _url = _url + '?' + param1 + '=' + str(value1)
+def validate_pair_dependency(selected_operation, params, text):
+    method, path = selected_operation['method'], selected_operation['path']
+    output = llama_ipd(ipd_prompt(params[0], response_excerpt(text, params)), key=params[0],
+                       accept=ipd_accepted, **IPD_PARAMS)
+    ipd = parse_ipd(output) or ''
+
+    # Values the IPD names with "name == 'value'" are tried before the known ones
+    ipd_vals = {}
+    for name in params[:2]:
+        if name + " ==" in ipd:
+            val = ipd[ipd.find(name + " =="):]
+            val = val[val.find('\'') + 1:]
+            ipd_vals[name] = val[:val.find('\'')]
+
+    param1 = params[0]
+    value1 = ipd_vals.get(param1)
+    place1 = None
+    param2 = params[1]
+    value2 = ipd_vals.get(param2)
+    place2 = None
+    req_name = None
+    req_val = None
+    req_place = None
+    query_params, body_params = {}, {}
+    for parameter in selected_operation['parameters']:
+        if 'required' in parameter and parameter['required']:
+            req_name = parameter['name']
+            req_place = parameter['in']
+            if req_name in param2value:
+                req_val = param2value[req_name]
+            elif 'default' in parameter:
+                req_val = parameter['default']
+            elif 'enum' in parameter:
+                req_val = parameter['enum'][0]
+            else:
+                req_val = llm_val[req_name][0]
+
+        if param1 == parameter['name']:
+            place1 = parameter['in']
+            if value1 is None:
+                if param1 in param2value:
+                    value1 = param2value[param1]
+                elif 'default' in parameter:
+                    value1 = parameter['default']
+                elif 'enum' in parameter:
+                    value1 = parameter['enum'][0]
                 else:
-                    print("Hey2")
-                    print(place1)
-                    # exit(1)
-                if place2 == 'formData':
-                    body_params[param2] = value2
-                    if selected_operation['operation_id'] in cached_media_type:
-                        response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[3] = 1
-                    else:
-                        for media_type in media_types:
-                            response = send_request(media_type, _url)
-                            if response and 200 <= response.status_code < 300:
-                                result[3] = 1
-                    body_params = {}
-                    if req_name:
-                        if req_place == 'formData':
-                            body_params[req_name] = req_val
-                    body_params[param2] = value2
-                    if selected_operation['operation_id'] in cached_media_type:
-                        response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[2] = 1
-                    else:
-                        for media_type in media_types:
-                            response = send_request(media_type, _url)
-                            if response and 200 <= response.status_code < 300:
-                                result[2] = 1
-                elif place2 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param2 + '=' + str(value2)
-                    else:
-                        _url = _url + '?' + param2 + '=' + str(value2)
-                    if selected_operation['operation_id'] in cached_media_type:
-                        response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[3] = 1
-                    else:
-                        for media_type in media_types:
-                            response = send_request(media_type, _url)
-                            if response and 200 <= response.status_code < 300:
-                                result[3] = 1
-                    _url = url
-                    if req_name:
-                        if req_place == 'formData':
-                            body_params[req_name] = req_val
-                    if '?' in _url:
-                        _url = _url + '&' + param2 + '=' + str(value2)
-                    else:
-                        _url = _url + '?' + param2 + '=' + str(value2)
-                    if selected_operation['operation_id'] in cached_media_type:
-                        response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[2] = 1
-                    else:
-                        for media_type in media_types:
-                            response = send_request(media_type, _url)
-                            if response and 200 <= response.status_code < 300:
-                                result[2] = 1
+                    value1 = llm_val[param1][0]
+
+        elif param2 == parameter['name']:
+            place2 = parameter['in']
+            if value2 is None:
+                if param2 in param2value:
+                    value2 = param2value[param2]
+                elif 'default' in parameter:
+                    value2 = parameter['default']
+                elif 'enum' in parameter:
+                    value2 = parameter['enum'][0]
                 else:
-                    print("Hey3")
-                    print(place2)
-                    # exit(1)
+                    value2 = llm_val[param2][0]
 
-                if result == [0, 1, 0, 0]:
-                    if param1 in validated_ipd and "NOT" in validated_ipd[param1]:
-                        validated_ipd[param1]["NOT"].append(param2)
-                    else:
-                        validated_ipd[param1] = {"NOT": [param2]}
-                elif result == [0, 0, 1, 0]:
-                    if param2 in validated_ipd and "NOT" in validated_ipd[param2]:
-                        validated_ipd[param2]["NOT"].append(param1)
-                    else:
-                        validated_ipd[param2] = {"NOT": [param1]}
-                elif result == [0, 0, 0, 1]:
-                    if param1 in validated_ipd and "NEED" in validated_ipd[param1]:
-                        validated_ipd[param1]["NEED"].append(param2)
-                    else:
-                        validated_ipd[param1] = {"NEED": [param2]}
-                elif result != [0, 0, 0, 0]:
-                    print("HERE!R@!RHI!@RHI@!")
-                    print(result)
-        if count == 3 and params not in checked_msg:
-            checked_msg.append(params)
-            param1 = params[0]
-            value1 = None
-            place1 = None
-            param2 = params[1]
-            value2 = None
-            place2 = None
-            param3 = params[2]
-            value3 = None
-            place3 = None
-            req_name = None
-            req_val = None
-            req_place = None
-            query_params, body_params = {}, {}
-            for parameter in selected_operation['parameters']:
-                if 'required' in parameter and parameter['required']:
-                    req_name = parameter['name']
-                    req_place = parameter['in']
-                    if req_name in param2value:
-                        req_val = param2value[req_name]
-                    elif 'default' in parameter:
-                        req_val = parameter['default']
-                    elif 'enum' in parameter:
-                        req_val = parameter['enum'][0]
-                    else:
-                        req_val = llm_val[req_name][0]
-                if param1 == parameter['name']:
-                    place1 = parameter['in']
-                    if param1 in param2value:
-                        value1 = param2value[param1]
-                    elif 'default' in parameter:
-                        value1 = parameter['default']
-                    elif 'enum' in parameter:
-                        value1 = parameter['enum'][0]
-                    else:
-                        value1 = llm_val[param1][0]
-                elif param2 == parameter['name']:
-                    place2 = parameter['in']
-                    if param2 in param2value:
-                        value2 = param2value[param2]
-                    elif 'default' in parameter:
-                        value2 = parameter['default']
-                    elif 'enum' in parameter:
-                        value2 = parameter['enum'][0]
-                    else:
-                        value2 = llm_val[param2][0]
-                elif param3 == parameter['name']:
-                    place3 = parameter['in']
-                    if param3 in param2value:
-                        value3 = param2value[param3]
-                    elif 'default' in parameter:
-                        value3 = parameter['default']
-                    elif 'enum' in parameter:
-                        value3 = parameter['enum'][0]
-                    else:
-                        value3 = llm_val[param3][0]
-
-            media_types = selected_operation.get('consumes', [
-                'application/json', 'application/x-www-form-urlencoded', 'multipart/form-data'
-            ])
-
-            def send_request(content_type, __url):
-                headers = {"Content-Type": content_type}
-
-                try:
-                    if content_type == 'application/x-www-form-urlencoded':
-                        try:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     data=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       data=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      data=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                        except Exception:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     json=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       json=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      json=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                    else:
-                        if method == 'get':
-                            return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'post':
-                            return requests.post(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'put':
-                            return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'delete':
-                            return requests.delete(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'patch':
-                            return requests.patch(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'head':
-                            return requests.head(__url, headers=headers, params=query_params)
-                except requests.exceptions.RequestException as e:
-                    print(f"Request error: {e}")
-                    return None
+    media_types = selected_operation.get('consumes', [
+        'application/json', 'application/x-www-form-urlencoded', 'multipart/form-data'
+    ])
+    template = templates[selected_operation['operation_id']]
 
+    def send_request(content_type, __url):
+        try:
+            return latency.call(template.operation_id, template.send, method, __url, query_params,
+                                content_type, body_params)
+        except requests.exceptions.RequestException as e:
+            print(f"Request error: {e}")
+            return None
 
-            url = base_url + path
+    if param1 and param2:
+        url = base_url + path
+        _url = url
+        result = [0, 0, 0, 0]
+        query_params, body_params = {}, {}
+        if req_name:
+            if req_place == 'formData':
+                body_params[req_name] = req_val
+                if probe(send_request, selected_operation, media_types, _url):
+                    result[0] = 1
+            elif req_place == 'query':
+                _url = add_query(_url, req_name, req_val)
+            else:
+                print(req_place)
+                # exit(1)
+        if place1 == 'formData':
+            body_params[param1] = value1
+            if probe(send_request, selected_operation, media_types, _url):
+                result[1] = 1
+        elif place1 == 'query':
+            _url = add_query(_url, param1, value1)
+        else:
+            print(place1)
+            # exit(1)
+        if place2 == 'formData':
+            body_params[param2] = value2
+            if probe(send_request, selected_operation, media_types, _url):
+                result[3] = 1
+            body_params = {}
+            if req_name:
+                if req_place == 'formData':
+                    body_params[req_name] = req_val
+            body_params[param2] = value2
+            if probe(send_request, selected_operation, media_types, _url):
+                result[2] = 1
+        elif place2 == 'query':
+            _url = add_query(_url, param2, value2)
+            if probe(send_request, selected_operation, media_types, _url):
+                result[3] = 1
             _url = url
-            print(_url)
-            result = [0, 0, 0, 0, 0]
-            query_params, body_params = {}, {}
             if req_name:
                 if req_place == 'formData':
                     body_params[req_name] = req_val
-                elif req_place == 'query':
-                    if "?" in _url:
-                        _url = _url + '&' + req_name + '=' + str(req_val)
-                    else:
-                        _url = _url + '?' + req_name + '=' + str(req_val)
-                else:
-                    print("Hey1")
-                    print(req_place)
-                    # exit(1)
-                if selected_operation['operation_id'] in cached_media_type:
-                    response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[0] = 1
-                else:
-                    for media_type in media_types:
-                        response = send_request(media_type, _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[0] = 1
-            if place1 == 'formData':
-                body_params[param1] = value1
-            elif place1 == 'query':
-                if '?' in _url:
-                    _url = _url + '&' + param1 + '=' + str(value1)
-                else:
-                    _url = _url + '?' + param1 + '=' + str(value1)
-            else:
-                print("Hey2")
-                print(place1)
-                # exit(1)
-            if selected_operation['operation_id'] in cached_media_type:
-                response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                if response and 200 <= response.status_code < 300:
-                    result[1] = 1
-            else:
-                for media_type in media_types:
-                    response = send_request(media_type, _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[1] = 1
-            if place2 == 'formData':
-                body_params[param2] = value2
-            elif place2 == 'query':
-                if '?' in _url:
-                    _url = _url + '&' + param2 + '=' + str(value2)
-                else:
-                    _url = _url + '?' + param2 + '=' + str(value2)
-            else:
-                print("Hey2")
-                print(place2)
-                # exit(1)
-            if selected_operation['operation_id'] in cached_media_type:
-                response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                if response and 200 <= response.status_code < 300:
-                    result[1] = 1
-            else:
-                for media_type in media_types:
-                    response = send_request(media_type, _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[1] = 1
-            if place3 == 'formData':
-                body_params[param3] = value3
-                if selected_operation['operation_id'] in cached_media_type:
-                    response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[3] = 1
-                else:
-                    for media_type in media_types:
-                        response = send_request(media_type, _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[3] = 1
-                body_params = {}
-                if req_name:
-                    if req_place == 'formData':
-                        body_params[req_name] = req_val
-                body_params[param3] = value3
-                if selected_operation['operation_id'] in cached_media_type:
-                    response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[2] = 1
-                else:
-                    for media_type in media_types:
-                        response = send_request(media_type, _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[2] = 1
-            elif place3 == 'query':
-                if '?' in _url:
-                    _url = _url + '&' + param3 + '=' + str(value3)
-                else:
-                    _url = _url + '?' + param3 + '=' + str(value3)
-                if selected_operation['operation_id'] in cached_media_type:
-                    response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[3] = 1
-                else:
-                    for media_type in media_types:
-                        response = send_request(media_type, _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[3] = 1
-                _url = url
-                if req_name:
-                    if req_place == 'formData':
-                        body_params[req_name] = req_val
-                if '?' in _url:
-                    _url = _url + '&' + param3 + '=' + str(value3)
-                else:
-                    _url = _url + '?' + param3 + '=' + str(value3)
-                if selected_operation['operation_id'] in cached_media_type:
-                    response = send_request(cached_media_type[selected_operation['operation_id']], _url)
-                    if response and 200 <= response.status_code < 300:
-                        result[2] = 1
-                else:
-                    for media_type in media_types:
-                        response = send_request(media_type, _url)
-                        if response and 200 <= response.status_code < 300:
-                            result[2] = 1
-            else:
-                print("Hey3")
-                print(place2)
-                # exit(1)
+            _url = add_query(_url, param2, value2)
+            if probe(send_request, selected_operation, media_types, _url):
+                result[2] = 1
+        else:
+            print(place2)
+            # exit(1)
 
-            if result == [1, 0, 0, 0, 0]:
+        def merge():
+            if result == [0, 1, 0, 0]:
                 if param1 in validated_ipd and "NOT" in validated_ipd[param1]:
                     validated_ipd[param1]["NOT"].append(param2)
                 else:
                     validated_ipd[param1] = {"NOT": [param2]}
-            elif result == [0, 0, 1, 0, 0]:
+            elif result == [0, 0, 1, 0]:
                 if param2 in validated_ipd and "NOT" in validated_ipd[param2]:
                     validated_ipd[param2]["NOT"].append(param1)
                 else:
                     validated_ipd[param2] = {"NOT": [param1]}
-            elif result == [0, 0, 0, 1, 0]:
+            elif result == [0, 0, 0, 1]:
                 if param1 in validated_ipd and "NEED" in validated_ipd[param1]:
                     validated_ipd[param1]["NEED"].append(param2)
                 else:
                     validated_ipd[param1] = {"NEED": [param2]}
-            elif result != [0, 0, 0, 0, 0]:
-                print("HERE!R@!RHI!@RHI@!")
-                print(result)
-                # exit(1)
+        return merge
+
+
+def validate_triple_dependency(selected_operation, params):
+    method, path = selected_operation['method'], selected_operation['path']
+    param1 = params[0]
+    value1 = None
+    place1 = None
+    param2 = params[1]
+    value2 = None
+    place2 = None
+    param3 = params[2]
+    value3 = None
+    place3 = None
+    req_name = None
+    req_val = None
+    req_place = None
+    query_params, body_params = {}, {}
+    for parameter in selected_operation['parameters']:
+        if 'required' in parameter and parameter['required']:
+            req_name = parameter['name']
+            req_place = parameter['in']
+            if req_name in param2value:
+                req_val = param2value[req_name]
+            elif 'default' in parameter:
+                req_val = parameter['default']
+            elif 'enum' in parameter:
+                req_val = parameter['enum'][0]
+            else:
+                req_val = llm_val[req_name][0]
+        if param1 == parameter['name']:
+            place1 = parameter['in']
+            if param1 in param2value:
+                value1 = param2value[param1]
+            elif 'default' in parameter:
+                value1 = parameter['default']
+            elif 'enum' in parameter:
+                value1 = parameter['enum'][0]
+            else:
+                value1 = llm_val[param1][0]
+        elif param2 == parameter['name']:
+            place2 = parameter['in']
+            if param2 in param2value:
+                value2 = param2value[param2]
+            elif 'default' in parameter:
+                value2 = parameter['default']
+            elif 'enum' in parameter:
+                value2 = parameter['enum'][0]
+            else:
+                value2 = llm_val[param2][0]
+        elif param3 == parameter['name']:
+            place3 = parameter['in']
+            if param3 in param2value:
+                value3 = param2value[param3]
+            elif 'default' in parameter:
+                value3 = parameter['default']
+            elif 'enum' in parameter:
+                value3 = parameter['enum'][0]
+            else:
+                value3 = llm_val[param3][0]
+
+    media_types = selected_operation.get('consumes', [
+        'application/json', 'application/x-www-form-urlencoded', 'multipart/form-data'
+    ])
+    template = templates[selected_operation['operation_id']]
+
+    def send_request(content_type, __url):
+        try:
+            return latency.call(template.operation_id, template.send, method, __url, query_params,
+                                content_type, body_params)
+        except requests.exceptions.RequestException as e:
+            print(f"Request error: {e}")
+            return None
+
+
+    url = base_url + path
+    _url = url
+    # One slot per probe: required only, + param1, + param2, + param3, required and param3 only
+    result = [0, 0, 0, 0, 0]
+    query_params, body_params = {}, {}
+    if req_name:
+        if req_place == 'formData':
+            body_params[req_name] = req_val
+        elif req_place == 'query':
+            _url = add_query(_url, req_name, req_val)
+        else:
+            print(req_place)
+            # exit(1)
+        if probe(send_request, selected_operation, media_types, _url):
+            result[0] = 1
+    if place1 == 'formData':
+        body_params[param1] = value1
+    elif place1 == 'query':
+        _url = add_query(_url, param1, value1)
+    else:
+        print(place1)
+        # exit(1)
+    if probe(send_request, selected_operation, media_types, _url):
+        result[1] = 1
+    if place2 == 'formData':
+        body_params[param2] = value2
+    elif place2 == 'query':
+        _url = add_query(_url, param2, value2)
+    else:
+        print(place2)
+        # exit(1)
+    if probe(send_request, selected_operation, media_types, _url):
+        result[2] = 1
+    if place3 == 'formData':
+        body_params[param3] = value3
+        if probe(send_request, selected_operation, media_types, _url):
+            result[3] = 1
+        body_params = {}
+        if req_name:
+            if req_place == 'formData':
+                body_params[req_name] = req_val
+        body_params[param3] = value3
+        if probe(send_request, selected_operation, media_types, _url):
+            result[4] = 1
+    elif place3 == 'query':
+        _url = add_query(_url, param3, value3)
+        if probe(send_request, selected_operation, media_types, _url):
+            result[3] = 1
+        _url = url
+        if req_name:
+            if req_place == 'formData':
+                body_params[req_name] = req_val
+        _url = add_query(_url, param3, value3)
+        if probe(send_request, selected_operation, media_types, _url):
+            result[4] = 1
+    else:
+        print(place3)
+        # exit(1)
+
+    def merge():
+        if result == [1, 0, 0, 0, 0]:
+            if param1 in validated_ipd and "NOT" in validated_ipd[param1]:
+                validated_ipd[param1]["NOT"].append(param2)
+            else:
+                validated_ipd[param1] = {"NOT": [param2]}
+        elif result == [0, 0, 0, 0, 1]:
+            if param2 in validated_ipd and "NOT" in validated_ipd[param2]:
+                validated_ipd[param2]["NOT"].append(param1)
+            else:
+                validated_ipd[param2] = {"NOT": [param1]}
+        elif result == [0, 0, 0, 1, 0]:
+            if param1 in validated_ipd and "NEED" in validated_ipd[param1]:
+                validated_ipd[param1]["NEED"].append(param2)
+            else:
+                validated_ipd[param1] = {"NEED": [param2]}
+    return merge
+
+
+def reanswer_example(name):
+    # Ask the next larger EX tier for a parameter whose current values never got a 2xx
+    if not llama_ex.escalate(name):
+        return None
+    output = llama_ex(llm_prompt[name], key=name, accept=ex_accepted, **EX_PARAMS)
+    out = parse_ex(output)
+    if out is None:
+        return None
+    telemetry.track(output.get('call_id'), name, out)
+
+    def merge():
+        llm_val[name] = out
+        param2value[name] = out[0]
+    return merge
+
+
+def record_llm_outcome(selected_parameters, success):
+    for param_value_dict in selected_parameters:
+        telemetry.credit(param_value_dict, success)
+        for name, value in param_value_dict.items():
+            if name not in llm_prompt or not llm_val.get(name) or value not in llm_val[name]:
+                continue
+            outcome = llm_outcome.setdefault(name, [0, 0])
+            outcome[0 if success else 1] += 1
+            if outcome[0] == 0 and outcome[1] >= ESCALATE_AFTER and llama_ex.can_escalate(name):
+                if feedback.submit(reanswer_example, name):
+                    llm_outcome[name] = [0, 0]
+
+
+def analyze_error_response(selected_operation, params, text):
+    if len(params) == 1:
+        return find_example_values(params, text)
+    elif len(params) == 2:
+        return validate_pair_dependency(selected_operation, params, text)
+    return validate_triple_dependency(selected_operation, params)
+
+
+def update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response):
+    operation_id = selected_operation['operation_id']
+    if response is not None and response.status_code == 429:
+        # Throttling says nothing about the request; http_pool has already waited and retried
+        return
+    if response is not None:
+        record_llm_outcome(selected_parameters, 200 <= response.status_code < 300)
+    if response is None:
+        reward = -10
+        q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
+    elif response.status_code == 401:
+        reward = -1
+    elif 200 <= response.status_code < 300:
+        q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] + 1
+        reward = -1
+    elif 400 <= response.status_code < 500:
+        q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
+        reward = 1
+
+        count = 0
+        params = []
+        for parameter in selected_operation['parameters']:
+            if parameter['name'] in response.text:
+                count = count + 1
+                params.append(parameter['name'])
+        if count in (1, 2, 3):
+            # Messages that only differ in echoed values, ids or timestamps share one analysis
+            signature = (error_signature(response.text), tuple(params))
+            # The LLM analysis and its validation requests run on the feedback worker so the
+            # fuzzing loop keeps sending; main() merges what they find once it is ready
+            if signature not in checked_msg and feedback.submit(
+                    analyze_error_response, copy.deepcopy(selected_operation), params, response.text,
+                    priority=EX if count == 1 else IPD):
+                checked_msg.add(signature)
     elif response.status_code >= 500:
         q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
         reward = 1
@@ -999,7 +802,8 @@ def adapt_testing_strategy(iteration, max_iterations_without_improvement):
 def select_operations_and_parameters(operations, parameter_values, q_table):
     method_priority = {'post': 5}
 
-    sorted_operations = sorted(operations, key=lambda op: (
+    # Operations whose requests keep timing out sit out until their circuit closes
+    sorted_operations = sorted(latency.available(operations), key=lambda op: (
         (sum(q_table[op['operation_id']].values()) / len(q_table[op['operation_id']])) if len(
             q_table[op['operation_id']]) > 0 else 0,
         method_priority.get(op['method'], 0)), reverse=True)
@@ -1153,6 +957,9 @@ def get_next_parameter_value(operation, parameter):
             return default_values(p)
 
     def llm_values(p):
+        if not llm_val.get(p['name']):
+            # Not (yet) answered by the EX model
+            return default_values(p)
         val =  random.choice(llm_val[p['name']])
         if val:
             return val
@@ -1220,7 +1027,9 @@ def get_next_parameter_value(operation, parameter):
                                                                                              operation=operation)
 
 
-def llm_example_description(operations):
+def ex_prompts(operations):
+    # Take the values the spec already gives and return the EX prompts left to run
+    pending = {}
     for operation in operations:
         for parameter in operation["parameters"]:
             if 'default' in parameter:
@@ -1232,47 +1041,131 @@ def llm_example_description(operations):
             elif 'enum' in parameter:
                 param2value[parameter['name']] = parameter['enum'][0]
                 llm_val[parameter['name']] = [parameter['enum']]
-            elif parameter['name'] not in llm_val:
-                for i in range(3):
-                    try:
-                        ex_prompt = f"Find example values for the parameter below in a list format\nname: {parameter['name']}\ndescription: {parameter['description']}\ntype: {parameter['type']}"
-                        output = llama_ex(f"<s>[INST] {ex_prompt} [/INST]", max_tokens=512, echo=True)
-                        out = output['choices'][0]['text']
-                        out = out[out.find('[/INST]') + 7:out.find('</s>')]
-                        out = json.loads(out.replace("'", '"'))
-                        if type(out) == list:
-                            llm_val[parameter['name']] = out
-                            if parameter['name'] not in param2value:
-                                param2value[parameter['name']] = out[0]
-                            break
-                    except Exception as e:
-                        llm_val[parameter['name']] = None
+            elif parameter['name'] not in llm_val and parameter['name'] not in pending:
+                try:
+                    pending[parameter['name']] = ex_prompt(parameter['name'], parameter['description'], 'type',
+                                                           parameter['type'])
+                    llm_prompt[parameter['name']] = pending[parameter['name']]
+                except Exception as e:
+                    llm_val[parameter['name']] = None
+    return pending
 
 
-def llm_ipd_description(operations):
+def ex_batch(pending, names):
+    try:
+        # The EX grammar only admits a list of scalars, so a single round parses
+        outputs = llama_ex.create_batch([pending[name] for name in names], keys=names, accept=ex_accepted,
+                                         **EX_PARAMS)
+    except Exception as e:
+        outputs = [None] * len(names)
+    found = {}
+    for name, output in zip(names, outputs):
+        try:
+            found[name] = parse_ex(output)
+            telemetry.track(output.get('call_id'), name, found[name])
+        except Exception as e:
+            found[name] = None
+
+    def merge():
+        for name, out in found.items():
+            llm_val[name] = out
+            if out is not None and name not in param2value:
+                param2value[name] = out[0]
+    return merge
+
+
+def ipd_prompts(operations):
+    pending = {}
     for operation in operations:
         for parameter in operation["parameters"]:
-            if parameter['name'] not in llm_ipd and 'description' in parameter:
+            if parameter['name'] in llm_ipd or parameter['name'] in pending:
+                continue
+            if 'description' in parameter:
                 for param in op2params[operation['operation_id']]:
                     if param != parameter['name'] and param in parameter['description']:
-                        try:
-                            ipd_prompt = f"Find Inter-parameter Dependency for the parameter below\nname:{parameter['name']}\ndescription:{parameter['description']}"
-                            output = llama_ipd(f"<s>[INST] {ipd_prompt} [/INST]", max_tokens=512, echo=True)
-                            out = output['choices'][0]['text']
-                            out = out[out.find('[/INST]') + 7:out.find('</s>')]
-                            count = 0
-                            for param in op2params[operation['operation_id']]:
-                                if param in out:
-                                    count = count + 1
-                            if count >= 2:
-                                llm_ipd[parameter['name']] = out
-                            break
-                        except Exception as e:
-                            llm_ipd[parameter['name']] = None
-                            break
+                        pending[parameter['name']] = (ipd_prompt(parameter['name'], parameter['description']),
+                                                      operation['operation_id'])
+                        break
 
-            if parameter['name'] not in llm_ipd:
+            if parameter['name'] not in pending:
                 llm_ipd[parameter['name']] = None
+    return pending
+
+
+def ipd_batch(pending, names):
+    try:
+        outputs = llama_ipd.create_batch([pending[name][0] for name in names], keys=names, accept=ipd_accepted,
+                                          **IPD_PARAMS)
+    except Exception as e:
+        outputs = [None] * len(names)
+    found = {}
+    for name, output in zip(names, outputs):
+        try:
+            out = parse_ipd(output) or ''
+            count = 0
+            for param in op2params[pending[name][1]]:
+                if param in out:
+                    count = count + 1
+            found[name] = out if count >= 2 else None
+        except Exception as e:
+            found[name] = None
+
+    def merge():
+        llm_ipd.update(found)
+    return merge
+
+
+def llm_example_description(operations):
+    pending = ex_prompts(operations)
+    if pending:
+        ex_batch(pending, list(pending))()
+
+
+def llm_ipd_description(operations):
+    pending = ipd_prompts(operations)
+    if pending:
+        ipd_batch(pending, list(pending))()
+
+
+def producer_waves(operation_id):
+    # Producers of the operation's inputs, each with the inputs it makes; one that consumes what an
+    # earlier producer makes goes in a later wave
+    waves, placed = [], {}
+    for pname in consumer.get(operation_id, []):
+        for producer_operation_id in producer.get(pname, []):
+            if producer_operation_id in placed:
+                names = waves[placed[producer_operation_id]][producer_operation_id]
+                if pname not in names:
+                    names.append(pname)
+                continue
+            needs = consumer.get(producer_operation_id, [])
+            wave = max((placed[op] + 1 for op in placed
+                        if any(op in producer.get(name, []) for name in needs)), default=0)
+            if wave == len(waves):
+                waves.append({})
+            waves[wave][producer_operation_id] = [pname]
+            placed[producer_operation_id] = wave
+    return waves
+
+
+def progressive_prepass(ex_pending, ipd_pending, batch_size):
+    # Runs on the feedback worker while fuzzing goes on; parameters of the operations
+    # selected most so far are completed first
+    param2ops = defaultdict(list)
+    for operation_id, names in op2params.items():
+        for name in names:
+            param2ops[name].append(operation_id)
+
+    def priority(name):
+        return max((op_selected[operation_id] for operation_id in param2ops[name]), default=0)
+
+    for pending, run in ((ex_pending, ex_batch), (ipd_pending, ipd_batch)):
+        while pending:
+            names = sorted(pending, key=priority, reverse=True)[:batch_size]
+            merge = run(pending, names)
+            for name in names:
+                del pending[name]
+            yield merge
 
 
 def main():
@@ -1280,12 +1173,21 @@ def main():
     openapi_spec_file = sys.argv[1]
     openapi_spec = prance.ResolvingParser(openapi_spec_file).specification
     operations, parameters_frequency = analyze_information(openapi_spec)
+    templates.update(compile_templates(operations))
+    operations_by_id.update((op['operation_id'], op) for op in operations)
     alpha, gamma, q_table = initialize_q_learning(operations, parameters_frequency)
-    llm_example_description(operations)
-    llm_ipd_description(operations)
+    # With a knowledge pack the pre-pass is answered from it without running a model
+    if attach_pack(openapi_spec_file, llama_ex, llama_ipd) or os.environ.get('LLAMA_PROGRESSIVE', '1') == '0':
+        llm_example_description(operations)
+        llm_ipd_description(operations)
+    else:
+        # Start fuzzing right away with the spec, random and default sources; EX/IPD results stream in
+        feedback.run_when_idle(progressive_prepass(ex_prompts(operations), ipd_prompts(operations),
+                                                   int(os.environ.get('LLAMA_PREPASS_BATCH', 8))))
 
     start_time = time.time()
     time_limit = 7200
+    scheduler.start(time_limit)
     iteration = 0
     max_iterations_without_improvement = 10
 
@@ -1293,43 +1195,75 @@ def main():
         elapsed_time = time.time() - start_time
         if elapsed_time >= time_limit:
             break
+        feedback.apply_results()
+        telemetry.flush()
+        latency.flush()
         parameter_values = generate_parameter_values(operations)
         selected_operation, selected_parameters = select_operations_and_parameters(operations, parameter_values,
                                                                                    q_table)
+        # A byte-identical request teaches nothing new; draw fresh parameters for one that was already sent
+        selected_operation, selected_parameters = duplicates.fresh(
+            (selected_operation, selected_parameters), request_fingerprint,
+            lambda request: select_operations_and_parameters([request[0]], generate_parameter_values([request[0]]),
+                                                             q_table), request_varies)
+        op_selected[selected_operation['operation_id']] += 1
+
+        # Run the producer operations of the selected_operation's inputs whose earlier output is stale or
+        # used up; a wave of GET/HEAD producers goes out at once, one with writes runs in order, and its
+        # responses are applied in order before the next wave
+        for wave in producer_waves(selected_operation['operation_id']):
+            calls = []
+            for producer_operation_id, names in wave.items():
+                if producers.take(producer_operation_id, names):
+                    continue
+                producer_operation = operations_by_id[producer_operation_id]
+                producer_parameters = generate_parameter_values([producer_operation])[
+                    producer_operation_id]
+                calls.append((execute_operations, (base_url, producer_operation, producer_parameters)))
+            methods = [producer_operation['method'] for _, (_, producer_operation, _) in calls]
+            for (_, (_, producer_operation, _)), response in zip(calls, executor.gather(calls, methods=methods)):
+                if response is not None and 200 <= response.status_code < 300:
+                    producers.store(producer_operation['operation_id'], wave[producer_operation['operation_id']])
+                if (selected_operation['method'] in ["post",
+                                                     "get"]) and response and 200 <= response.status_code < 300:
+                    try:
+                        extract_response_values(response_json(response), producer_operation)
+                    except Exception:
+                        pass
 
-        # Run all producer operations if the selected_operation is a consumer operation
-        if selected_operation['operation_id'] in consumer:
-            for pname in consumer[selected_operation['operation_id']]:
-                if pname in producer:
-                    for producer_operation_id in producer[pname]:
-                        producer_operation = next(
-                            op for op in operations if op['operation_id'] == producer_operation_id)
-                        producer_parameters = generate_parameter_values([producer_operation])[
-                            producer_operation_id]
-
-                        response = execute_operations(base_url, producer_operation, producer_parameters)
-                        if (selected_operation['method'] in ["post",
-                                                             "get"]) and response and 200 <= response.status_code < 300:
-                            try:
-                                extract_response_values(response.json(), producer_operation)
-                            except Exception:
-                                pass
-
-        response = execute_operations(base_url, selected_operation, selected_parameters)
+        # The selected request and its mutated copy go out together when neither can change server state;
+        # otherwise the mutated copy follows the selected request, as the outcome would depend on their order
+        copied_operation = copy.deepcopy(selected_operation)
+        copied_parameters = copy.deepcopy(selected_parameters)
+        mutated_params, mutated_ops = perform_parameter_mutation(copied_parameters, copied_operation)
+        response, mutated_response = executor.gather(
+            [(execute_operations, (base_url, selected_operation, selected_parameters)),
+             (execute_operations, (base_url, mutated_ops, mutated_params))],
+            methods=(selected_operation['method'], mutated_ops['method']))
+        # Resources the producers made for these inputs may be gone or changed after a DELETE or PUT
+        producers.observe(selected_operation['method'], consumer.get(selected_operation['operation_id'], []),
+                          response)
+        producers.observe(mutated_ops['method'], consumer.get(selected_operation['operation_id'], []),
+                          mutated_response)
         if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
             try:
-                extract_response_values(response.json(), selected_operation)
+                extract_response_values(response_json(response), selected_operation)
             except Exception:
                 pass
         update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response)
 
-        copied_operation = copy.deepcopy(selected_operation)
-        copied_parameters = copy.deepcopy(selected_parameters)
-        mutated_params, mutated_ops = perform_parameter_mutation(copied_parameters, copied_operation)
-        execute_operations(base_url, mutated_ops, mutated_params)
-
         adapt_testing_strategy(iteration, max_iterations_without_improvement)
         iteration += 1
+    print(f"[llm_router] ex: {llama_ex.summary()} ipd: {llama_ipd.summary()}")
+    print(f"[llm_models] {models.report()}")
+    print(f"[llm_scheduler] {scheduler.summary()}")
+    print(f"[media_types] {cached_media_type.summary()}")
+    print(f"[latency] {latency.summary()}")
+    print(f"[request_filter] {duplicates.summary()}")
+    print(f"[producer_cache] {producers.summary()}")
+    print(f"[http_pool] throttled: {http_pool.report()}")
+    telemetry.flush(force=True)
+    latency.flush(force=True)
 
 
 def validate_ipd(operations):
@@ -1411,57 +1345,12 @@ def validate_ipd(operations):
             media_types = operation.get('consumes', [
                 'application/json', 'application/x-www-form-urlencoded', 'multipart/form-data'
             ])
+            template = templates[operation['operation_id']]
 
             def send_request(content_type, __url):
-                headers = {"Content-Type": content_type}
-
                 try:
-                    if content_type == 'application/x-www-form-urlencoded':
-                        try:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     data=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       data=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      data=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                        except Exception:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     json=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       json=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      json=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                    else:
-                        if method == 'get':
-                            return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'post':
-                            return requests.post(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'put':
-                            return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'delete':
-                            return requests.delete(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'patch':
-                            return requests.patch(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'head':
-                            return requests.head(__url, headers=headers, params=query_params)
+                    return latency.call(template.operation_id, template.send, method, __url, query_params,
+                                        content_type, body_params)
                 except requests.exceptions.RequestException as e:
                     print(f"Request error: {e}")
                     return None
@@ -1475,12 +1364,8 @@ def validate_ipd(operations):
                     if req_place == 'formData':
                         body_params[req_name] = req_val
                     elif req_place == 'query':
-                        if "?" in _url:
-                            _url = _url + '&' + req_name + '=' + str(req_val)
-                        else:
-                            _url = _url + '?' + req_name + '=' + str(req_val)
+                        _url = add_query(_url, req_name, req_val)
                     else:
-                        print("Hey1")
                         print(req_place)
                         # exit(1)
                     if operation['operation_id'] in cached_media_type:
@@ -1495,12 +1380,8 @@ def validate_ipd(operations):
                 if place1 == 'formData':
                     body_params[param1] = value1
                 elif place1 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param1 + '=' + str(value1)
-                    else:
-                        _url = _url + '?' + param1 + '=' + str(value1)
+                    _url = add_query(_url, param1, value1)
                 else:
-                    print("Hey2")
                     print(place1)
                     # exit(1)
                 if operation['operation_id'] in cached_media_type:
@@ -1515,12 +1396,8 @@ def validate_ipd(operations):
                 if place2 == 'formData':
                     body_params[param2] = value2
                 elif place2 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param2 + '=' + str(value2)
-                    else:
-                        _url = _url + '?' + param2 + '=' + str(value2)
+                    _url = add_query(_url, param2, value2)
                 else:
-                    print("Hey2")
                     print(place2)
                     # exit(1)
                 if operation['operation_id'] in cached_media_type:
@@ -1558,10 +1435,7 @@ def validate_ipd(operations):
                             if response and 200 <= response.status_code < 300:
                                 result[2] = 1
                 elif place3 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param3 + '=' + str(value3)
-                    else:
-                        _url = _url + '?' + param3 + '=' + str(value3)
+                    _url = add_query(_url, param3, value3)
                     if operation['operation_id'] in cached_media_type:
                         response = send_request(cached_media_type[operation['operation_id']], _url)
                         if response and 200 <= response.status_code < 300:
@@ -1575,10 +1449,7 @@ def validate_ipd(operations):
                     if req_name:
                         if req_place == 'formData':
                             body_params[req_name] = req_val
-                    if '?' in _url:
-                        _url = _url + '&' + param3 + '=' + str(value3)
-                    else:
-                        _url = _url + '?' + param3 + '=' + str(value3)
+                    _url = add_query(_url, param3, value3)
                     if operation['operation_id'] in cached_media_type:
                         response = send_request(cached_media_type[operation['operation_id']], _url)
                         if response and 200 <= response.status_code < 300:
@@ -1589,7 +1460,6 @@ def validate_ipd(operations):
                             if response and 200 <= response.status_code < 300:
                                 result[2] = 1
                 else:
-                    print("Hey3")
                     print(place2)
                     # exit(1)
 
@@ -1613,10 +1483,6 @@ def validate_ipd(operations):
                         validated_ipd[param1]["NEED"].append(param2)
                     else:
                         validated_ipd[param1] = {"NEED": [param2]}
-                elif result != [0, 0, 0, 0, 0]:
-                    print("HERE!R@!RHI!@RHI@!")
-                    print(result)
-                    # exit(1)
         if count == 2:
             param1 = None
             value1 = None
@@ -1669,57 +1535,12 @@ def validate_ipd(operations):
             media_types = operation.get('consumes', [
                 'application/json', 'application/x-www-form-urlencoded', 'multipart/form-data'
             ])
+            template = templates[operation['operation_id']]
 
             def send_request(content_type, __url):
-                headers = {"Content-Type": content_type}
-
                 try:
-                    if content_type == 'application/x-www-form-urlencoded':
-                        try:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     data=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, data=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       data=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      data=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                        except Exception:
-                            if method == 'get':
-                                return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'post':
-                                return requests.post(__url, params=query_params, headers=headers,
-                                                     json=body_params)
-                            elif method == 'put':
-                                return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                            elif method == 'delete':
-                                return requests.delete(__url, params=query_params, headers=headers,
-                                                       json=body_params)
-                            elif method == 'patch':
-                                return requests.patch(__url, params=query_params, headers=headers,
-                                                      json=body_params)
-                            elif method == 'head':
-                                return requests.head(__url, headers=headers, params=query_params)
-                    else:
-                        if method == 'get':
-                            return requests.get(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'post':
-                            return requests.post(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'put':
-                            return requests.put(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'delete':
-                            return requests.delete(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'patch':
-                            return requests.patch(__url, params=query_params, headers=headers, json=body_params)
-                        elif method == 'head':
-                            return requests.head(__url, headers=headers, params=query_params)
+                    return latency.call(template.operation_id, template.send, method, __url, query_params,
+                                        content_type, body_params)
                 except requests.exceptions.RequestException as e:
                     print(f"Request error: {e}")
                     return None
@@ -1742,9 +1563,8 @@ def validate_ipd(operations):
                                 if response and 200 <= response.status_code < 300:
                                     result[0] = 1
                     elif req_place == 'query':
-                        _url += '?' + req_name + '=' + str(req_val)
+                        _url = add_query(_url, req_name, req_val)
                     else:
-                        print("Hey1")
                         print(req_place)
                         # exit(1)
                 if place1 == 'formData':
@@ -1759,12 +1579,8 @@ def validate_ipd(operations):
                             if response and 200 <= response.status_code < 300:
                                 result[1] = 1
                 elif place1 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param1 + '=' + str(value1)
-                    else:
-                        _url = _url + '?' + param1 + '=' + str(value1)
+                    _url = add_query(_url, param1, value1)
                 else:
-                    print("Hey2")
                     print(place1)
                     # exit(1)
                 if place2 == 'formData':
@@ -1793,10 +1609,7 @@ def validate_ipd(operations):
                             if response and 200 <= response.status_code < 300:
                                 result[2] = 1
                 elif place2 == 'query':
-                    if '?' in _url:
-                        _url = _url + '&' + param2 + '=' + str(value2)
-                    else:
-                        _url = _url + '?' + param2 + '=' + str(value2)
+                    _url = add_query(_url, param2, value2)
                     if operation['operation_id'] in cached_media_type:
                         response = send_request(cached_media_type[operation['operation_id']], _url)
                         if response and 200 <= response.status_code < 300:
@@ -1810,10 +1623,7 @@ def validate_ipd(operations):
                     if req_name:
                         if req_place == 'formData':
                             body_params[req_name] = req_val
-                    if '?' in _url:
-                        _url = _url + '&' + param2 + '=' + str(value2)
-                    else:
-                        _url = _url + '?' + param2 + '=' + str(value2)
+                    _url = add_query(_url, param2, value2)
                     if operation['operation_id'] in cached_media_type:
                         response = send_request(cached_media_type[operation['operation_id']], _url)
                         if response and 200 <= response.status_code < 300:
@@ -1824,7 +1634,6 @@ def validate_ipd(operations):
                             if response and 200 <= response.status_code < 300:
                                 result[2] = 1
                 else:
-                    print("Hey3")
                     print(place2)
                     # exit(1)
 
@@ -1843,29 +1652,41 @@ def validate_ipd(operations):
                         validated_ipd[param1]["NEED"].append(param2)
                     else:
                         validated_ipd[param1] = {"NEED": [param2]}
-                elif result != [0, 0, 0, 0]:
-                    print("HERE!R@!RHI!@RHI@!")
-                    print(result)
 
 
 if __name__ == "__main__":
     base_url = sys.argv[2]
     EPSILON = [0.1]
-    llama_ex = Llama(model_path="../../../ex.gguf")
-    llama_ipd = Llama(model_path="../../../ipd.gguf")
+    llama_ex = load_router("../../../ex.gguf", 'LLAMA_EX_MODELS', kind='ex')
+    llama_ipd = load_router("../../../ipd.gguf", 'LLAMA_IPD_MODELS', kind='ipd')
     ss = [None]
     op2params = {}
     param2value = {}
     llm_val = {}
+    llm_prompt = {}
+    llm_outcome = {}
+    ESCALATE_AFTER = int(os.environ.get('LLAMA_ESCALATE_AFTER', 20))
     llm_ipd = {}
-    checked_msg = []
+    checked_msg = set()
+    scheduler = load_scheduler()
+    llama_ex.scheduler = llama_ipd.scheduler = scheduler
+    telemetry = load_telemetry()
+    llama_ex.telemetry = llama_ipd.telemetry = telemetry
+    feedback = FeedbackWorker(maxsize=int(os.environ.get('LLAMA_FEEDBACK_QUEUE', 8)), scheduler=scheduler)
+    executor = RequestExecutor(int(os.environ.get('HTTP_IN_FLIGHT', 8)))
     validated_ipd = {}
+    op_selected = defaultdict(int)
     processed_ex = {}
     key_matched = {}
     post_produced = {}
     previous_request = {}
     response_values = {}
-    cached_media_type = {}
+    cached_media_type = load_media_types()
+    latency = load_latency()
+    duplicates = load_duplicate_filter()
+    producers = load_producer_cache()
+    templates = {}
+    operations_by_id = {}
     q_table_param_values = {}
     producer = {}
     consumer = {}
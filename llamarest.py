@@ -2,7 +2,6 @@ import re
 import os
 import sys
 import copy
-import json
 import time
 import math
 import rstr
@@ -12,9 +11,24 @@ import string
 import prance
 import difflib
 import requests
+import http_pool
 import datetime
 import functools
-from llama_cpp import Llama
+from llm_router import load_router
+from llm_models import models
+from llm_pack import attach_pack
+from llm_grammar import EX_PARAMS, IPD_PARAMS, parse_ex, parse_ipd, ex_accepted, ipd_accepted
+from llm_worker import FeedbackWorker
+from llm_scheduler import load_scheduler, IPD
+from llm_telemetry import load_telemetry
+from request_template import compile_templates, send_first
+from partial_json import response_json
+from latency import load_latency
+from request_filter import load_duplicate_filter
+from producer_cache import load_producer_cache
+from media_types import load_media_types
+from error_signature import error_signature
+from llm_prompt import response_excerpt, ex_prompt, ipd_prompt
 from collections import defaultdict
 
 
@@ -297,13 +311,13 @@ def send_optional(op, ipds, values, required={}, required_params=[], resource=Fa
 
 
 def send_request(op, __values):
-    url = base_url + operations2[op['operation_id']]['path']
+    template = templates[op['operation_id']]
     headers = [{'Content-Type': 'application/x-www-form-urlencoded'}, {'Content-Type': 'application/json'}, {'Content-Type': 'multipart/form-data'}]
     method = operations2[op['operation_id']]['method'].lower()
-    form_data = {}
+    path_values, query, form_data = {}, {}, {}
 
     for param in __values:
-        param_detail = operations2[op['operation_id']]['parameters'][param]
+        param_detail = template.params[param]
 
         if param_detail['in'] == 'body' or param_detail['in'] == 'formData':
             if param == "body":
@@ -314,47 +328,40 @@ def send_request(op, __values):
             value = __values[param]
             if isinstance(value, list):
                 value = random.choice(value)
-            url = url.replace('{' + param + '}', str(value))
+            path_values.setdefault(param, value)
         elif param_detail['in'] == 'query':
             value = __values[param]
             if isinstance(value, list):
                 value = random.choice(value)
-            if '?' in url:
-                url = url + "&" + param + '=' + str(value)
-            else:
-                url = url + "?" + param + '=' + str(value)
+            query[param] = value
         else:
             print("HEY!!")
             print(param_detail)
 
-    try:
-        res = requests.request(method, url, headers=headers[0], data=form_data, allow_redirects=False)
-    except Exception:
-        try:
-            res = requests.request(method, url, headers=headers[1], json=form_data, allow_redirects=False)
-        except Exception:
-            try:
-                res = requests.request(method, url, headers=headers[1], data=form_data, allow_redirects=False)
-            except Exception:
-                res = requests.request(method, url, headers=headers[2], data=form_data, allow_redirects=False)
+    url = template.url(base_url, path_values, query)
+    # A request that times out counts as a failure (None), not as the end of the run
+    res = latency.call(op['operation_id'], send_first, method, url,
+                       [(headers[0], 'data'), (headers[1], 'json'), (headers[1], 'data'), (headers[2], 'data')],
+                       form_data, allow_redirects=False)
 
+    if res is not None:
+        telemetry.credit(__values, 200 <= res.status_code < 300)
     return res
 
 def send_mutated_request(op, __values):
-    url = base_url + operations2[op['operation_id']]['path']
-    _url = url
+    template = templates[op['operation_id']]
     headers = random.choice([{'Content-Type': 'application/x-www-form-urlencoded'}, {'Content-Type': 'application/json'}, {'Content-Type': 'multipart/form-data'}])
 
     method = operations2[op['operation_id']]['method'].lower()
     if random.uniform(0, 1) < 0.2:
         _method = random.choice(["get", "post", "put", "patch", "options", "trace", "head", "delete"])
-    form_data = {}
+    path_values, query, form_data = {}, {}, {}
     _values = copy.deepcopy(__values)
 
     for param in _values:
         if random.uniform(0, 1) < 0.2:
             _values[param] = random.choice(["", None, [], {}, "string", "string~!!!@#$^&**()_+", 1, 1.1, "5%", "1970-01-01T00:00:00Z", "1970-01-01", True, 9999999999999999999999999999999999999999999999999999999999999999, 9.999999999999999999999999999999999999999999999999999999999999999])
-        param_detail = copy.deepcopy(operations2[op['operation_id']]['parameters'][param])
+        param_detail = copy.deepcopy(template.params[param])
         if random.uniform(0, 1) < 0.2:
             param_detail['in'] = random.choice(["body", "in", "query", "path"])
         if param_detail['in'] == 'body':
@@ -366,23 +373,16 @@ def send_mutated_request(op, __values):
             value = _values[param]
             if isinstance(value, list) and value:
                 value = random.choice(value)
-            url = url.replace('{' + param + '}', str(value))
+            path_values.setdefault(param, value)
         elif param_detail['in'] == 'query':
             value = _values[param]
             if isinstance(value, list) and value:
                 value = random.choice(value)
-            if '?' in url:
-                url = url + "&" + param + '=' + str(value)
-            else:
-                url = url + "?" + param + '=' + str(value)
+            query[param] = value
 
-    try:
-        res = requests.request(method, url, headers=headers, data=form_data, allow_redirects=False)
-    except Exception:
-        try:
-            res = requests.request(method, url, headers=headers, json=form_data, allow_redirects=False)
-        except Exception:
-            res = requests.request(method, url, headers=headers, data=form_data, allow_redirects=False)
+    url = template.url(base_url, path_values, query)
+    res = latency.call(op['operation_id'], send_first, method, url,
+                       [(headers, 'data'), (headers, 'json'), (headers, 'data')], form_data, allow_redirects=False)
 
     return res
 
@@ -513,174 +513,132 @@ def send_all(op, ipds, values, required={}, required_params=[], resource=False):
                 ex_success[param] = values[param]
     send_mutated_request(op, request_values)
 
+def analyze_error_response(selected_operation, count, params, text, signature):
+    values = {}
+    ipds = {}
+    # IPD is the first analysis the scheduler drops near the end of the run; the EX values still go out
+    with_ipd = scheduler.admit(IPD, params[0])
+
+    if count >= 2 and with_ipd:
+        try:
+            output = llama_ipd(ipd_prompt(params[0], response_excerpt(text, params)), key=params[0],
+                               accept=ipd_accepted, **IPD_PARAMS)
+            ipds[params[0]] = parse_ipd(output) or ''
+        except Exception:
+            pass
+
+    for parameter in selected_operation["parameters"]:
+        for _param in params:
+            if with_ipd and _param in parameter['description'] and _param != parameter['name']:
+                try:
+                    output = llama_ipd(ipd_prompt(parameter['name'], parameter['description']), key=parameter['name'],
+                                       accept=ipd_accepted, **IPD_PARAMS)
+                    ipds[parameter['name']] = parse_ipd(output) or ''
+                    break
+                except Exception:
+                    pass
+        if 'enum' in parameter:
+            values[parameter['name']] = parameter['enum']
+        elif 'type' in parameter and parameter['type'] == 'boolean':
+            values[parameter['name']] = [True, False]
+        elif parameter['name'] in ex_success:
+            values[parameter['name']] = ex_success[parameter['name']]
+        else:
+            try:
+                if 'default' in parameter:
+                    prompt = ex_prompt(parameter['name'], parameter['description'], 'default value', parameter['default'])
+                else:
+                    prompt = ex_prompt(parameter['name'], parameter['description'])
+                output = llama_ex(prompt, key=parameter['name'], accept=ex_accepted,
+                                  **EX_PARAMS)
+                out = parse_ex(output)
+                if out is None:
+                    raise ValueError(f"no example values for {parameter['name']}")
+                telemetry.track(output.get('call_id'), parameter['name'], out)
+                values[parameter['name']] = out
+            except Exception as e:
+                if 'schema' in parameter:
+                    out = [generate_random_value(parameter['schema'])]
+                else:
+                    out = [generate_random_value(parameter)]
+                values[parameter['name']] = out
+
+    if count >= 1 and params[0] not in ex_success:
+        try:
+            output = llama_ex(ex_prompt(params[0], response_excerpt(text, params)), key=params[0],
+                              accept=ex_accepted, **EX_PARAMS)
+            out = parse_ex(output)
+            if out is not None:
+                values[params[0]].extend(out)
+                telemetry.track(output.get('call_id'), params[0], out)
+        except Exception as e:
+            pass
+
+    def merge():
+        error_analyses[signature] = (ipds, values)
+        send_all(selected_operation, ipds, values)
+    return merge
+
+
 def execute_operations(base_url, selected_operation, selected_parameters):
-    method, path = selected_operation['method'], selected_operation['path']
-    query_params, body_params = {}, {}
+    method = selected_operation['method']
     media_types = selected_operation.get('consumes', [
         'application/json', 'application/x-www-form-urlencoded'
     ])
 
-    def send_request(content_type):
-        headers = {"Content-Type": content_type}
+    template = templates[selected_operation['operation_id']]
 
+    def send_request(content_type):
         try:
-            if content_type == 'application/x-www-form-urlencoded':
-                try:
-                    if method == 'get':
-                        return requests.get(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'post':
-                        return requests.post(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'put':
-                        return requests.put(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'delete':
-                        return requests.delete(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'patch':
-                        return requests.patch(url, params=query_params, headers=headers, data=body_params)
-                    elif method == 'head':
-                        return requests.head(url, headers=headers, params=query_params)
-                except Exception:
-                    if method == 'get':
-                        return requests.get(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'post':
-                        return requests.post(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'put':
-                        return requests.put(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'delete':
-                        return requests.delete(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'patch':
-                        return requests.patch(url, params=query_params, headers=headers, json=body_params)
-                    elif method == 'head':
-                        return requests.head(url, headers=headers, params=query_params)
-            else:
-                if method == 'get':
-                    return requests.get(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'post':
-                    return requests.post(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'put':
-                    return requests.put(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'delete':
-                    return requests.delete(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'patch':
-                    return requests.patch(url, params=query_params, headers=headers, json=body_params)
-                elif method == 'head':
-                    return requests.head(url, headers=headers, params=query_params)
+            return latency.call(selected_operation['operation_id'], template.send, method, url, query_params,
+                                content_type, body_params)
         except requests.exceptions.RequestException as e:
             print(f"Request error: {e}")
             return None
 
-    for param_value_dict in selected_parameters:
-        for param_name, param_value in param_value_dict.items():
-            param = next((p for p in selected_operation['parameters'] if p['name'] == param_name), None)
-            if param is None: continue
-            if "schema" in param:
-                param_location, param_type = param['in'], param["schema"].get('type')
-            else:
-                param_location, param_type = param['in'], param.get('type')
-            if param_location == 'path':
-                path = path.replace(f'{{{param_name}}}', str(param_value))
-            elif param_location == 'query':
-                query_params[param_name] = param_value
-            elif isinstance(param_value, list):
-                body_params = param_value
-            elif isinstance(param_value, dict):
-                for tt in param_value:
-                    body_params[tt] = param_value[tt]
-            else:
-                if isinstance(body_params, dict):
-                    body_params[param_name] = param_value if param_type != 'array' else (param_value if isinstance(param_value, list) else [param_value])
-    url = base_url + path
+    path_values, query_params, body_params = template.fill(selected_parameters)
+    url = template.url(base_url, path_values)
     response = None
-    if selected_operation['operation_id'] in cached_media_type:
-        response = send_request(cached_media_type[selected_operation['operation_id']])
-    else:
-        for media_type in media_types:
-            response = send_request(media_type)
-            if response is not None and 200 <= response.status_code < 300:
-                cached_media_type[selected_operation['operation_id']] = media_type
-                break
+    # Content types are tried in the order the model ranks them; known failures are skipped
+    for media_type in cached_media_type.candidates(selected_operation['operation_id'], media_types):
+        response = send_request(media_type)
+        cached_media_type.observe(selected_operation['operation_id'], media_type, response)
+        if response is not None and 200 <= response.status_code < 300:
+            break
 
     if response is not None and response.status_code >= 300:
         op_counter[selected_operation['operation_id']] = op_counter[selected_operation['operation_id']] + 1
         if op_counter[selected_operation['operation_id']] % threshold[selected_operation['operation_id']] == threshold[selected_operation['operation_id']]-1:
             threshold[selected_operation['operation_id']] = threshold[selected_operation['operation_id']] * 10
-            values = {}
-            ipds = {}
             count = 0
             params = []
-
             for parameter in selected_operation['parameters']:
                 if parameter['name'] in response.text:
                     count = count + 1
                     params.append(parameter['name'])
+            # Messages that only differ in echoed values, ids or timestamps share one analysis
+            signature = (error_signature(response.text), tuple(params))
+            if signature not in error_analyses:
+                # The LLM analysis runs on the feedback worker; main() hands its values and rules to send_all
+                if feedback.submit(analyze_error_response, copy.deepcopy(selected_operation), count, params,
+                                   response.text, signature):
+                    error_analyses[signature] = None
+            elif error_analyses[signature] is not None:
+                ipds, values = error_analyses[signature]
+                send_all(selected_operation, ipds, values)
+    print(op_counter)
+    return response
 
 
-            if count >= 2:
-                try:
-                    ipd_prompt = f"Find Inter-parameter Dependency for the parameter below\nname:{params[0]}\ndescription:{response.text}"
-                    output = llama_ipd(f"<s>[INST] {ipd_prompt} [/INST]", max_tokens=512, echo=True)
-                    out = output['choices'][0]['text']
-                    ipd = out[out.find('[/INST]') + 7:out.find('</s>')]
-                    ipds[params[0]] = ipd.strip()
-                except Exception:
-                    pass
-
-
-            for parameter in selected_operation["parameters"]:
-                for _param in params:
-                    if _param in parameter['description'] and _param != parameter['name']:
-                        try:
-                            ipd_prompt = f"Find Inter-parameter Dependency for the parameter below\nname:{parameter['name']}\ndescription:{parameter['description']}"
-                            output = llama_ipd(f"<s>[INST] {ipd_prompt} [/INST]", max_tokens=512, echo=True)
-                            out = output['choices'][0]['text']
-                            ipd = out[out.find('[/INST]') + 7:out.find('</s>')]
-                            ipds[parameter['name']] = ipd.strip()
-                            break
-                        except Exception:
-                            pass
-                if 'enum' in parameter:
-                    values[parameter['name']] = parameter['enum']
-                elif 'type' in parameter and parameter['type'] == 'boolean':
-                    values[parameter['name']] = [True, False]
-                elif parameter['name'] in ex_success:
-                    values[parameter['name']] = ex_success[parameter['name']]
-                else:
-                    try:
-                        if 'default' in parameter:
-                            ex_prompt = f"Find example values for the parameter below in a list format\nname: {parameter['name']}\ndescription: {parameter['description']}\ndefault value: {parameter['default']}"
-                        else:
-                            ex_prompt = f"Find example values for the parameter below in a list format\nname: {parameter['name']}\ndescription: {parameter['description']}"
-                        output = llama_ex(f"<s>[INST] {ex_prompt} [/INST]", max_tokens=512)
-                        out = output['choices'][0]['text']
-                        out = out[:out.find('</s>')]
-                        out = json.loads(out.replace("'", '"'))
-                        if type(out) == list and type(out[0]) == list:
-                            out = out[0]
-                        values[parameter['name']] = out
-                    except Exception as e:
-                        if 'schema' in parameter:
-                            out = [generate_random_value(parameter['schema'])]
-                        else:
-                            out = [generate_random_value(parameter)]
-                        values[parameter['name']] = out
-
-            if count >= 1 and params[0] not in ex_success:
-                try:
-                    ex_prompt = f"Find example values for the parameter below in a list format\nname: {params[0]}\ndescription: {response.text}"
-                    output = llama_ex(f"<s>[INST] {ex_prompt} [/INST]", max_tokens=512)
-                    out = output['choices'][0]['text']
-                    out = out[out.find('[/INST]') + 7:out.find('</s>')]
-                    out = json.loads(out.replace("'", '"'))
-                    if type(out) == list:
-                        if type(out[0]) == list:
-                            out = out[0]
-                        values[params[0]].extend(out)
-                except Exception as e:
-                    pass
+def request_fingerprint(request):
+    selected_operation, selected_parameters = request
+    return templates[selected_operation['operation_id']].fingerprint(selected_operation['method'],
+                                                                     selected_parameters)
 
 
-            send_all(selected_operation, ipds, values)
-    print(op_counter)
-    return response
+def request_varies(request):
+    # An operation without parameters always makes the same request, so resampling it is pointless
+    return bool(templates[request[0]['operation_id']].params)
 
 
 def get_mutated_value(param_type):
@@ -803,6 +761,9 @@ def initialize_q_learning(operations, parameters_frequency):
 
 def update_q_table2(q_table, alpha, gamma, selected_operation, selected_parameters, response):
     operation_id = selected_operation['operation_id']
+    if response is not None and response.status_code == 429:
+        # Throttling says nothing about the request; http_pool has already waited and retried
+        return
     if response is None:
         reward = -10
         q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
@@ -859,6 +820,9 @@ def update_q_table2(q_table, alpha, gamma, selected_operation, selected_paramete
 
 def update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response):
     operation_id = selected_operation['operation_id']
+    if response is not None and response.status_code == 429:
+        # Throttling says nothing about the request; http_pool has already waited and retried
+        return
     if response is None:
         reward = -10
         q_value[operation_id][ss[0]] = q_value[operation_id][ss[0]] - 1
@@ -921,7 +885,8 @@ def adapt_testing_strategy(iteration, max_iterations_without_improvement):
 def select_operations_and_parameters(operations, parameter_values, q_table):
     method_priority = {'post': 5}
 
-    sorted_operations = sorted(operations, key=lambda op: (
+    # Operations whose requests keep timing out sit out until their circuit closes
+    sorted_operations = sorted(latency.available(operations), key=lambda op: (
         (sum(q_table[op['operation_id']].values()) / len(q_table[op['operation_id']])) if len(
             q_table[op['operation_id']]) > 0 else 0,
         method_priority.get(op['method'], 0)), reverse=True)
@@ -1147,6 +1112,7 @@ def parse_oas(spec):
 def main():
     start_time = time.time()
     time_limit = 3600
+    scheduler.start(time_limit)
     iteration = 0
     max_iterations_without_improvement = 10
 
@@ -1154,30 +1120,42 @@ def main():
         elapsed_time = time.time() - start_time
         if elapsed_time >= time_limit:
             break
+        feedback.apply_results()
+        telemetry.flush()
+        latency.flush()
         parameter_values = generate_parameter_values(operations)
         selected_operation, selected_parameters = select_operations_and_parameters(operations, parameter_values,
                                                                                    q_table)
-
-        # Run all producer operations if the selected_operation is a consumer operation
-        if selected_operation['operation_id'] in consumer:
-            for pname in consumer[selected_operation['operation_id']]:
-                if pname in producer:
-                    for producer_operation_id in producer[pname]:
-                        producer_operation = next(op for op in operations if op['operation_id'] == producer_operation_id)
-                        producer_parameters = generate_parameter_values([producer_operation])[
-                            producer_operation_id]
-
-                        response = execute_operations(base_url, producer_operation, producer_parameters)
-                        if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
-                            try:
-                                extract_response_values(response.json(), producer_operation)
-                            except Exception:
-                                pass
+        # A byte-identical request teaches nothing new; draw fresh parameters for one that was already sent
+        selected_operation, selected_parameters = duplicates.fresh(
+            (selected_operation, selected_parameters), request_fingerprint,
+            lambda request: select_operations_and_parameters([request[0]], generate_parameter_values([request[0]]),
+                                                             q_table), request_varies)
+
+        # Run the producer operations of the selected_operation's inputs whose earlier output is stale or used up
+        wanted = {}
+        for pname in consumer.get(selected_operation['operation_id'], []):
+            for producer_operation_id in producer.get(pname, []):
+                wanted.setdefault(producer_operation_id, []).append(pname)
+        for producer_operation_id, names in wanted.items():
+            if producers.take(producer_operation_id, names):
+                continue
+            producer_operation = operations_by_id[producer_operation_id]
+            producer_parameters = generate_parameter_values([producer_operation])[producer_operation_id]
+
+            response = execute_operations(base_url, producer_operation, producer_parameters)
+            if response is not None and 200 <= response.status_code < 300:
+                producers.store(producer_operation_id, names)
+            if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
+                try:
+                    extract_response_values(response_json(response), producer_operation)
+                except Exception:
+                    pass
 
         response = execute_operations(base_url, selected_operation, selected_parameters)
         if (selected_operation['method'] in ["post", "get"]) and response and 200 <= response.status_code < 300:
             try:
-                extract_response_values(response.json(), selected_operation)
+                extract_response_values(response_json(response), selected_operation)
             except Exception:
                 pass
         update_q_table(q_table, alpha, gamma, selected_operation, selected_parameters, response)
@@ -1185,18 +1163,39 @@ def main():
         copied_operation = copy.deepcopy(selected_operation)
         copied_parameters = copy.deepcopy(selected_parameters)
         mutated_params, mutated_ops= perform_parameter_mutation(copied_parameters, copied_operation)
-        execute_operations(base_url, mutated_ops, mutated_params)
+        mutated_response = execute_operations(base_url, mutated_ops, mutated_params)
+        # Resources the producers made for these inputs may be gone or changed after a DELETE or PUT
+        producers.observe(selected_operation['method'], consumer.get(selected_operation['operation_id'], []),
+                          response)
+        producers.observe(mutated_ops['method'], consumer.get(selected_operation['operation_id'], []),
+                          mutated_response)
 
 
         adapt_testing_strategy(iteration, max_iterations_without_improvement)
         iteration += 1
+    print(f"[llm_router] ex: {llama_ex.summary()} ipd: {llama_ipd.summary()}")
+    print(f"[llm_models] {models.report()}")
+    print(f"[llm_scheduler] {scheduler.summary()}")
+    print(f"[media_types] {cached_media_type.summary()}")
+    print(f"[latency] {latency.summary()}")
+    print(f"[request_filter] {duplicates.summary()}")
+    print(f"[producer_cache] {producers.summary()}")
+    print(f"[http_pool] throttled: {http_pool.report()}")
+    telemetry.flush(force=True)
+    latency.flush(force=True)
 
 if __name__ == "__main__":
-    llama_ex = Llama(model_path="../../../ex.gguf")
-    llama_ipd = Llama(model_path="../../../ipd.gguf")
+    llama_ex = load_router("../../../ex.gguf", 'LLAMA_EX_MODELS', kind='ex')
+    llama_ipd = load_router("../../../ipd.gguf", 'LLAMA_IPD_MODELS', kind='ipd')
     base_url = sys.argv[2]
     EPSILON = [0.1]
     threshold = {}
+    error_analyses = {}
+    scheduler = load_scheduler()
+    llama_ex.scheduler = llama_ipd.scheduler = scheduler
+    telemetry = load_telemetry()
+    llama_ex.telemetry = llama_ipd.telemetry = telemetry
+    feedback = FeedbackWorker(maxsize=int(os.environ.get('LLAMA_FEEDBACK_QUEUE', 8)), scheduler=scheduler)
     ss = [None]
     ex_success = {}
     key_matched = {}
@@ -1205,7 +1204,10 @@ if __name__ == "__main__":
     post_produced = {}
     previous_request = {}
     response_values = {}
-    cached_media_type = {}
+    cached_media_type = load_media_types()
+    latency = load_latency()
+    duplicates = load_duplicate_filter()
+    producers = load_producer_cache()
     q_table_param_values = {}
     producer = {}
     consumer = {}
@@ -1215,7 +1217,10 @@ if __name__ == "__main__":
     openapi_spec_file = sys.argv[1]
     openapi_spec = prance.ResolvingParser(openapi_spec_file).specification
     operations, parameters_frequency = analyze_information(openapi_spec)
+    operations_by_id = {op['operation_id']: op for op in operations}
     parse_oas(openapi_spec)
+    templates = compile_templates(operations2)
+    attach_pack(openapi_spec_file, llama_ex, llama_ipd)
 
     alpha, gamma, q_table = initialize_q_learning(operations, parameters_frequency)
     main()
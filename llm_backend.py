@@ -0,0 +1,271 @@
+import os
+import time
+import uuid
+import ctypes
+from llm_cache import CompletionCache, CachedLlama, DEFAULT_MAX_BYTES
+from llm_models import LazyLlama, model_kwargs, models
+from llm_prompt import EX_INSTRUCTION, IPD_INSTRUCTION
+
+
+# LLAMA_CACHE_PATH: completion cache file (default: llm_cache.sqlite next to the model)
+# LLAMA_CACHE_MAX_MB: size budget of the completion cache
+# LLAMA_CACHE=0: disable the completion cache
+# LLAMA_SERVER: unix:<path> or <host>:<port> of a running llm_server.py to use instead of loading the model
+# LLAMA_N_CTX: context window shared by the sequences of a batch (default: llama.cpp's 512)
+_caches = {}
+
+# Fixed instruction prefixes of the EX and IPD prompts; their KV state is computed once and restored per call
+PROMPT_PREFIXES = (f"<s>[INST] {EX_INSTRUCTION}\n", f"<s>[INST] {IPD_INSTRUCTION}\n")
+
+
+def get_cache(model_path):
+    path = os.environ.get('LLAMA_CACHE_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(model_path)), 'llm_cache.sqlite')
+    if path not in _caches:
+        max_mb = os.environ.get('LLAMA_CACHE_MAX_MB')
+        max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+        _caches[path] = CompletionCache(path, max_bytes=max_bytes)
+    return _caches[path]
+
+
+def completion_response(model_name, text, finish_reason, n_prompt, n_completion):
+    # Same shape as Llama.create_completion so call sites can treat both alike
+    return {
+        "id": f"cmpl-{uuid.uuid4()}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": model_name,
+        "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": n_prompt, "completion_tokens": n_completion,
+                  "total_tokens": n_prompt + n_completion},
+    }
+
+
+class LocalLlama:
+    """In-process Llama model with multi-sequence batched decoding for prompt lists."""
+
+    def __init__(self, model, model_path):
+        self.model = model
+        self.model_path = model_path
+        self._grammars = {}
+        self._prefix_states = {}
+
+    def _restore_prefix(self, prompt):
+        import llama_cpp
+
+        llm = self.model
+        prefix = next((p for p in PROMPT_PREFIXES if prompt.startswith(p)), None)
+        if prefix is None:
+            return
+        if prefix not in self._prefix_states:
+            tokens = llm.tokenize(prefix.encode('utf-8'), special=True)
+            llm.reset()
+            llm.eval(tokens)
+            # Only the KV cells and token ids are kept: Llama.load_state would also copy back the
+            # n_ctx x n_vocab scores matrix, which generate does not need for an unfinished prompt
+            size = llama_cpp.llama_get_state_size(llm._ctx.ctx)
+            buf = (ctypes.c_uint8 * size)()
+            n_bytes = llama_cpp.llama_copy_state_data(llm._ctx.ctx, buf)
+            self._prefix_states[prefix] = (tokens, bytes(buf[:n_bytes]))
+        tokens, state = self._prefix_states[prefix]
+        if llm.n_tokens >= len(tokens) and list(llm.input_ids[:len(tokens)]) == tokens:
+            return
+        data = (ctypes.c_uint8 * len(state)).from_buffer_copy(state)
+        llama_cpp.llama_set_state_data(llm._ctx.ctx, data)
+        llm.input_ids[:len(tokens)] = tokens
+        llm.n_tokens = len(tokens)
+
+    def __call__(self, prompt, grammar=None, timeout=None, **kwargs):
+        # Grammars travel as GBNF text so they can be cached and sent to the daemon
+        if isinstance(grammar, str):
+            from llama_cpp import LlamaGrammar
+            if grammar not in self._grammars:
+                self._grammars[grammar] = LlamaGrammar.from_string(grammar, verbose=False)
+            grammar = self._grammars[grammar]
+        # Llama.generate reuses the longest cached token prefix, so only the parameter-specific suffix is prefilled
+        self._restore_prefix(prompt)
+        if timeout is None:
+            return self.model(prompt, grammar=grammar, **kwargs)
+        from llama_cpp import StoppingCriteriaList
+
+        deadline = time.time() + timeout
+        expired = []
+
+        def out_of_time(input_ids, logits):
+            if time.time() < deadline:
+                return False
+            expired.append(True)
+            return True
+
+        criteria = StoppingCriteriaList([out_of_time] + list(kwargs.pop('stopping_criteria', None) or []))
+        output = self.model(prompt, grammar=grammar, stopping_criteria=criteria, **kwargs)
+        if expired:
+            output['choices'][0]['finish_reason'] = 'timeout'
+        return output
+
+    def create_batch(self, prompts, max_tokens=16, temperature=0.8, top_p=0.95, min_p=0.05, top_k=40,
+                     repeat_penalty=1.1, echo=False, stop=None, seed=None, grammar=None, timeout=None):
+        """Complete every prompt, decoding as many sequences per llama_decode call as the context fits."""
+        from llama_cpp._internals import _LlamaBatch
+
+        llm = self.model
+        n_ctx = llm.n_ctx()
+        stop = [stop] if isinstance(stop, str) else (stop or [])
+        if seed is not None:
+            llm.set_seed(seed)
+
+        jobs = []
+        for prompt in prompts:
+            tokens = llm.tokenize(prompt.encode('utf-8'), special=True)
+            limit = n_ctx - len(tokens) if max_tokens is None or max_tokens <= 0 else max_tokens
+            # A prompt that does not fit the context yields an empty completion instead of failing the batch
+            jobs.append({'prompt': prompt, 'tokens': tokens, 'limit': max(0, min(limit, n_ctx - len(tokens)))})
+
+        # Pack sequences so that their prompts plus generation budgets share one KV cache
+        groups, group, used = [], [], 0
+        for job in jobs:
+            need = len(job['tokens']) + job['limit'] if job['limit'] else 0
+            if group and (used + need > n_ctx or len(group) >= llm.n_batch):
+                groups.append(group)
+                group, used = [], 0
+            group.append(job)
+            used += need
+        if group:
+            groups.append(group)
+
+        deadline = time.time() + timeout if timeout is not None else None
+        batch = _LlamaBatch(n_tokens=llm.n_batch, embd=0, n_seq_max=1)
+        try:
+            for group in groups:
+                self._decode_group(group, batch, stop, grammar, deadline, dict(
+                    temp=temperature, top_p=top_p, min_p=min_p, top_k=top_k, penalty_repeat=repeat_penalty))
+        finally:
+            # Leave the context empty so the next single-prompt call does not prefix-match stale state
+            llm._ctx.kv_cache_clear()
+            llm.n_tokens = 0
+
+        outputs = []
+        for job in jobs:
+            text = job['text']
+            outputs.append(completion_response(llm.model_path, job['prompt'] + text if echo else text,
+                                               job['finish_reason'], len(job['tokens']), len(job['generated'])))
+        return outputs
+
+    def _decode_group(self, group, batch, stop, grammar, deadline, sampling):
+        from llama_cpp import LlamaGrammar
+        from llama_cpp._internals import _LlamaSamplingContext, _LlamaSamplingParams
+
+        llm = self.model
+        ctx = llm._ctx
+        eos = llm.token_eos()
+        ctx.kv_cache_clear()
+        for seq_id, job in enumerate(group):
+            job['seq_id'] = seq_id
+            # Grammar state advances with every accepted token, so each sequence needs its own
+            job['sampler'] = _LlamaSamplingContext(
+                params=_LlamaSamplingParams(**sampling),
+                grammar=LlamaGrammar.from_string(grammar, verbose=False) if grammar else None)
+            job['sampler'].prev = list(job['tokens'])
+            job['generated'] = []
+            job['text'] = ''
+            job['finish_reason'] = 'length'
+            job['done'] = job['limit'] <= 0
+
+        def decode(entries):
+            # entries: (job, token, pos, wants_logits); returns the batch index of every logit row
+            batch.reset()
+            b = batch.batch
+            rows = []
+            for i, (job, token, pos, wants_logits) in enumerate(entries):
+                b.token[i] = token
+                b.pos[i] = pos
+                b.seq_id[i][0] = job['seq_id']
+                b.n_seq_id[i] = 1
+                b.logits[i] = wants_logits
+                if wants_logits:
+                    rows.append((job, i))
+            b.n_tokens = len(entries)
+            ctx.decode(batch)
+            return rows
+
+        def accept(job, idx):
+            token = job['sampler'].sample(ctx_main=ctx, idx=idx)
+            if token == eos:
+                job['finish_reason'] = 'stop'
+                job['done'] = True
+                return
+            job['sampler'].accept(ctx_main=ctx, id=token, apply_grammar=True)
+            job['generated'].append(token)
+            text = llm.detokenize(job['generated'], prev_tokens=job['tokens']).decode('utf-8', errors='ignore')
+            hit = [s for s in stop if s in text]
+            if hit:
+                job['text'] = text[:text.index(hit[0])]
+                job['finish_reason'] = 'stop'
+                job['done'] = True
+                return
+            job['text'] = text
+            if len(job['generated']) >= job['limit']:
+                job['done'] = True
+
+        def out_of_time():
+            if deadline is None or time.time() < deadline:
+                return False
+            for job in group:
+                if not job['done']:
+                    job['finish_reason'] = 'timeout'
+                    job['done'] = True
+            return True
+
+        if out_of_time():
+            return
+
+        # Prefill the prefix the prompts share once and copy its KV cells to the other sequences
+        active = [job for job in group if not job['done']]
+        shared = 0
+        if len(active) > 1:
+            shared = min(len(os.path.commonprefix([job['tokens'] for job in active])),
+                         min(len(job['tokens']) for job in active) - 1)
+            prefix = [(active[0], token, pos, False) for pos, token in enumerate(active[0]['tokens'][:shared])]
+            for start in range(0, shared, llm.n_batch):
+                decode(prefix[start:start + llm.n_batch])
+            for job in active[1:]:
+                ctx.kv_cache_seq_cp(active[0]['seq_id'], job['seq_id'], 0, shared)
+
+        # Prefill the rest of every prompt, n_batch tokens per decode, sampling each sequence once its prompt is in
+        pending = [(job, token, pos, pos == len(job['tokens']) - 1)
+                   for job in active for pos, token in enumerate(job['tokens']) if pos >= shared]
+        for start in range(0, len(pending), llm.n_batch):
+            for job, idx in decode(pending[start:start + llm.n_batch]):
+                accept(job, idx)
+
+        # Then advance all unfinished sequences one token per decode
+        while not out_of_time():
+            active = [job for job in group if not job['done']]
+            if not active:
+                break
+            entries = [(job, job['generated'][-1], len(job['tokens']) + len(job['generated']) - 1, True)
+                       for job in active]
+            for job, idx in decode(entries):
+                accept(job, idx)
+
+
+def load_model(model_path, local=False, **kwargs):
+    server = os.environ.get('LLAMA_SERVER')
+    if server and not local:
+        # The daemon applies its own completion cache, so the client is used as is
+        from llm_server import RemoteLlama, model_name
+        return RemoteLlama(server, model_name(model_path))
+
+    if os.environ.get('LLAMA_N_CTX') and 'n_ctx' not in kwargs:
+        kwargs['n_ctx'] = int(os.environ['LLAMA_N_CTX'])
+    kwargs = {**model_kwargs(), **kwargs}
+
+    def loader():
+        from llama_cpp import Llama
+        return LocalLlama(Llama(model_path=model_path, **kwargs), model_path)
+
+    # Loaded on the first completion the cache cannot answer
+    model = LazyLlama(models, model_path, loader)
+    if os.environ.get('LLAMA_CACHE', '1') == '0':
+        return model
+    return CachedLlama(model, model_path, get_cache(model_path))
@@ -0,0 +1,184 @@
+import os
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CompletionCache:
+    """Persistent completion store shared by every tool process on the host.
+
+    Entries live in a single SQLite file (WAL mode, so concurrent readers and
+    writers from several processes are safe) as zlib-compressed JSON. When the
+    stored payload grows past max_bytes the least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions(last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS model_digests ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, digest TEXT NOT NULL)")
+
+    def model_digest(self, model_path):
+        # Hashing a multi-GB model takes seconds, so the digest is memoised per (path, size, mtime)
+        path = os.path.abspath(model_path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime, digest FROM model_digests WHERE path = ?",
+                                     (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        digest = file_digest(path)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO model_digests VALUES (?, ?, ?, ?)",
+                               (path, stat.st_size, stat.st_mtime, digest))
+        return digest
+
+    @staticmethod
+    def make_key(model_digest, prompt, params):
+        payload = json.dumps([model_digest, prompt, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error:
+                return None
+        try:
+            return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+        except (zlib.error, ValueError):
+            return None
+
+    def put(self, key, value):
+        blob = zlib.compress(json.dumps(value).encode('utf-8'))
+        with self._lock:
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                                   (key, blob, len(blob), time.time()))
+                self._evict()
+            except sqlite3.Error:
+                pass
+
+    def delete(self, key):
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            except sqlite3.Error:
+                pass
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the budget so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, size in self._conn.execute(
+                    "SELECT key, size FROM completions ORDER BY last_used").fetchall():
+                if total <= target:
+                    break
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                total -= size
+            self._conn.execute("COMMIT")
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedLlama:
+    """Callable stand-in for a Llama model that answers repeated prompts from a CompletionCache.
+
+    Completions are sampled, so one the caller could not use is dropped with
+    reject(): the next call with that prompt samples again instead of being
+    answered with the same output in this and every later run.
+    """
+
+    def __init__(self, model, model_path, cache):
+        self.model = model
+        self.model_path = model_path
+        self.cache = cache
+        self._model_digest = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model_digest(self):
+        # Hashed on the first call, so a tier that never answers is never read; two threads may both hash it once
+        if self._model_digest is None:
+            self._model_digest = self.cache.model_digest(self.model_path)
+        return self._model_digest
+
+    def __call__(self, prompt, timeout=None, **kwargs):
+        if kwargs.get('stream'):
+            return self.model(prompt, timeout=timeout, **kwargs)
+        # The timeout only bounds how long a completion may take, so it is not part of the key
+        key = self.cache.make_key(self.model_digest, prompt, kwargs)
+        output = self.cache.get(key)
+        if output is not None:
+            self.hits += 1
+            return dict(output, cached=True)
+        self.misses += 1
+        output = self.model(prompt, timeout=timeout, **kwargs)
+        if output['choices'][0].get('finish_reason') != 'timeout':
+            self.cache.put(key, output)
+        return output
+
+    def create_batch(self, prompts, timeout=None, **kwargs):
+        outputs = {}
+        missing = []
+        for prompt in prompts:
+            if prompt in outputs or prompt in missing:
+                continue
+            output = self.cache.get(self.cache.make_key(self.model_digest, prompt, kwargs))
+            if output is not None:
+                self.hits += 1
+                outputs[prompt] = dict(output, cached=True)
+            else:
+                missing.append(prompt)
+        if missing:
+            self.misses += len(missing)
+            for prompt, output in zip(missing, self.model.create_batch(missing, timeout=timeout, **kwargs)):
+                if output['choices'][0].get('finish_reason') != 'timeout':
+                    self.cache.put(self.cache.make_key(self.model_digest, prompt, kwargs), output)
+                outputs[prompt] = output
+        return [outputs[prompt] for prompt in prompts]
+
+    def reject(self, prompt, timeout=None, **kwargs):
+        """Drop the cached completion of prompt under kwargs, as its caller could not use it."""
+        self.cache.delete(self.cache.make_key(self.model_digest, prompt, kwargs))
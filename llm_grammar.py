@@ -0,0 +1,77 @@
+import ast
+import json
+
+
+# GBNF grammars for constrained decoding of the EX and IPD models. Sampling is
+# restricted to tokens that keep the output inside the grammar, and once the
+# structure closes only EOS is allowed, so generation ends right there.
+
+# A flat list of at most 10 scalars. Single-quoted strings are kept since that
+# is what the EX model was fine-tuned to produce.
+EX_GRAMMAR = r'''
+root      ::= "[" value ( ", " value ( ", " value ( ", " value ( ", " value ( ", " value ( ", " value ( ", " value ( ", " value ( ", " value )? )? )? )? )? )? )? )? )? "]"
+value     ::= sq-string | dq-string | number | "true" | "false" | "null" | "True" | "False" | "None"
+sq-string ::= "'" [^'\\\n]* "'"
+dq-string ::= "\"" ( [^"\\\n] | "\\" ["\\/bfnrt] )* "\""
+number    ::= "-"? [0-9]+ ( "." [0-9]+ )? ( [eE] [-+]? [0-9]+ )?
+'''
+
+# A single IDL-style rule in the forms send_all/send_optional parse:
+#   Or(a, b)  OnlyOne(a, b)  AllOrNone(a, b)  ZeroOrOne(a, b)
+#   REQUIRED: a, b
+#   IF a == 'x' THEN b;
+IPD_GRAMMAR = r'''
+root        ::= ( group | required | conditional ) ";"?
+group       ::= ( "Or" | "OnlyOne" | "AllOrNone" | "ZeroOrOne" ) "(" name ", " name ")"
+required    ::= "REQUIRED: " name ", " name
+conditional ::= "IF " term " THEN " term
+term        ::= name ( " == '" [^'\n]* "'" )?
+name        ::= [A-Za-z_$] [A-Za-z0-9_.$\[\]-]*
+'''
+
+EX_PARAMS = {'grammar': EX_GRAMMAR, 'stop': ['</s>', '[INST]'], 'max_tokens': 160}
+IPD_PARAMS = {'grammar': IPD_GRAMMAR, 'stop': ['</s>', '\n'], 'max_tokens': 64}
+
+
+def completion_text(output):
+    out = output['choices'][0]['text']
+    if '</s>' in out:
+        out = out[:out.find('</s>')]
+    return out.strip()
+
+
+def parse_ex(output):
+    """Return the example values of an EX completion as a list, or None."""
+    out = completion_text(output)
+    start, end = out.find('['), out.rfind(']')
+    if start >= 0:
+        out = out[start:end + 1] if end > start else out[start:]
+    candidates = [out]
+    if out.startswith('[') and ',' in out:
+        # Salvage the complete items of a list cut off by the token cap
+        candidates.append(out[:out.rfind(',')] + ']')
+    for candidate in candidates:
+        for loads in (json.loads, ast.literal_eval, lambda s: json.loads(s.replace("'", '"'))):
+            try:
+                values = loads(candidate)
+            except Exception:
+                continue
+            if type(values) == list and values:
+                if type(values[0]) == list:
+                    values = values[0]
+                return values
+    return None
+
+
+def parse_ipd(output):
+    """Return the rule of an IPD completion, or None if it is empty."""
+    out = completion_text(output)
+    return out or None
+
+
+def ex_accepted(output):
+    return parse_ex(output) is not None
+
+
+def ipd_accepted(output):
+    return parse_ipd(output) is not None
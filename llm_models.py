@@ -0,0 +1,151 @@
+import gc
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# LLAMA_MEM_BUDGET_MB: memory the loaded models may take together; least recently used ones are unloaded beyond it
+# LLAMA_MMAP=0: read the weights into memory instead of mapping the model file
+# LLAMA_MLOCK=1: lock the weights in RAM (needs a large enough memlock ulimit)
+MB = 1024 * 1024
+
+
+def resident_memory():
+    """Resident set size of this process in bytes, or None where /proc is not available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def model_kwargs():
+    return {'use_mmap': os.environ.get('LLAMA_MMAP', '1') != '0',
+            'use_mlock': os.environ.get('LLAMA_MLOCK', '0') == '1'}
+
+
+class ModelManager:
+    """Loads models on first use and keeps the loaded ones within a memory budget.
+
+    A model's footprint is its weights plus its context state, estimated from
+    the file size until it is loaded. When a load would exceed the budget the
+    least recently used models that are not in use are unloaded first; a model
+    that does not fit even then is loaded anyway. A load does not hold up
+    callers of models that are already loaded, and concurrent callers of the
+    model being loaded wait for that one load.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.loaded = OrderedDict()
+        self.loading = {}
+        self.footprints = {}
+        self.in_use = {}
+        self.loads = 0
+        self.unloads = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, needed, keep):
+        # Models still loading count with their estimated footprint
+        used = sum(self.footprints[path] for path in list(self.loaded) + list(self.loading))
+        for path in list(self.loaded):
+            if used + needed <= self.budget:
+                break
+            if path == keep or self.in_use.get(path):
+                continue
+            del self.loaded[path]
+            used -= self.footprints[path]
+            self.unloads += 1
+            gc.collect()
+            print(f"[llm_models] unloaded {os.path.basename(path)} ({self._memory()})")
+
+    def _acquire(self, path, loader):
+        # The lock is only held for bookkeeping: a load runs outside it, and other callers for the same
+        # model wait on its event while lookups of loaded models go on
+        while True:
+            with self._lock:
+                if path in self.loaded:
+                    self.loaded.move_to_end(path)
+                    self.in_use[path] = self.in_use.get(path, 0) + 1
+                    return self.loaded[path]
+                loading = self.loading.get(path)
+                if loading is None:
+                    loading = self.loading[path] = threading.Event()
+                    self.footprints[path] = self.footprints.get(path) or os.path.getsize(path)
+                    if self.budget:
+                        self._evict(0, path)
+                    break
+            loading.wait()
+        try:
+            model = loader()
+            size = footprint(model, path)
+        except BaseException:
+            with self._lock:
+                del self.loading[path]
+            loading.set()
+            raise
+        with self._lock:
+            del self.loading[path]
+            self.loaded[path] = model
+            self.footprints[path] = size
+            self.loads += 1
+            self.in_use[path] = self.in_use.get(path, 0) + 1
+            if self.budget:
+                self._evict(0, path)
+        loading.set()
+        print(f"[llm_models] loaded {os.path.basename(path)} ({size // MB} MB, {self._memory()})")
+        return model
+
+    @contextmanager
+    def use(self, path, loader):
+        model = self._acquire(path, loader)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self.in_use[path] -= 1
+
+    def _memory(self):
+        rss = resident_memory()
+        return f"rss {rss // MB} MB" if rss is not None else "rss unknown"
+
+    def report(self):
+        rss = resident_memory()
+        return {'loaded': {os.path.basename(path): self.footprints[path] // MB for path in self.loaded},
+                'loads': self.loads, 'unloads': self.unloads,
+                'rss_mb': rss // MB if rss is not None else None,
+                'budget_mb': self.budget // MB if self.budget else None}
+
+
+def footprint(model, path):
+    try:
+        import llama_cpp
+        llm = model.model
+        return llm._model.size() + llama_cpp.llama_get_state_size(llm._ctx.ctx)
+    except Exception:
+        return os.path.getsize(path)
+
+
+class LazyLlama:
+    """Stand-in for a LocalLlama that is only loaded, through a ModelManager, when a completion is needed."""
+
+    def __init__(self, manager, model_path, loader):
+        self.manager = manager
+        self.model_path = model_path
+        self.loader = loader
+
+    def __call__(self, prompt, **kwargs):
+        with self.manager.use(self.model_path, self.loader) as model:
+            return model(prompt, **kwargs)
+
+    def create_batch(self, prompts, **kwargs):
+        with self.manager.use(self.model_path, self.loader) as model:
+            return model.create_batch(prompts, **kwargs)
+
+
+budget_mb = os.environ.get('LLAMA_MEM_BUDGET_MB')
+models = ModelManager(int(float(budget_mb) * MB) if budget_mb else None)
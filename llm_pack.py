@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Offline EX/IPD knowledge-pack builder.
+
+Runs the EX and IPD prompts the tools ask about the parameters of a
+specification ahead of time, on a process pool, and stores the completions in
+a pack keyed by the spec hash and the model hash. llama.py and llamarest*.py
+load the matching pack at startup and answer those prompts from it, so a
+campaign of many runs per API pays for the inference once.
+
+Usage:
+    python3 llm_pack.py --ex ex.gguf --ipd ipd.gguf specs/swagger/fdic.yaml
+    python3 llm_pack.py --workers 4 specs/openapi/*.yaml
+
+The model options take the same comma-separated tier lists as
+LLAMA_EX_MODELS / LLAMA_IPD_MODELS, which they default to.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from llm_cache import file_digest
+from llm_backend import get_cache
+from llm_grammar import EX_PARAMS, IPD_PARAMS, ex_accepted, ipd_accepted
+from llm_prompt import ex_prompt, ipd_prompt
+from llm_router import load_router, tier_paths
+
+
+# LLAMA_PACK: pack file to use regardless of the model hash, or 0 to never use one
+# LLAMA_PACK_DIR: where packs are written and looked up (default: llm_packs next to the EX model)
+PACK_VERSION = 1
+
+
+def spec_digest(spec_path):
+    return file_digest(spec_path)
+
+
+def model_digest(ex_paths, ipd_paths):
+    # The sampling parameters and grammars are part of what a pack answers; model digests are memoised by the cache
+    payload = json.dumps({'ex': [get_cache(path).model_digest(path) for path in ex_paths],
+                          'ipd': [get_cache(path).model_digest(path) for path in ipd_paths],
+                          'ex_params': EX_PARAMS, 'ipd_params': IPD_PARAMS}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def pack_dir(ex_paths):
+    return os.environ.get('LLAMA_PACK_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(ex_paths[0])), 'llm_packs')
+
+
+def pack_path(directory, spec_hash, model_hash):
+    return os.path.join(directory, f"{spec_hash[:16]}-{model_hash[:16]}.v{PACK_VERSION}.json.gz")
+
+
+def spec_operations(spec):
+    for path, path_data in spec['paths'].items():
+        for method, operation_data in path_data.items():
+            if method in ['get', 'post', 'put', 'delete', 'patch']:
+                yield operation_data.get('parameters', [])
+
+
+def spec_prompts(spec):
+    """EX and IPD prompts of every parameter, as built by llama.py's ex_prompts/ipd_prompts
+    and the description-based prompts of llamarest*.py's analyze_error_response."""
+    ex, ipd = [], []
+    for parameters in spec_operations(spec):
+        names = [parameter['name'] for parameter in parameters]
+        for parameter in parameters:
+            if 'description' not in parameter:
+                continue
+            name, description = parameter['name'], parameter['description']
+            if 'type' in parameter:
+                ex.append(ex_prompt(name, description, 'type', parameter['type']))
+            if 'default' in parameter:
+                ex.append(ex_prompt(name, description, 'default value', parameter['default']))
+            elif 'enum' not in parameter and parameter.get('type') != 'boolean':
+                ex.append(ex_prompt(name, description))
+            if any(param != name and param in description for param in names):
+                ipd.append(ipd_prompt(name, description))
+    return list(dict.fromkeys(ex)), list(dict.fromkeys(ipd))
+
+
+_routers = {}
+
+
+def _init_worker(ex_models, ipd_models, n_threads):
+    os.environ['LLAMA_EX_MODELS'] = ex_models
+    os.environ['LLAMA_IPD_MODELS'] = ipd_models
+    # Models load on the first prompt, so a worker that only gets IPD prompts never loads the EX model
+    _routers['ex'] = load_router(None, 'LLAMA_EX_MODELS', n_threads=n_threads, verbose=False)
+    _routers['ipd'] = load_router(None, 'LLAMA_IPD_MODELS', n_threads=n_threads, verbose=False)
+
+
+def _complete(kind, prompts):
+    if kind == 'ex':
+        return _routers['ex'].create_batch(prompts, accept=ex_accepted, **EX_PARAMS)
+    return _routers['ipd'].create_batch(prompts, accept=ipd_accepted, **IPD_PARAMS)
+
+
+def build_pack(spec_path, ex_paths, ipd_paths, directory, workers=2, batch_size=8):
+    import prance
+
+    spec = prance.ResolvingParser(spec_path).specification
+    spec_hash, model_hash = spec_digest(spec_path), model_digest(ex_paths, ipd_paths)
+    path = pack_path(directory, spec_hash, model_hash)
+    if os.path.exists(path):
+        print(f"[llm_pack] {spec_path}: {path} is up to date")
+        return path
+
+    ex, ipd = spec_prompts(spec)
+    answers = {'ex': {}, 'ipd': {}}
+    started = time.time()
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(','.join(ex_paths), ','.join(ipd_paths), n_threads)) as pool:
+        futures = {}
+        for kind, prompts in (('ex', ex), ('ipd', ipd)):
+            for start in range(0, len(prompts), batch_size):
+                chunk = prompts[start:start + batch_size]
+                futures[pool.submit(_complete, kind, chunk)] = (kind, chunk)
+        for future in as_completed(futures):
+            kind, chunk = futures[future]
+            try:
+                answers[kind].update(zip(chunk, future.result()))
+            except Exception as e:
+                print(f"[llm_pack] {len(chunk)} {kind} prompts failed: {e}")
+
+    pack = {
+        'version': PACK_VERSION,
+        'spec': os.path.basename(spec_path),
+        'spec_hash': spec_hash,
+        'model_hash': model_hash,
+        'models': {'ex': [os.path.basename(p) for p in ex_paths], 'ipd': [os.path.basename(p) for p in ipd_paths]},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'ex': answers['ex'],
+        'ipd': answers['ipd'],
+    }
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(pack, f)
+    os.replace(tmp, path)
+    print(f"[llm_pack] {spec_path}: {len(answers['ex'])} EX and {len(answers['ipd'])} IPD answers "
+          f"in {time.time() - started:.0f}s -> {path}")
+    return path
+
+
+def read_pack(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        pack = json.load(f)
+    return pack if pack.get('version') == PACK_VERSION else None
+
+
+def attach_pack(spec_path, llama_ex, llama_ipd=None):
+    """Load the pack built for this spec and these models into the routers; returns it, or None.
+
+    A tool without IPD passes no llama_ipd; the pack is then looked up with the
+    IPD models of LLAMA_IPD_MODELS, or the ipd.gguf next to the EX model.
+    """
+    path = os.environ.get('LLAMA_PACK')
+    if path == '0':
+        return None
+    try:
+        spec_hash = spec_digest(spec_path)
+        if not path:
+            ipd_paths = llama_ipd.paths if llama_ipd is not None else tier_paths(
+                os.path.join(os.path.dirname(llama_ex.paths[0]), 'ipd.gguf'), 'LLAMA_IPD_MODELS')
+            path = pack_path(pack_dir(llama_ex.paths), spec_hash, model_digest(llama_ex.paths, ipd_paths))
+            if not os.path.exists(path):
+                return None
+        pack = read_pack(path)
+    except (OSError, ValueError) as e:
+        print(f"[llm_pack] not using a pack: {e}")
+        return None
+    if pack is None or pack['spec_hash'] != spec_hash:
+        print(f"[llm_pack] {path} was built for another spec or pack version")
+        return None
+    llama_ex.pack = pack['ex']
+    if llama_ipd is not None:
+        llama_ipd.pack = pack['ipd']
+    print(f"[llm_pack] using {path} ({len(pack['ex'])} EX and {len(pack['ipd'])} IPD answers)")
+    return pack
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('specs', nargs='+', help='specification files (specs/swagger/*.yaml, specs/openapi/*.yaml)')
+    parser.add_argument('--ex', default=','.join(tier_paths('ex.gguf', 'LLAMA_EX_MODELS')),
+                        help='EX model files, smallest first')
+    parser.add_argument('--ipd', default=','.join(tier_paths('ipd.gguf', 'LLAMA_IPD_MODELS')),
+                        help='IPD model files, smallest first')
+    parser.add_argument('--out', help='pack directory (default: LLAMA_PACK_DIR or llm_packs next to the EX model)')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes, each with its own models')
+    parser.add_argument('--batch', type=int, default=8, help='prompts per task')
+    args = parser.parse_args(argv)
+
+    ex_paths = [path for path in args.ex.split(',') if path]
+    ipd_paths = [path for path in args.ipd.split(',') if path]
+    directory = args.out or pack_dir(ex_paths)
+    failed = 0
+    for spec_path in args.specs:
+        try:
+            build_pack(spec_path, ex_paths, ipd_paths, directory, workers=args.workers, batch_size=args.batch)
+        except Exception as e:
+            failed += 1
+            print(f"[llm_pack] {spec_path}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
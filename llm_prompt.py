@@ -0,0 +1,76 @@
+import os
+import re
+import json
+import html
+
+
+# Server responses are cut to about this many tokens before they go into an EX/IPD prompt
+RESPONSE_TOKENS = int(os.environ.get('LLAMA_RESPONSE_TOKENS', 128))
+CHARS_PER_TOKEN = 4
+
+# Every EX/IPD prompt is built here so llm_pack's prompts match the tools' byte for byte
+EX_INSTRUCTION = "Find example values for the parameter below in a list format"
+IPD_INSTRUCTION = "Find Inter-parameter Dependency for the parameter below"
+
+_BLOCKS = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.S | re.I)
+_TAGS = re.compile(r'<[^>]+>')
+_SENTENCES = re.compile(r'(?<=[.!?;])\s+|\s*\n\s*')
+
+
+def _json_fields(value, path=''):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _json_fields(item, f"{path}.{key}" if path else str(key))
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict) and not any(isinstance(v, (dict, list)) for v in item.values()):
+                # Keep the fields of one validation error together
+                fields = ', '.join(f"{key}={v}" for key, v in item.items())
+                yield f"{path}: {fields}" if path else fields
+            else:
+                yield from _json_fields(item, path)
+    elif value is not None:
+        yield f"{path}: {value}" if path else str(value)
+
+
+def _units(text):
+    try:
+        body = json.loads(text)
+    except ValueError:
+        body = None
+    if isinstance(body, (dict, list)):
+        return list(_json_fields(body)), '; '
+    if '<' in text and '>' in text:
+        text = html.unescape(_TAGS.sub(' ', _BLOCKS.sub(' ', text)))
+    return [unit.strip() for unit in _SENTENCES.split(text) if unit and unit.strip()], ' '
+
+
+def response_excerpt(text, names, max_tokens=None):
+    """Return the sentences or JSON fields of a response that mention any of names, within a token budget."""
+    budget = (RESPONSE_TOKENS if max_tokens is None else max_tokens) * CHARS_PER_TOKEN
+    units, separator = _units(text or '')
+    relevant = [unit for unit in units if any(name in unit for name in names)]
+    excerpt = []
+    used = 0
+    for unit in relevant or units:
+        unit = re.sub(r'\s+', ' ', unit)
+        if used + len(unit) > budget:
+            if not excerpt:
+                excerpt.append(unit[:budget])
+                used = budget
+            continue
+        excerpt.append(unit)
+        used += len(unit) + len(separator)
+    return separator.join(excerpt)
+
+
+def ex_prompt(name, description, field=None, value=None):
+    """Return the EX prompt of a parameter; field and value add a line such as 'type: string'."""
+    prompt = f"{EX_INSTRUCTION}\nname: {name}\ndescription: {description}"
+    if field is not None:
+        prompt += f"\n{field}: {value}"
+    return f"<s>[INST] {prompt} [/INST]"
+
+
+def ipd_prompt(name, description):
+    return f"<s>[INST] {IPD_INSTRUCTION}\nname:{name}\ndescription:{description} [/INST]"
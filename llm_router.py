@@ -0,0 +1,153 @@
+import os
+import time
+from collections import Counter
+from llm_backend import load_model
+from llm_server import model_name
+
+
+# LLAMA_EX_MODELS / LLAMA_IPD_MODELS: comma-separated model files, smallest first
+# (e.g. ex-2b.gguf,ex-8b.gguf). Without them the single default model is used.
+
+
+def timed_out(output):
+    return output['choices'][0].get('finish_reason') == 'timeout'
+
+
+class ModelRouter:
+    """Cascade over model tiers: every prompt goes to the smallest tier first.
+
+    A call escalates to the next tier when accept() rejects the output (or the
+    tier fails), and a key (the parameter name) can be escalated for good when
+    the values its answer produced never led to a 2xx. The last tier's output
+    is returned as is. Each output records the tier that answered in 'tier'.
+    Prompts found in pack (a knowledge pack loaded by llm_pack) are answered
+    from it unless their key has been escalated. With a scheduler every call
+    is held to its timeout and token cap, and a call that timed out is not
+    escalated. With telemetry every tier's answer is recorded, and the id of
+    the record goes back in the output's 'call_id'.
+    """
+
+    def __init__(self, tiers, paths=None, kind=None):
+        self.tiers = tiers
+        self.paths = paths
+        self.kind = kind
+        self.pack = {}
+        self.scheduler = None
+        self.telemetry = None
+        self.start = {}
+        self.answered = Counter()
+        self.escalations = 0
+
+    def _first(self, key):
+        return self.start.get(key, 0) if key is not None else 0
+
+    def _limits(self, kwargs):
+        # Taken per tier so an escalated call only gets the time that is left
+        return self.scheduler.limits(kwargs) if self.scheduler is not None else kwargs
+
+    def can_escalate(self, key):
+        return self._first(key) < len(self.tiers) - 1
+
+    def escalate(self, key):
+        if not self.can_escalate(key):
+            return False
+        self.start[key] = self._first(key) + 1
+        self.escalations += 1
+        return True
+
+    @staticmethod
+    def _reject(model, prompt, params):
+        # A cached output accept() turned down would otherwise answer the prompt again in every run
+        reject = getattr(model, 'reject', None)
+        if reject is not None:
+            reject(prompt, **params)
+
+    def _record(self, tier, output, wall, ok, **fields):
+        if self.telemetry is None:
+            return
+        output['call_id'] = self.telemetry.record(self.kind, tier, output, wall, ok, **fields)
+
+    def __call__(self, prompt, key=None, accept=None, **kwargs):
+        if prompt in self.pack and self._first(key) == 0:
+            self.answered['pack'] += 1
+            output = dict(self.pack[prompt], usage={})
+            self._record('pack', output, 0.0, accept(output) if accept else None)
+            return output
+        last = len(self.tiers) - 1
+        for i in range(self._first(key), last + 1):
+            name, model = self.tiers[i]
+            started = time.time()
+            params = self._limits(kwargs)
+            try:
+                output = model(prompt, **params)
+            except Exception:
+                if i == last:
+                    raise
+                self.escalations += 1
+                continue
+            ok = accept(output) if accept else None
+            self._record(name, output, time.time() - started, ok)
+            if accept is not None and not ok and not timed_out(output):
+                self._reject(model, prompt, params)
+            if i == last or accept is None or timed_out(output) or ok:
+                break
+            self.escalations += 1
+        output['tier'] = name
+        self.answered[name] += 1
+        return output
+
+    def create_batch(self, prompts, keys=None, accept=None, **kwargs):
+        keys = keys or [None] * len(prompts)
+        outputs = [None] * len(prompts)
+        todo = []
+        for j, prompt in enumerate(prompts):
+            if prompt in self.pack and self._first(keys[j]) == 0:
+                self.answered['pack'] += 1
+                outputs[j] = dict(self.pack[prompt], usage={})
+                self._record('pack', outputs[j], 0.0, accept(outputs[j]) if accept else None)
+            else:
+                todo.append(j)
+        last = len(self.tiers) - 1
+        for i, (name, model) in enumerate(self.tiers):
+            if not todo:
+                break
+            ready = [j for j in todo if self._first(keys[j]) <= i]
+            if not ready:
+                continue
+            started = time.time()
+            params = self._limits(kwargs)
+            try:
+                results = model.create_batch([prompts[j] for j in ready], **params)
+            except Exception:
+                if i == last:
+                    raise
+                self.escalations += len(ready)
+                continue
+            # The batch's wall time is shared out over its sequences
+            wall = (time.time() - started) / len(ready)
+            for j, output in zip(ready, results):
+                ok = accept(output) if accept else None
+                self._record(name, output, wall, ok, batch=len(ready))
+                if accept is not None and not ok and not timed_out(output):
+                    self._reject(model, prompts[j], params)
+                if i == last or accept is None or timed_out(output) or ok:
+                    output['tier'] = name
+                    self.answered[name] += 1
+                    outputs[j] = output
+                    todo.remove(j)
+                else:
+                    self.escalations += 1
+        return outputs
+
+    def summary(self):
+        return {'answered': dict(self.answered), 'escalations': self.escalations}
+
+
+def tier_paths(default_path, tiers_env):
+    paths = [path.strip() for path in os.environ.get(tiers_env, '').split(',') if path.strip()]
+    return paths or [default_path]
+
+
+def load_router(default_path, tiers_env, kind=None, **kwargs):
+    paths = tier_paths(default_path, tiers_env)
+    return ModelRouter([(model_name(path), load_model(path, **kwargs)) for path in paths], paths, kind)
@@ -0,0 +1,67 @@
+import os
+import time
+from collections import Counter
+
+
+# LLAMA_TIME_BUDGET: seconds this tool process has in all, when that is shorter than the script's time_limit
+# LLAMA_CALL_TIMEOUT: seconds one EX/IPD completion may take (default 30)
+# LLAMA_MAX_TOKENS: cap on the tokens one completion may generate
+PREPASS, EX, IPD = 0, 1, 2
+PRIORITY_NAMES = {PREPASS: 'pre-pass', EX: 'EX', IPD: 'IPD'}
+
+
+class Scheduler:
+    """Decides which LLM work still fits the run's wall-clock budget.
+
+    Work comes in three priorities: the startup pre-pass, error-driven EX and
+    IPD. A job only starts while the remaining budget covers its reserve, a
+    number of call timeouts that grows as the priority drops, so IPD analyses
+    are the first to go near the end of a run; skipped work is logged and
+    counted. Every completion is limited to the call timeout, never past the
+    deadline, and to max_tokens.
+    """
+
+    RESERVE = {PREPASS: 1, EX: 2, IPD: 4}
+
+    def __init__(self, timeout=30.0, max_tokens=None, budget=None):
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.created = time.time()
+        self.deadline = self.created + budget if budget else None
+        self.dropped = Counter()
+
+    def start(self, time_limit):
+        deadline = time.time() + time_limit
+        self.deadline = min(self.deadline, deadline) if self.deadline else deadline
+
+    def remaining(self):
+        return float('inf') if self.deadline is None else self.deadline - time.time()
+
+    def admit(self, priority, label=''):
+        remaining = self.remaining()
+        if remaining >= self.RESERVE[priority] * self.timeout:
+            return True
+        self.dropped[PRIORITY_NAMES[priority]] += 1
+        what = f"{PRIORITY_NAMES[priority]} {label}" if label else PRIORITY_NAMES[priority]
+        print(f"[llm_scheduler] dropped {what} with {max(remaining, 0):.0f}s left")
+        return False
+
+    def limits(self, kwargs):
+        """Return completion kwargs capped to the token limit and the call timeout."""
+        kwargs = dict(kwargs)
+        if self.max_tokens:
+            kwargs['max_tokens'] = min(kwargs.get('max_tokens') or self.max_tokens, self.max_tokens)
+        kwargs['timeout'] = max(0.0, min(self.timeout, self.remaining()))
+        return kwargs
+
+    def summary(self):
+        return {'dropped': dict(self.dropped),
+                'remaining': round(self.remaining()) if self.deadline is not None else None}
+
+
+def load_scheduler():
+    budget = os.environ.get('LLAMA_TIME_BUDGET')
+    max_tokens = os.environ.get('LLAMA_MAX_TOKENS')
+    return Scheduler(timeout=float(os.environ.get('LLAMA_CALL_TIMEOUT', 30)),
+                     max_tokens=int(max_tokens) if max_tokens else None,
+                     budget=float(budget) if budget else None)
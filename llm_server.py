@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Shared LlamaREST inference daemon.
+
+Loads the EX/IPD models once per host and serves completions to every tool
+process over a Unix socket or a loopback TCP port. Requests and responses are
+single JSON lines:
+
+    {"model": "ex", "prompt": "...", "params": {"max_tokens": 512}}
+    {"model": "ex", "prompts": ["...", "..."], "params": {...}}
+    {"model": "ex", "reject": "...", "params": {...}}   (drops a cached completion)
+    {"output": {...}}  or  {"error": "..."}
+
+Usage:
+    python3 llm_server.py --listen unix:/tmp/llamarest.sock ex.gguf ipd.gguf
+    python3 llm_server.py --listen 127.0.0.1:8765 ex.gguf ipd.gguf
+
+Tool processes connect when LLAMA_SERVER is set to the same address.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+
+def model_name(model_path):
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+
+def parse_address(address):
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+class RemoteLlama:
+    """Client for a model hosted by llm_server, callable like a Llama instance."""
+
+    def __init__(self, address, name, timeout=None):
+        self.address = address
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        family, target = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(target)
+        self._sock = sock
+        self._file = sock.makefile('rwb')
+
+    def _close(self):
+        for handle in (self._file, self._sock):
+            try:
+                if handle is not None:
+                    handle.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    def _request(self, payload):
+        line = json.dumps(payload).encode('utf-8') + b'\n'
+        with self._lock:
+            # Retry once on a fresh connection in case the daemon was restarted
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._file.write(line)
+                    self._file.flush()
+                    reply = self._file.readline()
+                    if not reply:
+                        raise ConnectionError("llm_server closed the connection")
+                    break
+                except OSError:
+                    self._close()
+                    if attempt == 1:
+                        raise
+        reply = json.loads(reply)
+        if 'error' in reply:
+            raise RuntimeError(f"llm_server: {reply['error']}")
+        return reply['output']
+
+    def __call__(self, prompt, **kwargs):
+        return self._request({'model': self.name, 'prompt': prompt, 'params': kwargs})
+
+    def create_batch(self, prompts, **kwargs):
+        return self._request({'model': self.name, 'prompts': list(prompts), 'params': kwargs})
+
+    def reject(self, prompt, **kwargs):
+        self._request({'model': self.name, 'reject': prompt, 'params': kwargs})
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                model, lock = self.server.models[request['model']]
+                params = request.get('params', {})
+                if 'reject' in request:
+                    # The cache takes its own lock, so this does not wait for a running completion
+                    reject = getattr(model, 'reject', None)
+                    output = reject(request['reject'], **params) if reject is not None else None
+                else:
+                    with lock:
+                        if 'prompts' in request:
+                            output = model.create_batch(request['prompts'], **params)
+                        else:
+                            output = model(request['prompt'], **params)
+                reply = {'output': output}
+            except Exception as e:
+                reply = {'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(address, model_paths, **model_kwargs):
+    from llm_backend import load_model
+
+    models = {}
+    for path in model_paths:
+        print(f"[llm_server] Loading {path}")
+        # llama.cpp contexts are not thread-safe, so each model is served under its own lock
+        models[model_name(path)] = (load_model(path, local=True, **model_kwargs), threading.Lock())
+
+    family, target = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(target):
+            os.unlink(target)
+        server = _UnixServer(target, _Handler)
+    else:
+        server = _TCPServer(target, _Handler)
+    server.models = models
+    print(f"[llm_server] Serving {', '.join(models)} on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.unlink(target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared LlamaREST inference daemon")
+    parser.add_argument('models', nargs='+', help="GGUF model files to host (e.g. ex.gguf ipd.gguf)")
+    parser.add_argument('--listen', default=os.environ.get('LLAMA_SERVER', 'unix:/tmp/llamarest.sock'),
+                        help="unix:<path> or <host>:<port> (default: $LLAMA_SERVER or unix:/tmp/llamarest.sock)")
+    parser.add_argument('--n-ctx', type=int, default=int(os.environ.get('LLAMA_N_CTX', 512)))
+    args = parser.parse_args()
+    serve(args.listen, args.models, n_ctx=args.n_ctx)
+    sys.exit(0)
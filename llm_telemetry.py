@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+LLM call telemetry.
+
+Every EX/IPD completion (and every ChatGPT call of main.py) appends a record
+to llm_calls.jsonl in the run's results directory: prompt kind, model, prompt
+and generated tokens, wall time and whether the output parsed. Requests that
+later use the values a call produced credit it, and the running counts are
+appended as yield records, so a run killed by its container still leaves
+usable numbers.
+
+Usage:
+    python3 llm_telemetry.py [results]
+
+aggregates the records of every results/<api>/<tool>/<run> per API and model.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from collections import defaultdict
+
+
+# LLAMA_RESULTS_DIR: where llm_calls.jsonl is written (default: /results/$API/$TOOL/$RUN inside a tool
+# container, otherwise the working directory); LLAMA_TELEMETRY=0 turns the records off
+TELEMETRY_FILE = 'llm_calls.jsonl'
+FLUSH_INTERVAL = 10
+
+
+def results_dir():
+    if os.environ.get('LLAMA_RESULTS_DIR'):
+        return os.environ['LLAMA_RESULTS_DIR']
+    if all(os.environ.get(name) for name in ('API', 'TOOL', 'RUN')):
+        return os.path.join('/results', os.environ['API'], os.environ['TOOL'], os.environ['RUN'])
+    return os.getcwd()
+
+
+def value_key(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class Telemetry:
+    """Appends call, parse and yield records to one JSON-lines file; safe to use from the feedback worker."""
+
+    def __init__(self, path=None, api=None, enabled=True):
+        self.path = path or os.path.join(results_dir(), TELEMETRY_FILE)
+        self.api = api or os.environ.get('API')
+        self.enabled = enabled
+        self._values = defaultdict(list)
+        self._yield = {}
+        self._dirty = set()
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+
+    def _write(self, records):
+        if not self.enabled or not records:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a') as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str) + '\n')
+        except OSError as e:
+            print(f"[llm_telemetry] cannot write {self.path}: {e}")
+            self.enabled = False
+
+    def record(self, kind, model, output=None, wall=0.0, parsed=None, **fields):
+        """Log one call and return its id; output is a completion dict or a ChatGPT response."""
+        usage = (output or {}).get('usage') or {}
+        record = {'event': 'call', 'id': uuid.uuid4().hex[:12], 'time': time.time(), 'api': self.api,
+                  'kind': kind, 'model': model,
+                  'prompt_tokens': usage.get('prompt_tokens', 0), 'completion_tokens': usage.get('completion_tokens', 0),
+                  'wall': round(wall, 4), 'parsed': parsed, **fields}
+        if output and output.get('cached'):
+            record['cached'] = True
+        try:
+            record['finish_reason'] = output['choices'][0].get('finish_reason')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            pass
+        with self._lock:
+            self._write([record])
+        return record['id']
+
+    def parsed(self, call_id, ok):
+        with self._lock:
+            self._write([{'event': 'parse', 'id': call_id, 'parsed': ok}])
+
+    def track(self, call_id, name, values):
+        """Attribute later requests that use one of values for parameter name to the call."""
+        if call_id is None or not values:
+            return
+        with self._lock:
+            self._values[name].append((call_id, {value_key(value) for value in values}))
+            self._yield.setdefault(call_id, [0, 0])
+
+    def credit(self, values, success):
+        """Count a request sent with values ({name: value}) against the calls that produced them."""
+        if not self._values:
+            return
+        with self._lock:
+            for name, value in values.items():
+                if name not in self._values:
+                    continue
+                keys = {value_key(v) for v in value} if isinstance(value, list) else {value_key(value)}
+                for call_id, produced in self._values[name]:
+                    if keys & produced:
+                        counts = self._yield[call_id]
+                        counts[0] += 1
+                        counts[1] += 1 if success else 0
+                        self._dirty.add(call_id)
+
+    def flush(self, force=False):
+        # Called from the fuzzing loop; yield counts go out at most every FLUSH_INTERVAL seconds
+        if not force and time.time() - self._flushed < FLUSH_INTERVAL:
+            return
+        self._flushed = time.time()
+        with self._lock:
+            records = [{'event': 'yield', 'id': call_id, 'used': self._yield[call_id][0],
+                        'ok': self._yield[call_id][1]} for call_id in self._dirty]
+            self._dirty.clear()
+            self._write(records)
+
+
+def load_telemetry():
+    return Telemetry(enabled=os.environ.get('LLAMA_TELEMETRY', '1') != '0')
+
+
+def read_calls(path):
+    calls = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('event') == 'call':
+                calls[record['id']] = dict(record, used=0, ok=0)
+            elif record.get('id') in calls:
+                call = calls[record['id']]
+                if record['event'] == 'parse':
+                    call['parsed'] = record['parsed']
+                elif record['event'] == 'yield':
+                    # Yield records are cumulative
+                    call['used'], call['ok'] = record['used'], record['ok']
+    return list(calls.values())
+
+
+def summarize(root):
+    totals = defaultdict(lambda: defaultdict(float))
+    for directory, _, files in os.walk(root):
+        if TELEMETRY_FILE not in files:
+            continue
+        for call in read_calls(os.path.join(directory, TELEMETRY_FILE)):
+            api = call.get('api') or os.path.relpath(directory, root).split(os.sep)[0]
+            row = totals[(api, call.get('model') or '-', call.get('kind') or '-')]
+            row['calls'] += 1
+            row['cached'] += 1 if call.get('cached') else 0
+            row['prompt_tokens'] += call.get('prompt_tokens') or 0
+            row['completion_tokens'] += call.get('completion_tokens') or 0
+            row['wall'] += call.get('wall') or 0
+            row['parsed'] += 1 if call.get('parsed') else 0
+            row['used'] += call['used']
+            row['ok'] += call['ok']
+    return totals
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    root = argv[0] if argv else 'results'
+    totals = summarize(root)
+    if not totals:
+        print(f"No {TELEMETRY_FILE} under {root}")
+        return 1
+    print(f"{'api':<20} {'model':<16} {'kind':<10} {'calls':>6} {'prompt':>9} {'generated':>9} "
+          f"{'cached':>6} {'wall s':>8} {'parsed':>7} {'used':>7} {'2xx':>7}")
+    for (api, model, kind), row in sorted(totals.items()):
+        print(f"{api:<20} {model:<16} {kind:<10} {int(row['calls']):>6} {int(row['prompt_tokens']):>9} "
+              f"{int(row['completion_tokens']):>9} {int(row['cached']):>6} {row['wall']:>8.1f} {row['parsed'] / row['calls']:>7.0%} "
+              f"{int(row['used']):>7} {int(row['ok']):>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import queue
+import itertools
+import threading
+from llm_scheduler import PREPASS, EX
+
+
+class FeedbackWorker:
+    """Runs LLM analyses of error responses off the fuzzing loop.
+
+    A job returns a merge callable (or None). The worker never touches the
+    tool's shared state itself: the loop calls apply_results() between
+    requests, so every merge into llm_val/ipds/validated_ipd happens at once
+    on the loop's own thread. When the queue is full new jobs are dropped
+    rather than stalling the caller. Queued jobs run in priority order
+    (llm_scheduler's EX before IPD), and steps of an optional idle task, a
+    generator of merges such as the progressive pre-pass, run whenever no
+    job is waiting. With a scheduler, work the remaining budget no longer
+    covers is skipped when it is submitted and again when it comes up.
+    """
+
+    def __init__(self, maxsize=8, scheduler=None):
+        self._jobs = queue.PriorityQueue(maxsize=maxsize)
+        self._results = queue.Queue()
+        self._order = itertools.count()
+        self.scheduler = scheduler
+        self.dropped = 0
+        self._idle = None
+        self._thread = threading.Thread(target=self._run, name='llm-feedback', daemon=True)
+        self._thread.start()
+
+    def submit(self, job, *args, priority=EX):
+        if self.scheduler is not None and not self.scheduler.admit(priority, job.__name__):
+            return False
+        try:
+            self._jobs.put_nowait((priority, next(self._order), job, args))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def run_when_idle(self, task):
+        self._idle = task
+        # Wake the worker in case it is already waiting for a job
+        self._jobs.put((PREPASS, next(self._order), None, None))
+
+    def _next_job(self):
+        while True:
+            try:
+                priority, _, job, args = self._jobs.get_nowait() if self._idle is not None else self._jobs.get()
+            except queue.Empty:
+                # Idle task steps only run while no queued job is waiting
+                try:
+                    if self.scheduler is not None and not self.scheduler.admit(PREPASS, 'batch'):
+                        raise StopIteration
+                    return PREPASS, next(self._idle), None
+                except StopIteration:
+                    self._idle = None
+                except Exception as e:
+                    print(f"[llm_worker] idle task failed: {type(e).__name__}: {e}")
+                    self._idle = None
+                continue
+            if job is None:
+                self._jobs.task_done()
+                continue
+            if self.scheduler is not None and not self.scheduler.admit(priority, job.__name__):
+                self._jobs.task_done()
+                continue
+            return priority, job, args
+
+    def _run(self):
+        while True:
+            priority, job, args = self._next_job()
+            if args is None:
+                # An idle task step has already produced its merge
+                merge = job
+            else:
+                try:
+                    merge = job(*args)
+                except Exception as e:
+                    print(f"[llm_worker] {job.__name__} failed: {type(e).__name__}: {e}")
+                    merge = None
+                self._jobs.task_done()
+            if merge is not None:
+                self._results.put(merge)
+
+    def apply_results(self):
+        applied = 0
+        while True:
+            try:
+                merge = self._results.get_nowait()
+            except queue.Empty:
+                return applied
+            merge()
+            applied += 1
@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+from collections import Counter, defaultdict
+
+
+# HTTP_MEDIA_SWEEPS: full sweeps over an operation's content types before it only gets the best-ranked one (default 2)
+# HTTP_MEDIA_NEGATIVE_TTL: seconds a content type answered with 415, or that failed to send, is skipped (default 300)
+UNSUPPORTED = 415
+
+
+class MediaTypeModel:
+    """Learns which content type each operation accepts.
+
+    Replaces the cached_media_type dict and keeps its interface: `op in
+    model`, `model[op]` and `model[op] = media_type` read and set the type
+    that last got a 2xx, which is sent alone from then on. Until one does,
+    candidates() ranks the declared types by their outcomes so far, skips
+    those in the negative cache (a 415 or a failed send, for negative_ttl
+    seconds) and, once an operation has had `sweeps` sweeps without a 2xx,
+    returns only the best-ranked type, so a hard endpoint costs one request
+    per test instead of one per content type.
+    """
+
+    def __init__(self, sweeps=2, negative_ttl=300.0):
+        self.sweeps = sweeps
+        self.negative_ttl = negative_ttl
+        self.preferred = {}
+        self.outcomes = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        self.negative = defaultdict(dict)
+        self.swept = Counter()
+        self.sent = 0
+        self.tests = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, operation_id):
+        return operation_id in self.preferred
+
+    def __getitem__(self, operation_id):
+        return self.preferred[operation_id]
+
+    def __setitem__(self, operation_id, media_type):
+        with self._lock:
+            self.preferred[operation_id] = media_type
+            self.negative[operation_id].pop(media_type, None)
+
+    def _rank(self, operation_id, media_type):
+        tries, ok = self.outcomes[operation_id][media_type]
+        # Success rate with a uniform prior; among types that never worked the least tried comes first
+        return -(ok + 1) / (tries + 2)
+
+    def candidates(self, operation_id, media_types):
+        """Return the content types to try, in order, for one request of the operation."""
+        if isinstance(media_types, str):
+            media_types = [media_types]
+        with self._lock:
+            self.tests += 1
+            if operation_id in self.preferred:
+                return [self.preferred[operation_id]]
+            now = time.time()
+            negative = self.negative[operation_id]
+            live = [media_type for media_type in media_types if negative.get(media_type, 0) <= now]
+            ranked = sorted(live or media_types, key=lambda media_type: self._rank(operation_id, media_type))
+            if not live or self.swept[operation_id] >= self.sweeps:
+                return ranked[:1]
+            self.swept[operation_id] += 1
+            return ranked
+
+    def observe(self, operation_id, media_type, response):
+        with self._lock:
+            self.sent += 1
+            stats = self.outcomes[operation_id][media_type]
+            stats[0] += 1
+            if response is not None and 200 <= response.status_code < 300:
+                stats[1] += 1
+                self.preferred[operation_id] = media_type
+                self.negative[operation_id].pop(media_type, None)
+            elif response is None or response.status_code == UNSUPPORTED:
+                self.negative[operation_id][media_type] = time.time() + self.negative_ttl
+                if self.preferred.get(operation_id) == media_type:
+                    del self.preferred[operation_id]
+
+    def summary(self):
+        now = time.time()
+        return {'learned': len(self.preferred),
+                'negative': sum(expiry > now for negative in self.negative.values() for expiry in negative.values()),
+                'requests_per_test': round(self.sent / self.tests, 2) if self.tests else None}
+
+
+def load_media_types():
+    return MediaTypeModel(sweeps=int(os.environ.get('HTTP_MEDIA_SWEEPS', 2)),
+                          negative_ttl=float(os.environ.get('HTTP_MEDIA_NEGATIVE_TTL', 300)))
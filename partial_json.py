@@ -0,0 +1,54 @@
+import json_codec
+
+
+def loads_prefix(text):
+    """Parse the complete values at the start of a truncated JSON document.
+
+    The document is cut back to the last member or element that was read in
+    full and the containers still open there are closed, so `{"items": [{...},
+    {...}, {"id": 3, "na` gives `{"items": [{...}, {...}, {"id": 3}]}`. Returns
+    None when not even one value is complete.
+    """
+    stack = []
+    in_string = escape = False
+    cut = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '[{':
+            stack.append(ch)
+        elif ch in ']}':
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                # The whole document ended here; anything after it is not JSON
+                return json_codec.loads(text[:i + 1])
+            cut = (i + 1, len(stack))
+        elif ch == ',' and stack:
+            cut = (i, len(stack))
+    if cut is None:
+        return None
+    end, depth = cut
+    closing = ''.join(']' if opened == '[' else '}' for opened in reversed(stack[:depth]))
+    try:
+        return json_codec.loads(text[:end] + closing)
+    except ValueError:
+        return None
+
+
+def response_json(response):
+    """response.json(), or what loads_prefix() makes of the body when http_pool cut it off."""
+    if not getattr(response, 'truncated', False):
+        return json_codec.response_loads(response)
+    value = loads_prefix(response.text)
+    if value is None:
+        raise ValueError("truncated response body holds no complete JSON value")
+    return value
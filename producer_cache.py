@@ -0,0 +1,63 @@
+import os
+import time
+import threading
+
+
+# HTTP_PRODUCER_TTL: seconds a producer's output stays usable for a consumer's parameter (default 60)
+# HTTP_PRODUCER_USES: consumer requests one producer run serves before it is run again (default 5)
+
+
+class ProducerCache:
+    """Tracks which producer runs are still good for the parameters they produce.
+
+    Entries are keyed by (producer operation, parameter) and last `ttl`
+    seconds or `uses` consumer requests, whichever ends first. A DELETE or
+    PUT that succeeds with one of the parameters drops every entry for it,
+    as the resources the producers made may be gone or changed.
+    """
+
+    def __init__(self, ttl=60.0, uses=5):
+        self.ttl = ttl
+        self.uses = uses
+        self.entries = {}
+        self.hits = 0
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def take(self, operation_id, names):
+        """Return whether the operation's output is fresh for all names, using it up by one if so."""
+        now = time.time()
+        with self._lock:
+            keys = [(operation_id, name) for name in names]
+            if not all(key in self.entries and self.entries[key][0] > now and self.entries[key][1] > 0
+                       for key in keys):
+                return False
+            for key in keys:
+                self.entries[key][1] -= 1
+            self.hits += 1
+            return True
+
+    def store(self, operation_id, names):
+        with self._lock:
+            self.runs += 1
+            for name in names:
+                self.entries[(operation_id, name)] = [time.time() + self.ttl, self.uses]
+
+    def invalidate(self, names):
+        names = set(names)
+        with self._lock:
+            for key in [key for key in self.entries if key[1] in names]:
+                del self.entries[key]
+
+    def observe(self, method, names, response):
+        """Drop cached producer output for names once a DELETE or PUT with them succeeded."""
+        if method in ('delete', 'put') and response is not None and 200 <= response.status_code < 300:
+            self.invalidate(names)
+
+    def summary(self):
+        return {'runs': self.runs, 'reused': self.hits}
+
+
+def load_producer_cache():
+    return ProducerCache(ttl=float(os.environ.get('HTTP_PRODUCER_TTL', 60)),
+                         uses=int(os.environ.get('HTTP_PRODUCER_USES', 5)))
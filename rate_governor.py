@@ -0,0 +1,99 @@
+import time
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+TOO_MANY_REQUESTS = 429
+MAX_BACKOFF = 60.0
+MIN_RATE = 0.2
+
+
+def retry_after(response):
+    """Seconds the Retry-After header asks to wait (delta-seconds or an HTTP date), or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateGovernor:
+    """A token bucket for one target that backs off when the target throttles.
+
+    rate is the ceiling in requests per second (None: no ceiling until the
+    target first answers 429) and burst the bucket size. A 429 halves the
+    current rate, or sets it to half the rate seen over the last WINDOW
+    seconds, and holds every request until its Retry-After, or an
+    exponential backoff without one, has passed; each later success raises
+    the rate again by `increase` requests per second up to the ceiling or,
+    without one, up to the rate the 429 came at.
+    """
+
+    WINDOW = 10.0
+
+    def __init__(self, rate=None, burst=10, increase=0.1):
+        self.ceiling = rate
+        self.rate = rate
+        self.limit = rate
+        self.burst = max(1, burst)
+        self.increase = increase
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.hold_until = 0.0
+        self.throttled = 0
+        self.strikes = 0
+        self.sent = deque()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until the target may get another request."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.hold_until - now
+                if wait <= 0:
+                    if self.rate is None or self.tokens >= 1:
+                        self.tokens -= 1
+                        self.sent.append(now)
+                        while self.sent and self.sent[0] < now - self.WINDOW:
+                            self.sent.popleft()
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, response):
+        """Adjust to a response; returns the seconds to wait before retrying a 429, else None."""
+        with self._lock:
+            if response.status_code != TOO_MANY_REQUESTS:
+                self.strikes = 0
+                if self.rate is not None and self.rate < self.limit:
+                    self.rate = min(self.limit, self.rate + self.increase)
+                return None
+            self.throttled += 1
+            self.strikes += 1
+            rate = self.rate if self.rate is not None else max(MIN_RATE, len(self.sent) / self.WINDOW)
+            if self.ceiling is None:
+                self.limit = rate
+            self.rate = max(MIN_RATE, rate / 2)
+            self.tokens = 0.0
+            wait = retry_after(response)
+            wait = min(MAX_BACKOFF, 2 ** (self.strikes - 1) if wait is None else wait)
+            self.hold_until = max(self.hold_until, time.monotonic() + wait)
+            # The emptied bucket refills during the hold; the next request also waits for its first token
+            return max(wait, 1 / self.rate)
+
+    def summary(self):
+        return {'rate': round(self.rate, 2) if self.rate is not None else None, 'throttled': self.throttled}
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# HTTP_IN_FLIGHT: requests a tool process keeps in flight at once (default 8; 1 sends everything in turn)
+# Requests that may change server state race when sent together, so only safe methods are sent concurrently
+SAFE_METHODS = ('get', 'head')
+
+
+class RequestExecutor:
+    """Dispatches independent requests concurrently from an asyncio loop on a background thread.
+
+    The HTTP calls themselves block (requests through http_pool), so the loop
+    runs them on a thread pool, with a semaphore capping how many are in
+    flight across all callers. gather() may be called from any thread, blocks
+    until every call has finished and returns the results in submission
+    order, so the caller applies their effects in a fixed order whatever the
+    order of completion.
+    """
+
+    def __init__(self, max_in_flight=8):
+        self.max_in_flight = max(1, max_in_flight)
+        self._loop = None
+        self._limit = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                             thread_name_prefix='http'))
+                threading.Thread(target=loop.run_forever, name='http-executor', daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    async def _call(self, fn, args):
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.max_in_flight)
+        async with self._limit:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _gather(self, calls):
+        return await asyncio.gather(*(self._call(fn, args) for fn, args in calls))
+
+    def gather(self, calls, methods=None):
+        """Run calls, a list of (function, args), and return their results in order.
+
+        When methods, the HTTP methods the calls send, holds one that is not
+        safe, the calls run one after the other.
+        """
+        if len(calls) <= 1 or self.max_in_flight == 1 or (
+                methods is not None and any(method not in SAFE_METHODS for method in methods)):
+            return [fn(*args) for fn, args in calls]
+        return asyncio.run_coroutine_threadsafe(self._gather(calls), self._start()).result()
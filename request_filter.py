@@ -0,0 +1,92 @@
+import os
+import math
+
+
+# HTTP_DEDUP=0 sends duplicate requests as before
+# HTTP_DEDUP_CAPACITY: fingerprints one filter generation holds (default 100000); memory stays under two generations
+# HTTP_DEDUP_ERROR: false-positive rate of a generation, i.e. new requests mistaken for sent ones (default 0.001)
+# HTTP_DEDUP_RESAMPLES: fresh samples drawn for a duplicate before it is sent anyway (default 3)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter over 16-byte fingerprints."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, fingerprint):
+        # Double hashing over the two halves of the fingerprint
+        h1 = int.from_bytes(fingerprint[:8], 'little')
+        h2 = int.from_bytes(fingerprint[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, fingerprint):
+        return all(self.bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(fingerprint))
+
+    def add(self, fingerprint):
+        for i in self._indexes(fingerprint):
+            self.bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+
+class DuplicateFilter:
+    """Remembers the fingerprints of sent requests and replaces repeats with fresh samples.
+
+    Two Bloom filter generations are kept; when the current one is full it
+    becomes the previous one and the oldest is dropped, so memory is bounded
+    however long the run and a request counts as sent if either remembers it.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, resamples=3, enabled=True):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.resamples = resamples
+        self.enabled = enabled
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.suppressed = 0
+        self.sent_anyway = 0
+
+    def seen(self, fingerprint):
+        """Record fingerprint and return whether it was recorded before."""
+        if fingerprint in self.current or (self.previous is not None and fingerprint in self.previous):
+            return True
+        if self.current.count >= self.capacity:
+            self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+        self.current.add(fingerprint)
+        return False
+
+    def fresh(self, request, fingerprint, resample, varies=None):
+        """Return request, or resample(request) in its place while fingerprint() says it was sent before.
+
+        Requests varies() says cannot come out differently, such as those of
+        operations without parameters, are sent as they are. suppressed
+        counts the requests replaced, sent_anyway those still sent before
+        after every resample.
+        """
+        if not self.enabled or (varies is not None and not varies(request)):
+            return request
+        if not self.seen(fingerprint(request)):
+            return request
+        self.suppressed += 1
+        for _ in range(self.resamples):
+            request = resample(request)
+            if not self.seen(fingerprint(request)):
+                return request
+        self.sent_anyway += 1
+        return request
+
+    def summary(self):
+        return {'suppressed': self.suppressed, 'sent_anyway': self.sent_anyway,
+                'bytes': len(self.current.bits) * (2 if self.previous is not None else 1)}
+
+
+def load_duplicate_filter():
+    return DuplicateFilter(capacity=int(os.environ.get('HTTP_DEDUP_CAPACITY', 100000)),
+                           error_rate=float(os.environ.get('HTTP_DEDUP_ERROR', 0.001)),
+                           resamples=int(os.environ.get('HTTP_DEDUP_RESAMPLES', 3)),
+                           enabled=os.environ.get('HTTP_DEDUP', '1') != '0')
@@ -0,0 +1,142 @@
+import re
+import json
+import hashlib
+from urllib.parse import quote, urlencode
+
+import requests
+
+import http_pool
+
+
+# Request kwargs tried in turn for a body of each content type: form bodies go out as form data
+# and, when that fails, as JSON; anything else is sent as JSON
+ENCODERS = {'application/x-www-form-urlencoded': ('data', 'json')}
+DEFAULT_ENCODERS = ('json',)
+METHODS = ('get', 'post', 'put', 'delete', 'patch', 'head')
+
+_PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+
+
+def add_query(url, name, value):
+    """Append name=value to url's query string, URL-encoded."""
+    return url + ('&' if '?' in url else '?') + urlencode({name: value})
+
+
+def param_type(param):
+    return param["schema"].get('type') if "schema" in param else param.get('type')
+
+
+class RequestTemplate:
+    """An operation compiled once at spec load, so building one of its requests is a few dict lookups.
+
+    Holds the parameters by name, their location and type, the names in each
+    location, the path split into literal segments and placeholders, and the
+    body encoders for the content types the operation consumes. Method and
+    content types are read from the operation at send time, as mutated copies
+    change them.
+    """
+
+    def __init__(self, operation):
+        self.operation_id = operation['operation_id']
+        parameters = operation.get('parameters') or []
+        # parse_oas keys parameters by name, and its request body entries ('body' and form properties) carry no
+        # 'name' of their own; the analyze_information lists are named
+        if isinstance(parameters, dict):
+            parameters = parameters.items()
+        else:
+            parameters = ((param.get('name'), param) for param in parameters)
+        self.params = {}
+        for name, param in parameters:
+            # The first declaration of a name wins, as with next() over the parameter list
+            self.params.setdefault(name, param)
+        self.location = {name: param.get('in') for name, param in self.params.items()}
+        self.types = {name: param_type(param) for name, param in self.params.items()}
+        self.buckets = {}
+        for name, location in self.location.items():
+            self.buckets.setdefault(location, []).append(name)
+        # Literal segments at even indexes, placeholder names at odd ones
+        self.segments = _PLACEHOLDER.split(operation['path'])
+        self.encoders = {content_type: ENCODERS.get(content_type, DEFAULT_ENCODERS)
+                         for content_type in operation.get('consumes') or ()}
+
+    def path(self, path_values):
+        segments = list(self.segments)
+        for i in range(1, len(segments), 2):
+            name = segments[i]
+            segments[i] = quote(str(path_values[name]), safe='') if name in path_values else '{' + name + '}'
+        return ''.join(segments)
+
+    def url(self, base_url, path_values, query=None):
+        url = base_url + self.path(path_values)
+        for name, value in (query or {}).items():
+            url = add_query(url, name, value)
+        return url
+
+    def fill(self, selected_parameters):
+        """Split [{name: value}, ...] into path values, query parameters and a body."""
+        path_values, query_params, body_params = {}, {}, {}
+        for param_value_dict in selected_parameters:
+            for param_name, param_value in param_value_dict.items():
+                location = self.location.get(param_name, False)
+                if location is False:
+                    continue
+                if location == 'path':
+                    path_values.setdefault(param_name, param_value)
+                elif location == 'query':
+                    query_params[param_name] = param_value
+                elif isinstance(param_value, list):
+                    body_params = param_value
+                elif isinstance(param_value, dict):
+                    for tt in param_value:
+                        body_params[tt] = param_value[tt]
+                elif isinstance(body_params, dict):
+                    body_params[param_name] = param_value if self.types[param_name] != 'array' or isinstance(
+                        param_value, list) else [param_value]
+        return path_values, query_params, body_params
+
+    def fingerprint(self, method, selected_parameters):
+        """16 bytes identifying the request these parameters make, whatever their order."""
+        path_values, query_params, body_params = self.fill(selected_parameters)
+        canonical = json.dumps([method, self.path(path_values), query_params, body_params], sort_keys=True,
+                               default=str)
+        return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+    def send(self, method, url, params, content_type, body, timeout=None):
+        """Send body as content_type, falling back through its encoders; None for an unknown method."""
+        if method not in METHODS:
+            return None
+        headers = {"Content-Type": content_type}
+        if method == 'head':
+            return http_pool.head(url, headers=headers, params=params, timeout=timeout)
+        encoders = self.encoders.get(content_type) or ENCODERS.get(content_type, DEFAULT_ENCODERS)
+        for encoder in encoders[:-1]:
+            try:
+                return http_pool.request(method, url, params=params, headers=headers, timeout=timeout,
+                                         **{encoder: body})
+            except requests.exceptions.Timeout:
+                # Another encoding would only wait as long again
+                raise
+            except Exception:
+                pass
+        return http_pool.request(method, url, params=params, headers=headers, timeout=timeout,
+                                 **{encoders[-1]: body})
+
+
+def send_first(method, url, attempts, body, timeout=None, **kwargs):
+    """Send body with each (headers, encoder) of attempts in turn until one goes through; timeouts are not retried."""
+    for headers, encoder in attempts[:-1]:
+        try:
+            return http_pool.request(method, url, headers=headers, timeout=timeout, **{encoder: body}, **kwargs)
+        except requests.exceptions.Timeout:
+            raise
+        except Exception:
+            pass
+    headers, encoder = attempts[-1]
+    return http_pool.request(method, url, headers=headers, timeout=timeout, **{encoder: body}, **kwargs)
+
+
+def compile_templates(operations):
+    """Compile a list of operations, or a dict of them by operation id, into {operation_id: RequestTemplate}."""
+    if isinstance(operations, dict):
+        operations = [dict(operation, operation_id=operation_id) for operation_id, operation in operations.items()]
+    return {operation['operation_id']: RequestTemplate(operation) for operation in operations}
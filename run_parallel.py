@@ -188,6 +188,20 @@ def launch_run(api, tool, run_count, total_runs):
             'RUN': run,
             'PORT': ports['9090/tcp']
         }
+        # Share one llm_server.py on the host across all tool containers (they use host networking)
+        if os.environ.get('LLAMA_SERVER'):
+            env['LLAMA_SERVER'] = os.environ['LLAMA_SERVER']
+        # LLM settings (model memory, knowledge packs, call limits, telemetry) and HTTP pooling
+        for name in ('LLAMA_MEM_BUDGET_MB', 'LLAMA_MMAP', 'LLAMA_MLOCK', 'LLAMA_PACK', 'LLAMA_PACK_DIR',
+                     'LLAMA_CALL_TIMEOUT', 'LLAMA_MAX_TOKENS', 'LLAMA_TELEMETRY',
+                     'HTTP_POOL_SIZE', 'HTTP_POOL_RETRIES', 'HTTP_POOL_TARGETS', 'HTTP_IN_FLIGHT',
+                     'HTTP_MEDIA_SWEEPS', 'HTTP_MEDIA_NEGATIVE_TTL', 'HTTP_TIMEOUT', 'HTTP_TIMEOUT_PERCENTILE',
+                     'HTTP_TIMEOUT_FACTOR', 'HTTP_BREAKER_TIMEOUTS', 'HTTP_BREAKER_COOLDOWN',
+                     'HTTP_RATE', 'HTTP_BURST', 'HTTP_RATE_LIMITS', 'HTTP_RATE_RETRIES', 'HTTP_RATE_MAX_WAIT',
+                     'HTTP_BODY_LIMIT', 'HTTP_DEDUP', 'HTTP_DEDUP_CAPACITY', 'HTTP_DEDUP_ERROR', 'HTTP_DEDUP_RESAMPLES',
+                     'HTTP_PRODUCER_TTL', 'HTTP_PRODUCER_USES'):
+            if os.environ.get(name):
+                env[name] = os.environ[name]
 
         os.makedirs(results_path, exist_ok=True, mode=0o777)
 
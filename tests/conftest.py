@@ -0,0 +1,34 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# The tools are flat modules at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Response:
+    """Stand-in for a requests.Response carrying only what the code under test reads."""
+    encoding = 'utf-8'
+
+    def __init__(self, status_code=200, headers=None, text='', truncated=False):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.truncated = truncated
+
+    def json(self):
+        raise AssertionError('decoded with the codec')
+
+
+@pytest.fixture(scope='module')
+def server(request):
+    # Serves the test module's Handler on a free loopback port
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), request.module.Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
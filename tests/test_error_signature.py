@@ -0,0 +1,15 @@
+from error_signature import error_signature, normalize_error
+
+
+def test_volatile_parts_share_a_signature():
+    first = 'Invalid id 12 at 2024-01-02T10:00:00Z (request 3f2b8c1e-1111-2222-3333-444455556666)'
+    second = 'Invalid id 99 at 2025-06-07T11:30:00Z (request 00000000-aaaa-bbbb-cccc-dddddddddddd)'
+    assert error_signature(first) == error_signature(second)
+    assert error_signature(first) != error_signature('Missing field name')
+
+
+def test_json_keys_are_kept():
+    assert normalize_error('{"error": "bad value \'x\'", "code": 400}') == \
+        '{"code": "<num>", "error": "bad value <str>"}'
+    assert error_signature('{"error": 1}') != error_signature('{"message": 1}')
+    assert error_signature(None) == error_signature('')
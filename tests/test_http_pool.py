@@ -0,0 +1,61 @@
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import http_pool
+
+
+class Echo(BaseHTTPRequestHandler):
+    # GET /<n> answers with n bytes of a JSON array; POST echoes the body and its content type
+    def do_GET(self):
+        size = int(self.path.strip('/'))
+        body = b'[' + b','.join([b'1'] * (size // 2)) + b']'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', self.headers['Content-Type'])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+Handler = Echo
+
+
+def test_target():
+    assert http_pool.target('http://h:8080/a/b?c=1') == 'http://h:8080'
+
+
+def test_one_session_per_target(server):
+    assert http_pool.session_for(server + '/a') is http_pool.session_for(server + '/b?c=1')
+    assert http_pool.session_for(server + '/a') is not http_pool.session_for('http://localhost:1/a')
+    assert http_pool.get(server + '/10').status_code == 200
+
+
+def test_body_limit(server):
+    response = http_pool.request('get', server + '/100000', body_limit=1000)
+    assert response.truncated and len(response.content) == 1000
+    response = http_pool.request('get', server + '/100', body_limit=1000)
+    assert not response.truncated and response.json() == [1] * 50
+
+
+def test_json_bodies(server):
+    response = http_pool.post(server + '/', json={'a': [1, 2]})
+    assert response.headers['Content-Type'] == 'application/json' and response.json() == {'a': [1, 2]}
+    with pytest.raises(requests.exceptions.InvalidJSONError):
+        http_pool.post(server + '/', json={'a': float('nan')})
+
+
+def test_timings(server):
+    response = http_pool.get(server + '/10')
+    assert set(response.timings) == {'connect', 'ttfb', 'download'}
+    assert all(seconds >= 0 for seconds in response.timings.values())
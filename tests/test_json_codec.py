@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+import json_codec
+
+
+def test_loads_matches_stdlib():
+    for text in ('{"a": [1, 2.5, "x", null, true]}', '[12345678901234567890123]', '{"n": -9223372036854775809}'):
+        assert json_codec.loads(text) == json.loads(text)
+        assert json_codec.loads(text.encode()) == json.loads(text)
+
+
+def test_dumps_round_trips():
+    value = {'name': 'café', 'ids': [1, 2], 'nested': {'ok': True, 'none': None}}
+    assert json.loads(json_codec.dumps(value)) == value
+
+
+@pytest.mark.parametrize('value', [float('nan'), {'a': [1, float('inf')]}, [{'b': -float('inf')}]])
+def test_dumps_refuses_non_finite(value):
+    with pytest.raises(ValueError):
+        json_codec.dumps(value)
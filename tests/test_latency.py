@@ -0,0 +1,50 @@
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import http_pool
+from latency import LatencyTracker, percentile
+
+
+class SlowBody(BaseHTTPRequestHandler):
+    # Sends the headers at once and the body after the delay in the path, e.g. /0.3
+    def do_GET(self):
+        delay = float(self.path.strip('/'))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.flush()
+        time.sleep(delay)
+        try:
+            self.wfile.write(b'{}')
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+Handler = SlowBody
+
+
+def test_percentile():
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([3, 1, 2, 4], 99) == 4
+
+
+def test_latency_includes_body(server, tmp_path, monkeypatch):
+    monkeypatch.setenv('LLAMA_RESULTS_DIR', str(tmp_path))
+    tracker = LatencyTracker(default=5.0)
+    assert tracker.call('op', http_pool.get, server + '/0.3').status_code == 200
+    assert tracker.samples['op'][0] >= 0.3
+    assert tracker.report()['op']['requests'] == 1
+
+
+def test_slow_body_is_a_timeout(server, tmp_path, monkeypatch):
+    monkeypatch.setenv('LLAMA_RESULTS_DIR', str(tmp_path))
+    tracker = LatencyTracker(default=0.2, trip=2)
+    assert tracker.call('op', http_pool.get, server + '/1') is None
+    assert tracker.call('op', http_pool.get, server + '/1') is None
+    assert tracker.timeouts['op'] == 2
+    assert tracker.summary()['open'] == ['op']
@@ -0,0 +1,107 @@
+import os
+import json
+import zlib
+
+import pytest
+
+from llm_cache import CachedLlama, CompletionCache
+from llm_router import ModelRouter
+
+
+class Model:
+    # Answers with a new sample every call, like a model at a non-zero temperature
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, prompt, timeout=None, **kwargs):
+        self.calls += 1
+        return {'choices': [{'text': f'{prompt} #{self.calls}', 'finish_reason': 'stop'}]}
+
+    def create_batch(self, prompts, timeout=None, **kwargs):
+        return [self(prompt) for prompt in prompts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = CompletionCache(str(tmp_path / 'cache.sqlite'))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / 'model.gguf'
+    path.write_bytes(b'weights')
+    return str(path)
+
+
+def test_get_put_and_keys(cache):
+    key = cache.make_key('digest', 'prompt', {'max_tokens': 8})
+    assert key == cache.make_key('digest', 'prompt', {'max_tokens': 8})
+    assert key != cache.make_key('digest', 'prompt', {'max_tokens': 9})
+    assert cache.get(key) is None
+    cache.put(key, {'a': 1})
+    assert cache.get(key) == {'a': 1}
+    cache.delete(key)
+    assert cache.get(key) is None
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    values = [{'text': os.urandom(200).hex()} for _ in range(4)]
+    size = len(zlib.compress(json.dumps(values[0]).encode('utf-8')))
+    cache = CompletionCache(str(tmp_path / 'small.sqlite'), max_bytes=int(size * 3.5))
+    for i, value in enumerate(values):
+        cache.put(f'k{i}', value)
+        # k0 stays the most recently used
+        cache.get('k0')
+    # The fourth entry went over the budget; trimming to 90% of it drops the least recently used one
+    assert cache.get('k1') is None
+    assert all(cache.get(key) is not None for key in ('k0', 'k2', 'k3'))
+    cache.close()
+
+
+def test_model_digest_is_memoised(cache, model_path):
+    digest = cache.model_digest(model_path)
+    assert cache.model_digest(model_path) == digest
+
+
+def test_model_is_hashed_on_first_call(cache, tmp_path):
+    path = tmp_path / 'later.gguf'
+    # Not read until a prompt goes to it
+    llm = CachedLlama(Model(), str(path), cache)
+    path.write_bytes(b'weights')
+    llm('p')
+    assert llm.model_digest == cache.model_digest(str(path))
+
+
+def test_hits_are_copies(cache, model_path):
+    llm = CachedLlama(Model(), model_path, cache)
+    first = llm('p')
+    hit = llm('p')
+    assert hit['cached'] and 'cached' not in first
+    hit['choices'] = []
+    assert llm('p')['choices'] == first['choices']
+    assert (llm.hits, llm.misses) == (2, 1)
+
+
+def test_rejected_completion_is_sampled_again(cache, model_path):
+    model = Model()
+    llm = CachedLlama(model, model_path, cache)
+    first = llm('p', max_tokens=8)
+    llm.reject('p', timeout=3, max_tokens=8)
+    assert llm('p', max_tokens=8)['choices'] != first['choices']
+    assert model.calls == 2
+
+
+def test_router_rejects_what_accept_turns_down(cache, model_path):
+    model = Model()
+    router = ModelRouter([('only', CachedLlama(model, model_path, cache))])
+    router('p', accept=lambda output: False)
+    router('p', accept=lambda output: False)
+    assert model.calls == 2
+    router('p', accept=lambda output: True)
+    router('p', accept=lambda output: True)
+    assert model.calls == 3
+    router.create_batch(['q', 'q2'], accept=lambda output: output['choices'][0]['text'].startswith('q2'))
+    router.create_batch(['q', 'q2'])
+    assert model.calls == 6
@@ -0,0 +1,27 @@
+import pytest
+
+from llm_grammar import parse_ex, parse_ipd
+
+
+def completion(text):
+    return {'choices': [{'text': text}]}
+
+
+@pytest.mark.parametrize('text, values', [
+    ('["a", "b"]</s>', ['a', 'b']),
+    ("Examples: ['x', 1]", ['x', 1]),
+    ('[["nested", 2]]', ['nested', 2]),
+    ('["cut", "off", "he', ['cut', 'off']),
+])
+def test_parse_ex(text, values):
+    assert parse_ex(completion(text)) == values
+
+
+@pytest.mark.parametrize('text', ['', 'none', '[]', '{"a": 1}'])
+def test_parse_ex_rejects(text):
+    assert parse_ex(completion(text)) is None
+
+
+def test_parse_ipd():
+    assert parse_ipd(completion(' Or(a, b)</s>')) == 'Or(a, b)'
+    assert parse_ipd(completion('  </s>')) is None
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from llm_models import ModelManager
+
+
+@pytest.fixture
+def paths(tmp_path):
+    def make(name, size):
+        path = tmp_path / name
+        path.write_bytes(b'\0' * size)
+        return str(path)
+    return make
+
+
+def test_cold_load_does_not_block_loaded_models(paths):
+    manager = ModelManager()
+    small, large = paths('small.gguf', 10), paths('large.gguf', 10)
+    with manager.use(small, object):
+        pass
+    started = threading.Event()
+
+    def slow_loader():
+        started.set()
+        time.sleep(0.5)
+        return object()
+
+    threading.Thread(target=lambda: manager.use(large, slow_loader).__enter__(), daemon=True).start()
+    started.wait()
+    began = time.time()
+    with manager.use(small, object):
+        pass
+    assert time.time() - began < 0.2
+
+
+def test_concurrent_callers_share_one_load(paths):
+    manager = ModelManager()
+    path = paths('model.gguf', 10)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.1)
+        return object()
+
+    models = []
+
+    def call():
+        with manager.use(path, loader) as model:
+            models.append(model)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1 and len(set(map(id, models))) == 1
+    assert manager.in_use[path] == 0
+
+
+def test_budget_unloads_least_recently_used(paths):
+    manager = ModelManager(budget=25)
+    a, b, c = paths('a.gguf', 10), paths('b.gguf', 10), paths('c.gguf', 10)
+    for path in (a, b, a, c):
+        with manager.use(path, object):
+            pass
+    assert list(manager.loaded) == [a, c]
+    assert manager.unloads == 1
+
+
+def test_failed_load_can_be_retried(paths):
+    manager = ModelManager()
+    path = paths('model.gguf', 10)
+
+    def broken():
+        raise RuntimeError('no model')
+
+    with pytest.raises(RuntimeError):
+        with manager.use(path, broken):
+            pass
+    with manager.use(path, object) as model:
+        assert model is not None
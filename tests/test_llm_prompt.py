@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from llm_prompt import response_excerpt
+
+
+CASES = [
+    # HTML: scripts, styles and tags go, entities are decoded
+    ('<html><head><title>x</title></head><script>var limit;</script>'
+     '<p>limit must be &lt; 100.</p><p>Try again.</p></html>',
+     ['limit'], 128, 'limit must be < 100.'),
+    # JSON: nested fields are flattened to dotted paths
+    (json.dumps({'error': {'message': 'limit is too large', 'code': 400}}),
+     ['limit'], 128, 'error.message: limit is too large'),
+    # JSON: one validation error's fields stay together
+    (json.dumps({'errors': [{'field': 'limit', 'reason': 'max 100'}, {'field': 'page', 'reason': 'min 1'}]}),
+     ['limit'], 128, 'errors: field=limit, reason=max 100'),
+    # Relevance: only units naming a parameter are kept, in order
+    ('Bad request. The offset is negative. Check limit and offset.',
+     ['offset'], 128, 'The offset is negative. Check limit and offset.'),
+    # Nothing names a parameter: the whole response is the excerpt
+    ('Bad request.\nSomething failed.', ['limit'], 128, 'Bad request. Something failed.'),
+    # Budget: 4 characters per token; a unit that does not fit is skipped
+    ('limit is bad. ' + 'limit ' * 10 + 'again.', ['limit'], 4, 'limit is bad.'),
+    # Budget: a first unit over the budget is cut in the middle
+    (json.dumps({'message': 'limit must be between 1 and 100'}), ['limit'], 3, 'message: lim'),
+    ('', ['limit'], 128, ''),
+    (None, ['limit'], 128, ''),
+]
+
+
+@pytest.mark.parametrize('text, names, tokens, excerpt', CASES)
+def test_response_excerpt(text, names, tokens, excerpt):
+    assert response_excerpt(text, names, max_tokens=tokens) == excerpt
+
+
+def test_excerpt_keeps_to_the_budget():
+    text = json.dumps({f'field{i}': f'limit {i} ' * 5 for i in range(20)})
+    for tokens in (1, 8, 32):
+        assert len(response_excerpt(text, ['limit'], max_tokens=tokens)) <= tokens * 4
+
+
+def test_pack_prompts_match_the_tools():
+    # llm_pack answers a prompt only if it is byte-identical to the one a tool sends
+    from llm_pack import spec_prompts
+    spec = {'paths': {'/items': {'get': {'parameters': [
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 10, 'description': 'Page size, with offset'},
+        {'name': 'offset', 'in': 'query', 'type': 'integer', 'description': 'First item'},
+    ]}}}}
+    ex, ipd = spec_prompts(spec)
+    head = "<s>[INST] Find example values for the parameter below in a list format\n"
+    assert ex == [head + "name: limit\ndescription: Page size, with offset\ntype: integer [/INST]",
+                  head + "name: limit\ndescription: Page size, with offset\ndefault value: 10 [/INST]",
+                  head + "name: offset\ndescription: First item\ntype: integer [/INST]",
+                  head + "name: offset\ndescription: First item [/INST]"]
+    assert ipd == ["<s>[INST] Find Inter-parameter Dependency for the parameter below\n"
+                   "name:limit\ndescription:Page size, with offset [/INST]"]
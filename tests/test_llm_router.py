@@ -0,0 +1,88 @@
+import pytest
+
+from llm_router import ModelRouter
+
+
+class Model:
+    # One tier: answers every prompt with its name and the prompt, or raises when failing
+    def __init__(self, name, failing=False):
+        self.name = name
+        self.failing = failing
+        self.prompts = []
+        self.rejected = []
+
+    def __call__(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.failing:
+            raise RuntimeError(self.name)
+        return {'choices': [{'text': f'{self.name} {prompt}', 'finish_reason': 'stop'}]}
+
+    def create_batch(self, prompts, **kwargs):
+        return [self(prompt) for prompt in prompts]
+
+    def reject(self, prompt, **kwargs):
+        self.rejected.append(prompt)
+
+
+def text(output):
+    return output['choices'][0]['text']
+
+
+@pytest.fixture
+def tiers():
+    return [Model('small'), Model('large')]
+
+
+def test_smallest_tier_answers_first(tiers):
+    router = ModelRouter([(model.name, model) for model in tiers])
+    output = router('p', key='name')
+    assert text(output) == 'small p' and output['tier'] == 'small'
+    assert tiers[1].prompts == []
+    assert router.summary() == {'answered': {'small': 1}, 'escalations': 0}
+
+
+def test_rejected_output_goes_to_the_next_tier(tiers):
+    router = ModelRouter([(model.name, model) for model in tiers])
+    output = router('p', key='name', accept=lambda output: text(output) == 'large p')
+    assert output['tier'] == 'large'
+    assert tiers[0].rejected == ['p'] and tiers[1].rejected == []
+    assert router.escalations == 1
+
+
+def test_failing_tier_falls_back(tiers):
+    tiers[0].failing = True
+    router = ModelRouter([(model.name, model) for model in tiers])
+    assert router('p')['tier'] == 'large'
+    tiers[1].failing = True
+    with pytest.raises(RuntimeError):
+        router('p')
+
+
+def test_escalate_moves_the_key_for_good(tiers):
+    router = ModelRouter([(model.name, model) for model in tiers])
+    assert router.can_escalate('name')
+    # llama.py escalates a key once its values failed LLAMA_ESCALATE_AFTER times without a 2xx
+    assert router.escalate('name')
+    assert not router.can_escalate('name') and not router.escalate('name')
+    assert router('p', key='name')['tier'] == 'large'
+    assert router('p', key='other')['tier'] == 'small'
+    assert tiers[0].prompts == ['p']
+
+
+def test_pack_answers_before_the_model(tiers):
+    router = ModelRouter([(model.name, model) for model in tiers])
+    router.pack = {'p': {'choices': [{'text': 'packed', 'finish_reason': 'stop'}]}}
+    assert text(router('p', key='name')) == 'packed'
+    assert router.create_batch(['p', 'q'], keys=['name', 'other'])[0]['choices'][0]['text'] == 'packed'
+    assert tiers[0].prompts == ['q']
+    # An escalated key skips the pack
+    router.escalate('name')
+    assert router('p', key='name')['tier'] == 'large'
+    assert router.summary()['answered'] == {'pack': 2, 'small': 1, 'large': 1}
+
+
+def test_batch_escalates_only_rejected_prompts(tiers):
+    router = ModelRouter([(model.name, model) for model in tiers])
+    outputs = router.create_batch(['a', 'b'], keys=['x', 'y'], accept=lambda output: text(output) != 'small a')
+    assert [output['tier'] for output in outputs] == ['large', 'small']
+    assert tiers[0].rejected == ['a'] and tiers[1].prompts == ['a']
@@ -0,0 +1,28 @@
+import pytest
+
+from llm_scheduler import EX, IPD, PREPASS, Scheduler
+
+
+def test_reserve_drops_low_priority_work_first():
+    scheduler = Scheduler(timeout=10, budget=35)
+    assert scheduler.admit(PREPASS) and scheduler.admit(EX)
+    assert not scheduler.admit(IPD, 'param')
+    assert scheduler.summary()['dropped'] == {'IPD': 1}
+
+
+def test_start_keeps_the_earlier_deadline():
+    scheduler = Scheduler(budget=100)
+    scheduler.start(3600)
+    assert scheduler.remaining() == pytest.approx(100, abs=1)
+    scheduler = Scheduler()
+    assert scheduler.remaining() == float('inf')
+    scheduler.start(50)
+    assert scheduler.remaining() == pytest.approx(50, abs=1)
+
+
+def test_limits():
+    scheduler = Scheduler(timeout=30, max_tokens=64, budget=10)
+    limits = scheduler.limits({'max_tokens': 512, 'stop': ['</s>']})
+    assert limits['max_tokens'] == 64 and limits['stop'] == ['</s>']
+    assert 9 < limits['timeout'] <= 10
+    assert Scheduler(timeout=5).limits({})['timeout'] == 5
@@ -0,0 +1,90 @@
+import socket
+import threading
+
+import pytest
+
+from llm_server import RemoteLlama, _TCPServer, _Handler
+
+
+class Model:
+    # Echoes the prompt back; an empty prompt fails like a model error
+    def __init__(self):
+        self.rejected = []
+
+    def __call__(self, prompt, max_tokens=16, **kwargs):
+        if not prompt:
+            raise ValueError('empty prompt')
+        return {'choices': [{'text': prompt[::-1][:max_tokens], 'finish_reason': 'stop'}]}
+
+    def create_batch(self, prompts, **kwargs):
+        return [self(prompt, **kwargs) for prompt in prompts]
+
+    def reject(self, prompt, **kwargs):
+        self.rejected.append(prompt)
+
+
+def start(model, port=0):
+    server = _TCPServer(('127.0.0.1', port), _Handler)
+    server.models = {'ex': (model, threading.Lock())}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def model():
+    return Model()
+
+
+@pytest.fixture
+def address(model):
+    server = start(model)
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def text(output):
+    return output['choices'][0]['text']
+
+
+def test_round_trip(model, address):
+    remote = RemoteLlama(address, 'ex', timeout=5)
+    assert text(remote('abc', max_tokens=2)) == 'cb'
+    assert [text(output) for output in remote.create_batch(['ab', 'cd'])] == ['ba', 'dc']
+    remote.reject('abc', max_tokens=2)
+    assert model.rejected == ['abc']
+    # One connection carries every request
+    assert remote._sock is not None
+
+
+def test_errors_come_back_as_runtime_errors(address):
+    remote = RemoteLlama(address, 'ex', timeout=5)
+    with pytest.raises(RuntimeError, match='empty prompt'):
+        remote('')
+    with pytest.raises(RuntimeError, match='KeyError'):
+        RemoteLlama(address, 'ipd', timeout=5)('abc')
+    # The connection stays usable after an error reply
+    assert text(remote('abc')) == 'cba'
+
+
+def test_reconnects_once(address):
+    remote = RemoteLlama(address, 'ex', timeout=5)
+    remote('abc')
+    stale = remote._sock
+    # The daemon restarted: the kept connection is dead, a new one works
+    stale.shutdown(socket.SHUT_RDWR)
+    assert text(remote('abc')) == 'cba'
+    assert remote._sock is not stale
+
+
+def test_gives_up_when_the_daemon_is_gone(model):
+    server = start(model)
+    address = f"127.0.0.1:{server.server_address[1]}"
+    remote = RemoteLlama(address, 'ex', timeout=5)
+    remote('abc')
+    server.shutdown()
+    server.server_close()
+    remote._sock.shutdown(socket.SHUT_RDWR)
+    with pytest.raises(OSError):
+        remote('abc')
+    assert remote._sock is None
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import llm_telemetry
+from llm_telemetry import Telemetry, read_calls
+
+
+def completion(prompt_tokens=10, completion_tokens=5, **extra):
+    return {'choices': [{'text': 'x', 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens}, **extra}
+
+
+@pytest.fixture
+def run(tmp_path):
+    # One run of one tool, laid out like results/<api>/<tool>/<run>
+    path = tmp_path / 'petstore' / 'llama' / '1' / llm_telemetry.TELEMETRY_FILE
+    return Telemetry(path=str(path), api='petstore')
+
+
+def records(telemetry):
+    with open(telemetry.path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_record_writes_a_call(run):
+    call_id = run.record('ex', 'ex-2b', completion(cached=True), wall=0.5, parsed=True)
+    [record] = records(run)
+    assert record['id'] == call_id and record['event'] == 'call'
+    assert (record['api'], record['kind'], record['model']) == ('petstore', 'ex', 'ex-2b')
+    assert (record['prompt_tokens'], record['completion_tokens']) == (10, 5)
+    assert record['cached'] and record['finish_reason'] == 'stop'
+
+
+def test_credit_counts_tracked_values(run):
+    first = run.record('ex', 'ex-2b', completion())
+    second = run.record('ex', 'ex-2b', completion())
+    run.track(first, 'limit', [10, 20])
+    run.track(second, 'limit', [20])
+    run.track(None, 'limit', [30])
+    run.credit({'limit': 10}, True)
+    run.credit({'limit': 20}, False)
+    run.credit({'limit': 30, 'page': 1}, True)
+    run.credit({'limit': [10, 40]}, True)
+    run.flush(force=True)
+    yields = {record['id']: (record['used'], record['ok']) for record in records(run) if record['event'] == 'yield'}
+    assert yields == {first: (3, 2), second: (1, 0)}
+    calls = {call['id']: call for call in read_calls(run.path)}
+    assert (calls[first]['used'], calls[first]['ok']) == (3, 2)
+
+
+def test_flush_waits_for_the_interval(run):
+    call_id = run.record('ipd', 'ipd-8b', completion())
+    run.track(call_id, 'limit', [1])
+    run.credit({'limit': 1}, True)
+    run.flush()
+    assert [record['event'] for record in records(run)] == ['call']
+    run.flush(force=True)
+    # Only calls credited since the last flush are written again
+    run.flush(force=True)
+    assert [record['event'] for record in records(run)] == ['call', 'yield']
+
+
+def test_disabled_telemetry_writes_nothing(tmp_path):
+    telemetry = Telemetry(path=str(tmp_path / llm_telemetry.TELEMETRY_FILE), enabled=False)
+    telemetry.record('ex', 'ex-2b', completion())
+    telemetry.flush(force=True)
+    assert not (tmp_path / llm_telemetry.TELEMETRY_FILE).exists()
+
+
+def test_summary_cli(run, tmp_path, capsys):
+    call_id = run.record('ex', 'ex-2b', completion(), wall=1.0, parsed=True)
+    run.record('ex', 'ex-2b', completion(prompt_tokens=20), wall=2.0, parsed=False)
+    run.track(call_id, 'limit', [1])
+    run.credit({'limit': 1}, True)
+    run.flush(force=True)
+    totals = llm_telemetry.summarize(str(tmp_path))
+    row = totals[('petstore', 'ex-2b', 'ex')]
+    assert (row['calls'], row['prompt_tokens'], row['parsed'], row['used'], row['ok']) == (2, 30, 1, 1, 1)
+    assert llm_telemetry.main([str(tmp_path)]) == 0
+    line = capsys.readouterr().out.splitlines()[1].split()
+    assert line[:4] == ['petstore', 'ex-2b', 'ex', '2'] and line[-3:] == ['50%', '1', '1']
+    assert llm_telemetry.main([str(tmp_path / 'empty')]) == 1
@@ -0,0 +1,37 @@
+import time
+
+from llm_worker import FeedbackWorker
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_queued_jobs_run_before_idle_steps():
+    worker = FeedbackWorker()
+    order = []
+
+    def analysis():
+        order.append('job')
+
+    def prepass():
+        for step in range(3):
+            order.append(f'idle{step}')
+            if step == 0:
+                worker.submit(analysis)
+            yield None
+
+    worker.run_when_idle(prepass())
+    assert wait_for(lambda: len(order) == 4)
+    assert order == ['idle0', 'job', 'idle1', 'idle2']
+
+
+def test_results_are_applied_by_the_caller():
+    worker = FeedbackWorker()
+    merged = []
+    worker.submit(lambda: lambda: merged.append(1))
+    assert wait_for(lambda: worker.apply_results() or merged)
+    assert merged == [1]
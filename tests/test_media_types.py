@@ -0,0 +1,37 @@
+from conftest import Response
+from media_types import MediaTypeModel
+
+JSON, FORM = 'application/json', 'application/x-www-form-urlencoded'
+
+
+def test_success_is_learned():
+    model = MediaTypeModel()
+    assert model.candidates('op', [JSON, FORM]) == [JSON, FORM]
+    model.observe('op', JSON, Response(400))
+    model.observe('op', FORM, Response(201))
+    assert 'op' in model and model['op'] == FORM
+    assert model.candidates('op', [JSON, FORM]) == [FORM]
+
+
+def test_unsupported_types_are_skipped():
+    model = MediaTypeModel(negative_ttl=60)
+    model.observe('op', JSON, Response(415))
+    assert model.candidates('op', [JSON, FORM]) == [FORM]
+    model.observe('op', FORM, None)
+    # Everything is in the negative cache; the best-ranked type is still tried
+    assert len(model.candidates('op', [JSON, FORM])) == 1
+
+
+def test_sweeps_are_limited():
+    model = MediaTypeModel(sweeps=1)
+    assert len(model.candidates('op', [JSON, FORM])) == 2
+    model.observe('op', JSON, Response(400))
+    model.observe('op', FORM, Response(500))
+    assert len(model.candidates('op', [JSON, FORM])) == 1
+    assert model.summary()['requests_per_test'] == 1.0
+
+
+def test_dict_interface():
+    model = MediaTypeModel()
+    model['op'] = JSON
+    assert model.candidates('op', JSON) == [JSON]
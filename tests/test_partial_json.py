@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import Response
+from partial_json import loads_prefix, response_json
+
+
+@pytest.mark.parametrize('text, value', [
+    ('{"items": [{"id": 1}, {"id": 2}, {"id": 3, "na', {'items': [{'id': 1}, {'id': 2}, {'id': 3}]}),
+    ('[1, 2, 3', [1, 2]),
+    ('[{"a": "x}", "b": [1, 2]}, {"c', [{'a': 'x}', 'b': [1, 2]}]),
+    ('{"s": "quote \\" and , inside", "t": 1', {'s': 'quote " and , inside'}),
+    ('{"a": 1} trailing', {'a': 1}),
+    ('{"a": {"b": [1, 2', {'a': {'b': [1]}}),
+])
+def test_loads_prefix(text, value):
+    assert loads_prefix(text) == value
+
+
+@pytest.mark.parametrize('text', ['', '{"a"', '[', '"unterminated', '{"a": "b'])
+def test_loads_prefix_without_complete_value(text):
+    assert loads_prefix(text) is None
+
+
+def test_response_json():
+    assert response_json(Response(text='{"a": [1, 2]}')) == {'a': [1, 2]}
+    assert response_json(Response(text='{"a": [1, 2', truncated=True)) == {'a': [1]}
+    with pytest.raises(ValueError):
+        response_json(Response(text='{"a', truncated=True))
@@ -0,0 +1,42 @@
+import time
+
+from conftest import Response
+from producer_cache import ProducerCache
+
+
+def test_entries_are_used_up():
+    cache = ProducerCache(ttl=60, uses=2)
+    assert not cache.take('createPet', ['petId'])
+    cache.store('createPet', ['petId'])
+    assert cache.take('createPet', ['petId'])
+    assert cache.take('createPet', ['petId'])
+    assert not cache.take('createPet', ['petId'])
+    assert cache.summary() == {'runs': 1, 'reused': 2}
+
+
+def test_entries_expire():
+    cache = ProducerCache(ttl=0.05, uses=10)
+    cache.store('createPet', ['petId'])
+    time.sleep(0.06)
+    assert not cache.take('createPet', ['petId'])
+
+
+def test_every_name_must_be_fresh():
+    cache = ProducerCache()
+    cache.store('createPet', ['petId'])
+    assert not cache.take('createPet', ['petId', 'ownerId'])
+    assert cache.entries[('createPet', 'petId')][1] == 5
+
+
+def test_successful_delete_or_put_invalidates():
+    cache = ProducerCache()
+    cache.store('createPet', ['petId', 'ownerId'])
+    cache.store('createOrder', ['petId'])
+    cache.observe('get', ['petId'], Response(200))
+    cache.observe('delete', ['petId'], Response(404))
+    cache.observe('put', ['petId'], None)
+    assert cache.take('createOrder', ['petId'])
+    cache.observe('delete', ['petId'], Response(204))
+    assert not cache.take('createOrder', ['petId'])
+    assert not cache.take('createPet', ['petId'])
+    assert cache.take('createPet', ['ownerId'])
@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from conftest import Response
+from rate_governor import MIN_RATE, RateGovernor, retry_after
+
+
+def test_retry_after():
+    assert retry_after(Response(429, {'Retry-After': '3'})) == 3.0
+    assert retry_after(Response(429)) is None
+    assert retry_after(Response(429, {'Retry-After': 'soon'})) is None
+
+
+def test_bucket_refills_at_rate():
+    governor = RateGovernor(rate=100, burst=2)
+    governor.tokens, governor.updated = 0.0, time.monotonic()
+    governor._refill(governor.updated + 0.015)
+    assert governor.tokens == pytest.approx(1.5)
+    governor._refill(governor.updated + 1)
+    assert governor.tokens == 2
+
+
+def test_429_halves_and_successes_recover_to_ceiling():
+    governor = RateGovernor(rate=4, burst=1, increase=1)
+    assert governor.observe(Response(429, {'Retry-After': '0'})) == pytest.approx(1 / 2)
+    assert governor.rate == 2
+    for _ in range(5):
+        assert governor.observe(Response(200)) is None
+    assert governor.rate == 4
+
+
+def test_recovery_without_ceiling_stops_at_throttled_rate():
+    governor = RateGovernor(burst=1, increase=1)
+    for _ in range(6):
+        governor.acquire()
+    governor.observe(Response(429, {'Retry-After': '0'}))
+    throttled_at = max(MIN_RATE, 6 / RateGovernor.WINDOW)
+    assert governor.rate == pytest.approx(max(MIN_RATE, throttled_at / 2))
+    for _ in range(100):
+        governor.observe(Response(200))
+    assert governor.rate == pytest.approx(throttled_at)
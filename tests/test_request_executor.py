@@ -0,0 +1,30 @@
+import threading
+import time
+
+from request_executor import RequestExecutor
+
+
+def overlapping(executor, methods):
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def call(i):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return i
+
+    assert executor.gather([(call, (i,)) for i in range(3)], methods=methods) == [0, 1, 2]
+    return peak[0]
+
+
+def test_safe_methods_run_concurrently():
+    assert overlapping(RequestExecutor(4), ('get', 'head')) > 1
+    assert overlapping(RequestExecutor(4), None) > 1
+
+
+def test_unsafe_methods_run_in_turn():
+    assert overlapping(RequestExecutor(4), ('get', 'delete')) == 1
+    assert overlapping(RequestExecutor(1), ('get',)) == 1
@@ -0,0 +1,57 @@
+import hashlib
+
+from request_filter import BloomFilter, DuplicateFilter
+
+
+def fp(value):
+    return hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+
+
+def test_bloom_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(10000, 0.01)
+    for i in range(10000):
+        bloom.add(fp(i))
+    assert all(fp(i) in bloom for i in range(10000))
+    false_positives = sum(fp(-i) in bloom for i in range(1, 10001))
+    assert false_positives < 200
+
+
+def test_generations_roll_over():
+    duplicates = DuplicateFilter(capacity=100, error_rate=0.001)
+    for i in range(250):
+        duplicates.seen(fp(i))
+    # Two generations are kept, so memory stays bounded; the most recent fingerprints are remembered
+    assert duplicates.previous.count == 100 and duplicates.current.count <= 50
+    assert duplicates.seen(fp(249)) and duplicates.seen(fp(180))
+    assert duplicates.summary()['bytes'] == 2 * len(duplicates.current.bits)
+
+
+def test_fresh_resamples_duplicates():
+    duplicates = DuplicateFilter(resamples=3)
+    samples = iter(range(1, 100))
+    assert duplicates.fresh(0, fp, lambda request: next(samples)) == 0
+    assert duplicates.fresh(0, fp, lambda request: next(samples)) == 1
+    assert duplicates.summary()['suppressed'] == 1
+    assert duplicates.summary()['sent_anyway'] == 0
+
+
+def test_fresh_counts_once_when_every_resample_repeats():
+    duplicates = DuplicateFilter(resamples=3)
+    duplicates.fresh('a', fp, lambda request: 'a')
+    assert duplicates.fresh('a', fp, lambda request: 'a') == 'a'
+    assert duplicates.summary()['suppressed'] == 1
+    assert duplicates.summary()['sent_anyway'] == 1
+
+
+def test_fresh_skips_requests_that_cannot_vary():
+    duplicates = DuplicateFilter()
+    for _ in range(3):
+        assert duplicates.fresh('ping', fp, lambda request: 1 / 0, varies=lambda request: False) == 'ping'
+    assert duplicates.summary()['suppressed'] == 0
+    assert duplicates.current.count == 0
+
+
+def test_disabled():
+    duplicates = DuplicateFilter(enabled=False)
+    assert duplicates.fresh('a', fp, lambda request: 'b') == 'a'
+    assert duplicates.fresh('a', fp, lambda request: 'b') == 'a'
@@ -0,0 +1,75 @@
+import glob
+import os
+
+import pytest
+
+from request_template import RequestTemplate, add_query, compile_templates
+
+SPECS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'specs')
+
+
+def parsed_operation():
+    # Shaped like main.parse_oas output: parameters by name, body entries without a 'name'
+    return {'method': 'post', 'path': '/users/{id}/pets', 'parameters': {
+        'id': {'name': 'id', 'in': 'path', 'schema': {'type': 'integer'}},
+        'limit': {'name': 'limit', 'in': 'query', 'type': 'integer'},
+        'body': {'in': 'body', 'required': True, 'schema': {'type': 'object'}},
+        'tags': {'in': 'body', 'type': 'array'},
+    }}
+
+
+def test_parsed_parameters_are_keyed_by_name():
+    template = compile_templates({'createPet': parsed_operation()})['createPet']
+    assert set(template.params) == {'id', 'limit', 'body', 'tags'}
+    assert template.buckets == {'path': ['id'], 'query': ['limit'], 'body': ['body', 'tags']}
+    assert template.types['id'] == 'integer'
+
+
+def test_listed_parameters_first_declaration_wins():
+    template = RequestTemplate({'operation_id': 'op', 'path': '/x', 'parameters': [
+        {'name': 'q', 'in': 'query', 'type': 'string'}, {'name': 'q', 'in': 'path', 'type': 'string'}]})
+    assert template.location == {'q': 'query'}
+
+
+def test_fill_and_url():
+    template = compile_templates({'createPet': parsed_operation()})['createPet']
+    path_values, query, body = template.fill([{'id': 'a b'}, {'limit': 3}, {'tags': 'x'}, {'unknown': 1}])
+    assert body == {'tags': ['x']}
+    assert template.url('http://h', path_values, query) == 'http://h/users/a%20b/pets?limit=3'
+    assert add_query('http://h/p?a=1', 'b', 'c d') == 'http://h/p?a=1&b=c+d'
+
+
+def test_fingerprint_ignores_parameter_order():
+    template = compile_templates({'createPet': parsed_operation()})['createPet']
+    assert template.fingerprint('post', [{'id': 1}, {'limit': 2}]) == template.fingerprint('post', [{'limit': 2},
+                                                                                                  {'id': 1}])
+    assert template.fingerprint('post', [{'id': 1}]) != template.fingerprint('put', [{'id': 1}])
+
+
+def spec_files():
+    return sorted(path for pattern in ('*.yaml', '*.json')
+                  for path in glob.glob(os.path.join(SPECS, '**', pattern), recursive=True))
+
+
+@pytest.mark.parametrize('spec', spec_files(), ids=lambda path: os.path.relpath(path, SPECS))
+def test_compile_spec(spec):
+    # OpenAPI 3 specs go through main.parse_oas, Swagger 2 ones through llama.analyze_information
+    prance = pytest.importorskip('prance')
+    specification = prance.ResolvingParser(spec).specification
+    if 'openapi' in specification:
+        pytest.importorskip('openai')
+        import main
+        main.operations, main.op_id_list = {}, []
+        main.parse_oas(specification)
+        operations = main.operations
+        templates = compile_templates(operations)
+        for op_id, operation in operations.items():
+            assert set(templates[op_id].params) == set(operation['parameters'])
+    else:
+        pytest.importorskip('rstr')
+        import llama
+        operations, _ = llama.analyze_information(specification)
+        templates = compile_templates(operations)
+        for operation in operations:
+            assert set(templates[operation['operation_id']].params) == {p['name'] for p in operation['parameters']}
+    assert templates